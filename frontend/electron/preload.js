@@ -1,5 +1,5 @@
 // Preload скрипт для безопасной связи между Electron и веб-контентом
-const { contextBridge, ipcRenderer } = require('electron');
+const { contextBridge, ipcRenderer, webUtils } = require('electron');
 
 // Экспортируем безопасные API для использования в React
 contextBridge.exposeInMainWorld('electronAPI', {
@@ -13,5 +13,14 @@ contextBridge.exposeInMainWorld('electronAPI', {
   clipboard: {
     readText: () => ipcRenderer.invoke('clipboard-read-text'),
     writeText: (text) => ipcRenderer.invoke('clipboard-write-text', text)
+  },
+  // Путь к выбранному файлу на диске: бэкенд берет файл по пути, без загрузки через HTTP.
+  // webUtils есть с Electron 29, в более старых версиях путь лежит в File.path
+  getPathForFile: (file) => {
+    try {
+      return (webUtils && webUtils.getPathForFile(file)) || file.path || null;
+    } catch (error) {
+      return file.path || null;
+    }
   }
 });
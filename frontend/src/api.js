@@ -45,16 +45,38 @@ export const healthCheck = async (retries = 3, delay = 1000) => {
   throw new Error('Health check failed after all retries');
 };
 
-export const getLogs = async () => {
+// Новые строки лога после номера since: { logs, last_seq, truncated }
+export const getLogs = async (since = 0) => {
   try {
-    const response = await api.get('/logs');
-    return response.data.logs;
+    const response = await api.get('/logs', { params: { since } });
+    return response.data;
   } catch (error) {
     console.error('Failed to get logs:', error);
     throw error;
   }
 };
 
+// Поток логов через Server-Sent Events. onLogs получает { lines, last_seq, truncated }.
+// EventSource сам переподключается и продолжает с последнего id (Last-Event-ID).
+// Возвращает функцию отписки или null, если браузер не поддерживает EventSource.
+export const subscribeLogs = (since, onLogs, onError) => {
+  if (typeof window === 'undefined' || !window.EventSource) {
+    return null;
+  }
+  const source = new EventSource(`${API_BASE_URL}/logs/stream?since=${since}`);
+  source.onmessage = (event) => {
+    try {
+      onLogs(JSON.parse(event.data));
+    } catch (error) {
+      console.error('Failed to parse log event:', error);
+    }
+  };
+  if (onError) {
+    source.onerror = onError;
+  }
+  return () => source.close();
+};
+
 export const clearLogs = async () => {
   try {
     const response = await api.post('/logs/clear');
@@ -102,18 +124,102 @@ export const processYouTube = async (url, quality, options) => {
   }
 };
 
+// Файлы больше этого размера загружаются частями с возобновлением
+const CHUNKED_UPLOAD_THRESHOLD = 64 * 1024 * 1024;
+const UPLOAD_RETRIES = 5;
+
+// Путь к файлу на диске (только в Electron)
+const getLocalPath = (file) => {
+  try {
+    return window.electronAPI?.getPathForFile?.(file) || null;
+  } catch (error) {
+    return null;
+  }
+};
+
+// Загрузка частями: после обрыва продолжаем с того смещения, которое подтвердил сервер.
+// Возвращает путь к файлу в папке проекта.
+export const uploadFileChunked = async (file, onProgress) => {
+  const created = await api.post('/uploads', { filename: file.name, size: file.size });
+  if (created.status >= 400) {
+    throw new Error(created.data?.error || `HTTP ${created.status}`);
+  }
+  const { upload_id: uploadId, chunk_size: chunkSize } = created.data;
+  let offset = created.data.offset;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+    try {
+      const response = await api.put(`/uploads/${uploadId}`, chunk, {
+        params: { offset },
+        headers: { 'Content-Type': 'application/octet-stream' },
+        timeout: 300000,
+      });
+      if (response.status === 409 && typeof response.data?.offset === 'number') {
+        // Сервер получил другой объем - продолжаем с его смещения
+        offset = response.data.offset;
+        continue;
+      }
+      if (response.status >= 400) {
+        throw new Error(response.data?.error || `HTTP ${response.status}`);
+      }
+      offset = response.data.offset;
+      failures = 0;
+      if (onProgress) onProgress(offset / file.size);
+    } catch (error) {
+      failures++;
+      if (failures > UPLOAD_RETRIES) throw error;
+      await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+      // Узнаем, сколько сервер успел сохранить, и продолжаем с этого места
+      const status = await api.get(`/uploads/${uploadId}`).catch(() => null);
+      if (status && status.status < 400) offset = status.data.offset;
+    }
+  }
+
+  const completed = await api.post(`/uploads/${uploadId}/complete`, {});
+  if (completed.status >= 400) {
+    throw new Error(completed.data?.error || `HTTP ${completed.status}`);
+  }
+  return completed.data.path;
+};
+
+const processFileByPath = (path, options) =>
+  api.post('/process/file', { path, options });
+
+const processFileUpload = (file, options) => {
+  const formData = new FormData();
+  formData.append('file', file);
+  formData.append('options', JSON.stringify(options));
+
+  return api.post('/process/file', formData, {
+    headers: {
+      'Content-Type': 'multipart/form-data',
+    },
+    timeout: 300000, // 5 минут для загрузки больших файлов
+  });
+};
+
 export const processFile = async (file, options) => {
   try {
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('options', JSON.stringify(options));
-    
-    const response = await api.post('/process/file', formData, {
-      headers: {
-        'Content-Type': 'multipart/form-data',
-      },
-      timeout: 300000, // 5 минут для загрузки больших файлов
-    });
+    // В Electron передаем путь: файл не копируется через HTTP.
+    // Если путь вне разрешенных папок - загружаем файл как обычно
+    let response = null;
+    const localPath = getLocalPath(file);
+    if (localPath) {
+      response = await processFileByPath(localPath, options);
+      if (response.status === 403 || response.status === 404) {
+        response = null;
+      }
+    }
+    if (!response) {
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        const uploadedPath = await uploadFileChunked(file);
+        response = await processFileByPath(uploadedPath, options);
+      } else {
+        response = await processFileUpload(file, options);
+      }
+    }
     
     // Проверяем статус ответа
     if (response.status >= 400) {
@@ -1,6 +1,9 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import './Terminal.css';
-import { getLogs, clearLogs } from '../api';
+import { getLogs, clearLogs, subscribeLogs } from '../api';
+
+// Сколько строк держать в терминале
+const MAX_LINES = 1000;
 
 const Terminal = () => {
   const [logs, setLogs] = useState([
@@ -15,6 +18,9 @@ const Terminal = () => {
   const resizeStartY = useRef(0);
   const resizeStartHeight = useRef(200);
   const isResizingRef = useRef(false);
+  // Номер последней полученной строки лога и флаг стартовых строк-заглушек
+  const cursorRef = useRef(0);
+  const placeholderRef = useRef(true);
 
   // Проверяем, находится ли пользователь внизу консоли
   const checkIfAtBottom = useCallback(() => {
@@ -46,33 +52,38 @@ const Terminal = () => {
     }
   }, [checkIfAtBottom]);
 
+  // Добавляет новые строки лога; при перезапуске сервера (номер строк сбросился) заменяет весь лог
+  const appendLogs = useCallback((data) => {
+    if (!data || !Array.isArray(data.lines ?? data.logs)) return;
+    const lines = data.lines ?? data.logs;
+    const restarted = data.last_seq < cursorRef.current;
+    cursorRef.current = data.last_seq;
+    if (lines.length === 0 && !restarted) return;
+
+    const wasAtBottom = checkIfAtBottom();
+    setLogs(prev => {
+      const base = (placeholderRef.current || restarted) ? [] : prev;
+      placeholderRef.current = false;
+      const next = [...base, ...lines];
+      return next.length > MAX_LINES ? next.slice(next.length - MAX_LINES) : next;
+    });
+    // Если пользователь был внизу, сбрасываем флаг
+    if (wasAtBottom) {
+      setIsUserScrolled(false);
+    }
+  }, [checkIfAtBottom]);
+
   useEffect(() => {
     let retryCount = 0;
     const maxRetries = 3;
-    
-    // Polling для получения логов
-    const interval = setInterval(async () => {
+    let interval = null;
+
+    // Polling с курсором: сервер отдает только строки после last_seq
+    const poll = async () => {
       try {
-        const response = await getLogs();
+        const response = await getLogs(cursorRef.current);
         retryCount = 0; // Сбрасываем счетчик при успехе
-        
-        if (response && Array.isArray(response) && response.length > 0) {
-          // Проверяем, находимся ли мы внизу перед обновлением
-          const wasAtBottom = checkIfAtBottom();
-          setLogs(response);
-          // Если пользователь был внизу, сбрасываем флаг
-          if (wasAtBottom) {
-            setIsUserScrolled(false);
-          }
-        } else if (response && Array.isArray(response) && response.length === 0) {
-          // Если логов нет, показываем начальное сообщение только если логов действительно нет
-          setLogs(prev => {
-            if (prev.length === 0 || (prev.length === 1 && prev[0] === '> Terminal cleared.')) {
-              return ['> System initialized...', '> Waiting for input...', '> Ready.'];
-            }
-            return prev;
-          });
-        }
+        appendLogs(response);
       } catch (error) {
         // Не логируем ошибку в консоль, если это просто временная проблема подключения
         const isConnectionError = error.code === 'ECONNREFUSED' || 
@@ -94,14 +105,24 @@ const Terminal = () => {
         }
         // Если это ошибка подключения, просто молча игнорируем - API еще не запустился
       }
-    }, 2000); // Обновляем каждые 2 секунды
+    };
 
-    return () => clearInterval(interval);
-  }, [checkIfAtBottom]); // Добавляем checkIfAtBottom в зависимости
+    // Основной режим - поток SSE; без поддержки EventSource опрашиваем каждые 2 секунды
+    const unsubscribe = subscribeLogs(cursorRef.current, appendLogs);
+    if (!unsubscribe) {
+      interval = setInterval(poll, 2000);
+    }
+
+    return () => {
+      if (unsubscribe) unsubscribe();
+      if (interval) clearInterval(interval);
+    };
+  }, [appendLogs]);
 
   const handleClear = async () => {
     try {
       await clearLogs();
+      placeholderRef.current = true;
       setLogs(['> Terminal cleared.']);
       setIsUserScrolled(false); // Сбрасываем флаг после очистки
     } catch (error) {
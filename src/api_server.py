@@ -10,14 +10,16 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from flask import Flask, request, jsonify, send_file
+    from flask import Flask, request, jsonify, send_file, Response, stream_with_context
     from flask_cors import CORS
     import json
+    import copy
+    import uuid
+    import shutil
     import asyncio
     import threading
     import logging
     import signal
-    from concurrent.futures import ThreadPoolExecutor
     import multiprocessing
     from werkzeug.serving import WSGIRequestHandler
 
@@ -25,9 +27,17 @@ try:
     from core.transcriber import Transcriber
     from core.translator import Translator
     from core.corrector import SpeakerCorrector
+    from core.ollama_manager import OllamaManager, get_keep_alive
     from core.voice_cloner import VoiceCloner
     from core.video_maker import VideoMaker
     from core.config import APP_PATHS
+    from core.jobs import JobManager, ResourcePool
+    from core.pipeline import StagePipeline, get_stage_workers
+    from core.log_buffer import LogRingBuffer
+    from core.file_ingest import IngestError, UploadManager, UPLOAD_CHUNK_BYTES, ingest_local_file
+    from core.audio_ingest import ingest_audio, load_audio_array
+    from core.artifact_cache import ArtifactCache
+    from core.dag import DagExecutor, DagStage
 except Exception:
     # В упакованном exe при падении на импорте пишем лог — пользователь не видит консоль
     if getattr(sys, "frozen", False):
@@ -57,19 +67,17 @@ class FilteredRequestHandler(WSGIRequestHandler):
 
 # Глобальные переменные для хранения состояния
 processing_state = {
-    'logs': [],
     'is_processing': False,
     'current_step': None,
     'progress': 0,  # Процент выполнения (0-100)
     'should_stop': False  # Флаг для остановки процесса
 }
 
-# Thread pool для выполнения длительных операций
-executor = ThreadPoolExecutor(max_workers=1)
+# Общий лог: кольцевой буфер с номерами строк, клиенты забирают только новые строки
+log_buffer = LogRingBuffer(int(os.getenv('LOG_BUFFER_SIZE', '1000')))
 
-# Глобальная переменная для хранения текущего потока обработки
-current_thread = None
-process_lock = threading.Lock()
+# Как часто SSE поток шлет keep-alive, если новых строк нет (секунды)
+LOG_STREAM_KEEPALIVE = 15
 
 def add_log(message):
     """Добавляет сообщение в лог"""
@@ -80,11 +88,8 @@ def add_log(message):
     timestamp = datetime.datetime.now().strftime('%H:%M:%S')
     formatted_message = f"[{timestamp}] {message}"
     
-    # Добавляем в состояние для API
-    processing_state['logs'].append(formatted_message)
-    # Ограничиваем количество логов (последние 1000)
-    if len(processing_state['logs']) > 1000:
-        processing_state['logs'] = processing_state['logs'][-1000:]
+    # Добавляем в буфер для API (пишут несколько задач одновременно)
+    log_buffer.append(formatted_message)
     
     # Выводим в консоль терминала (stdout для видимости)
     print(formatted_message, flush=True)
@@ -97,20 +102,205 @@ def health():
 
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
-    """Получить все логи"""
-    return jsonify({'logs': processing_state['logs']})
+    """
+    Получить логи. ?since=N - только строки с номером больше N
+    (номер последней строки возвращается в last_seq).
+    """
+    since = request.args.get('since', 0, type=int)
+    data = log_buffer.since(since)
+    return jsonify({
+        'logs': data['lines'],
+        'last_seq': data['last_seq'],
+        'truncated': data['truncated']
+    })
+
+@app.route('/api/logs/stream', methods=['GET'])
+def stream_logs():
+    """
+    Server-Sent Events: новые строки лога по мере появления.
+    Событие - JSON {"lines": [...], "last_seq": N}, id события - last_seq,
+    так что браузер при переподключении продолжает с места разрыва (Last-Event-ID).
+    """
+    # При переподключении браузер присылает Last-Event-ID - он новее since из URL
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    
+    def generate(seq):
+        while True:
+            data = log_buffer.wait(seq, timeout=LOG_STREAM_KEEPALIVE)
+            # Курсор двигаем всегда: после очистки буфера новых строк может не быть
+            changed = data['last_seq'] != seq
+            seq = data['last_seq']
+            if data['lines'] or data['truncated']:
+                payload = json.dumps({
+                    'lines': data['lines'],
+                    'last_seq': seq,
+                    'truncated': data['truncated']
+                }, ensure_ascii=False)
+                yield f"id: {seq}\ndata: {payload}\n\n"
+            elif not changed:
+                # Комментарий SSE: держит соединение и обнаруживает отключение клиента
+                yield ": keep-alive\n\n"
+    
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/logs/clear', methods=['POST'])
 def clear_logs():
-    """Очистить логи"""
-    processing_state['logs'] = []
-    return jsonify({'status': 'cleared'})
+    """Очистить логи (номера строк продолжаются, курсоры клиентов остаются верными)"""
+    log_buffer.clear()
+    return jsonify({'status': 'cleared', 'last_seq': log_buffer.last_seq})
+
+# Оценка пиковой RAM задачи по модели Whisper (GB), плюс XTTS при клонировании голоса
+WHISPER_RAM_GB = {
+    'tiny': 1.0,
+    'base': 1.0,
+    'small': 2.0,
+    'medium': 4.0,
+    'large': 6.0,
+}
+VOICE_CLONE_RAM_GB = 3.0
+
+def estimate_job_ram(options):
+    """Оценка пиковой RAM задачи в байтах (для планировщика)"""
+    model = str(options.get('model', 'LARGE')).lower()
+    ram_gb = next((gb for name, gb in WHISPER_RAM_GB.items() if model.startswith(name)), WHISPER_RAM_GB['large'])
+    if options.get('clone_voice', options.get('voice_clone', False)):
+        ram_gb += VOICE_CLONE_RAM_GB
+    return int(ram_gb * 1024 ** 3)
+
+def save_uploaded_file(file):
+    """Сохраняет загруженный файл в папку проекта (как в downloader.py) и возвращает путь"""
+    downloads_dir = APP_PATHS['downloads']
+    os.makedirs(downloads_dir, exist_ok=True)
+    
+    # Получаем имя файла без расширения для папки проекта
+    file_name_without_ext = os.path.splitext(file.filename)[0]
+    video_folder_name = f"{file_name_without_ext}_local"
+    video_folder = os.path.join(downloads_dir, video_folder_name)
+    os.makedirs(video_folder, exist_ok=True)
+    
+    add_log(f"📁 Создана папка проекта: {video_folder_name}")
+    
+    # Сохраняем файл в папку проекта
+    file_path = os.path.join(video_folder, file.filename)
+    file.save(file_path)
+    
+    add_log(f"📁 Файл загружен: {file.filename}")
+    return file_path
+
+# Загрузки частями с возобновлением (для больших файлов, когда путь к файлу недоступен)
+upload_manager = UploadManager()
+
+@app.errorhandler(IngestError)
+def handle_ingest_error(error):
+    return jsonify({'error': str(error), **error.details}), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Начать загрузку частями: JSON {"filename", "size"}"""
+    data = request.json or {}
+    session = upload_manager.create(data.get('filename'), data.get('size'))
+    return jsonify({
+        'upload_id': session['id'],
+        'offset': session['offset'],
+        'size': session['size'],
+        'chunk_size': UPLOAD_CHUNK_BYTES
+    }), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Сколько уже получено - с этого смещения клиент продолжает загрузку"""
+    session = upload_manager.get(upload_id)
+    return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """
+    Часть файла в теле запроса (application/octet-stream), ?offset=N - позиция части.
+    Тело пишется на диск потоком, без буферизации всего запроса в памяти.
+    """
+    offset = request.args.get('offset', 0, type=int)
+    session = upload_manager.write_chunk(upload_id, offset, request.stream)
+    return jsonify({'upload_id': upload_id, 'offset': session['offset'], 'size': session['size']})
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Завершить загрузку: JSON {"sha256"} (необязательно) - проверка целостности"""
+    data = request.json or {}
+    session = upload_manager.complete(upload_id, data.get('sha256'))
+    add_log(f"📁 Файл загружен: {session['filename']} (sha256 {session['sha256'][:12]}…)")
+    return jsonify({
+        'upload_id': upload_id,
+        'path': session['file_path'],
+        'size': session['size'],
+        'sha256': session['sha256']
+    })
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Отменить загрузку"""
+    upload_manager.abort(upload_id)
+    return jsonify({'upload_id': upload_id, 'status': 'aborted'})
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Создать задачу обработки.
+    JSON {"url", "quality", "options"} - YouTube видео;
+    JSON {"path", "options"} - локальный файл (или завершенная загрузка /api/uploads);
+    multipart с полем file и options (JSON строка) - загруженный файл.
+    """
+    if 'file' in request.files:
+        options = json.loads(request.form.get('options', '{}'))
+        file_path = save_uploaded_file(request.files['file'])
+        job = submit_job('file', {'file_path': file_path, 'options': options})
+    elif (request.get_json(silent=True) or {}).get('path'):
+        data = request.get_json()
+        file_path, _method = ingest_local_file(data['path'], progress_callback=add_log)
+        job = submit_job('file', {'file_path': file_path, 'options': data.get('options') or {}})
+    else:
+        data = request.get_json(silent=True) or {}
+        url = data.get('url')
+        if not url:
+            return jsonify({'error': 'URL, path or file is required'}), 400
+        options = data.get('options') or data
+        job = submit_job('youtube', {'url': url, 'quality': data.get('quality', '1080p'), 'options': options})
+    
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Список задач и загрузка ресурсов"""
+    return jsonify({
+        'jobs': [job.to_dict() for job in job_manager.list()],
+        'stages': stage_pipeline.snapshot() if stage_pipeline is not None else [],
+        **job_manager.snapshot()
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Статус задачи; логи начиная с ?since=N"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    since = request.args.get('since', 0, type=int)
+    return jsonify(job.to_dict(include_logs=True, logs_since=since))
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Отменить задачу"""
+    if job_manager.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    cancelled = job_manager.cancel(job_id)
+    return jsonify({'job_id': job_id, 'cancelled': cancelled})
 
 @app.route('/api/process/youtube', methods=['POST'])
 def process_youtube():
-    """Обработка YouTube видео"""
-    global current_thread
-    
+    """Обработка YouTube видео (задача ставится в общую очередь)"""
     data = request.json
     url = data.get('url')
     quality = data.get('quality', '1080p')
@@ -118,977 +308,744 @@ def process_youtube():
     if not url:
         return jsonify({'error': 'URL is required'}), 400
     
-    # Останавливаем предыдущий процесс, если он есть
-    with process_lock:
-        if current_thread and current_thread.is_alive():
-            processing_state['should_stop'] = True
-            processing_state['is_processing'] = False
+    job = submit_job('youtube', {'url': url, 'quality': quality, 'options': data})
     
-    # Запускаем обработку в отдельном потоке с возможностью прерывания
-    thread = threading.Thread(
-        target=process_youtube_sync, 
-        args=(url, quality, data),
-        daemon=True
-    )
-    thread.start()
-    
-    with process_lock:
-        current_thread = thread
-    
-    return jsonify({'status': 'started'})
+    return jsonify({'status': 'started', 'job_id': job.id})
 
-def process_youtube_sync(url, quality, options):
-    """Синхронная обработка YouTube видео (выполняется в отдельном потоке)"""
-    try:
-        processing_state['is_processing'] = True
-        processing_state['current_step'] = 'downloading'
-        processing_state['progress'] = 0
-        processing_state['should_stop'] = False
-        
-        # Проверяем флаг остановки перед началом
-        if processing_state['should_stop']:
-            processing_state['is_processing'] = False
-            return
-        
-        add_log(f"📥 Скачивание видео: {url}")
-        processing_state['progress'] = 5
-        
-        # Создаем callback для проверки остановки во время скачивания
-        def check_stop_during_download():
-            if processing_state['should_stop']:
-                add_log("⏹️ Скачивание прервано пользователем")
-                return True
-            return False
-        
-        video_path = download_video(url, add_log, quality)
-        
-        # Проверяем флаг остановки после скачивания
-        if processing_state['should_stop']:
-            add_log("⏹️ Обработка остановлена пользователем")
-            processing_state['is_processing'] = False
-            processing_state['current_step'] = None
-            processing_state['progress'] = 0
-            return
-        
-        if not video_path:
-            add_log("❌ Ошибка скачивания видео")
-            processing_state['is_processing'] = False
-            processing_state['progress'] = 0
-            return
-        
-        # Проверяем флаг остановки после скачивания
-        if processing_state['should_stop']:
-            add_log("⏹️ Обработка остановлена пользователем")
-            processing_state['is_processing'] = False
-            processing_state['current_step'] = None
-            processing_state['progress'] = 0
-            return
-        
-        add_log(f"✅ Видео скачано: {os.path.basename(video_path)}")
-        processing_state['progress'] = 15
-        
-        # Транскрипция
-        if options.get('transcribe', True):
-            processing_state['current_step'] = 'transcribing'
-            processing_state['progress'] = 20
-            add_log("🎤 Запуск транскрипции...")
-            
-            # Преобразуем model (LARGE -> large-v3) для конструктора Transcriber
-            model_map = {
-                'Tiny': 'tiny',
-                'Base': 'base',
-                'Small': 'small',
-                'Medium': 'medium',
-                'LARGE': 'large-v3'
-            }
-            model_size = model_map.get(options.get('model', 'LARGE'), options.get('model', 'large-v3').lower())
-            
-            # Проверяем флаг остановки перед началом транскрипции
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Создаем callback для проверки остановки
-            def check_should_stop():
-                return processing_state.get('should_stop', False)
-            
-            # Создаем Transcriber с правильным model_size и callback для проверки остановки
-            transcriber = Transcriber(
-                model_size=model_size, 
-                progress_callback=add_log,
-                should_stop_callback=check_should_stop
-            )
-            
-            # Преобразуем language (AUTO -> None, RU -> ru)
-            language = options.get('language')
-            if language and language.upper() == 'AUTO':
-                language = None
-            elif language:
-                language = language.lower()
-            
-            enable_diarization = options.get('diarization', True)
-            num_speakers = options.get('speakers')
-            if num_speakers and isinstance(num_speakers, str) and num_speakers.upper() == 'AUTO':
-                num_speakers = None
-            elif num_speakers:
-                num_speakers = int(num_speakers) if isinstance(num_speakers, (str, int)) else num_speakers
-            
-            result = transcriber.transcribe_full(
-                video_path,
-                language=language,
-                num_speakers=num_speakers if enable_diarization else None
-            )
-            
-            # Проверяем флаг остановки после транскрипции
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Проверяем, была ли транскрипция прервана
-            if isinstance(result, dict) and result.get("stopped"):
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # transcribe_full может возвращать словарь или список
-            if isinstance(result, dict):
-                segments = result.get("segments", [])
-            else:
-                segments = result if isinstance(result, list) else []
-            
-            add_log(f"✅ Транскрипция завершена: {len(segments)} сегментов")
-            processing_state['progress'] = 50
-            
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Перевод
-            if options.get('translate', False):
-                processing_state['current_step'] = 'translating'
-                processing_state['progress'] = 60
-                add_log("🌍 Запуск перевода...")
-                
-                # Проверяем флаг остановки перед переводом
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                translator = Translator(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                target_lang = options.get('target_lang', 'ru')
-                provider = options.get('provider', 'api')
-                
-                # Преобразуем target_lang (RUSSIAN -> ru)
-                lang_map = {
-                    'RUSSIAN': 'ru',
-                    'ENGLISH': 'en',
-                    'SPANISH': 'es',
-                    'FRENCH': 'fr',
-                    'GERMAN': 'de'
-                }
-                target_lang_code = lang_map.get(target_lang.upper(), target_lang.lower())
-                
-                try:
-                    translated_segments = translator.translate_segments(
-                        segments,
-                        target_lang=target_lang_code,
-                        source_lang=options.get('language'),
-                        model=options.get('model', 'large-v3'),
-                        use_fallback=(provider == 'api'),
-                        force_fallback=(provider == 'api')
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                add_log(f"✅ Перевод завершен")
-                segments = translated_segments
-                processing_state['progress'] = 70
-                
-                # Сохраняем переведенную транскрипцию
-                video_dir = os.path.dirname(video_path)
-                video_name = os.path.splitext(os.path.basename(video_path))[0]
-                translated_transcript_path = os.path.join(video_dir, f"{video_name}_translated_{target_lang_code}_transcript.txt")
-                
-                # Получаем список спикеров из переведенных сегментов
-                translated_speakers_set = set(seg.get("speaker", "SPEAKER_UNKNOWN") for seg in translated_segments)
-                
-                # Формируем переведенный текстовый сценарий
-                translated_transcript_text = f"СЦЕНАРИЙ (ПЕРЕВЕДЕННЫЙ НА {target_lang_code.upper()})\n"
-                translated_transcript_text += "=" * 50 + "\n\n"
-                
-                current_speaker = None
-                
-                def format_timestamp(seconds):
-                    m, s = divmod(seconds, 60)
-                    h, m = divmod(m, 60)
-                    return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
-                
-                for seg in translated_segments:
-                    # Проверяем флаг остановки в цикле
-                    if processing_state['should_stop']:
-                        add_log("⏹️ Обработка остановлена пользователем")
-                        processing_state['is_processing'] = False
-                        processing_state['current_step'] = None
-                        processing_state['progress'] = 0
-                        return
-                    
-                    speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
-                    
-                    if speaker != current_speaker:
-                        translated_transcript_text += f"\n👤 {speaker} "
-                        current_speaker = speaker
-                    
-                    start_time = format_timestamp(float(seg.get("start", 0)))
-                    end_time = format_timestamp(float(seg.get("end", 0)))
-                    text = seg.get("text", "").strip()
-                    
-                    translated_transcript_text += f"[{start_time} -> {end_time}]: {text}\n"
-                
-                translated_transcript_text += "\n" + "=" * 50 + "\n"
-                translated_transcript_text += f"📊 СТАТИСТИКА:\n"
-                translated_transcript_text += f"- Всего спикеров: {len(translated_speakers_set)}\n"
-                translated_transcript_text += f"- Список спикеров: {', '.join(sorted(translated_speakers_set))}\n"
-                translated_transcript_text += f"- Сегментов со спикерами: {len(translated_segments)}\n"
-                
-                with open(translated_transcript_path, 'w', encoding='utf-8') as f:
-                    f.write(translated_transcript_text)
-                add_log(f"💾 Переведенный сценарий сохранен: {translated_transcript_path}")
-            
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Voice Cloning
-            if options.get('voice_cloning', False):
-                processing_state['current_step'] = 'voice_cloning'
-                processing_state['progress'] = 75
-                add_log("🎤 Запуск клонирования голоса...")
-                
-                # Проверяем флаг остановки перед voice cloning
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                cloner = VoiceCloner(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                speaker_samples = cloner.extract_speaker_samples(
-                    video_path,
-                    segments
-                )
-                
-                # Проверяем флаг остановки после извлечения образцов
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Преобразуем target_lang для voice cloning (RUSSIAN -> ru)
-                lang_map = {
-                    'RUSSIAN': 'ru',
-                    'ENGLISH': 'en',
-                    'SPANISH': 'es',
-                    'FRENCH': 'fr',
-                    'GERMAN': 'de',
-                    'ITALIAN': 'it',
-                    'PORTUGUESE': 'pt',
-                    'POLISH': 'pl',
-                    'TURKISH': 'tr',
-                    'DUTCH': 'nl',
-                    'CZECH': 'cs',
-                    'ARABIC': 'ar',
-                    'CHINESE': 'zh-cn',
-                    'HUNGARIAN': 'hu',
-                    'KOREAN': 'ko',
-                    'JAPANESE': 'ja',
-                    'HINDI': 'hi'
-                }
-                target_lang_for_voice = lang_map.get(options.get('target_lang', 'ru').upper(), options.get('target_lang', 'ru').lower())
-                
-                try:
-                    segments_with_audio = cloner.generate_dubbing(
-                        segments,
-                        speaker_samples,
-                        target_lang_for_voice
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Проверяем флаг остановки после генерации дубляжа
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Сохраняем файлы озвучки в папку Downloads
-                import shutil
-                downloads_dir = APP_PATHS['downloads']
-                video_name = os.path.splitext(os.path.basename(video_path))[0]
-                audio_output_dir = os.path.join(downloads_dir, f"{video_name}_audio")
-                os.makedirs(audio_output_dir, exist_ok=True)
-                
-                saved_count = 0
-                for i, seg in enumerate(segments_with_audio):
-                    audio_file = seg.get("audio_file")
-                    if audio_file and os.path.exists(audio_file):
-                        # Копируем файл в папку Downloads
-                        segment_filename = f"segment_{i:04d}_{seg.get('speaker', 'UNKNOWN')}.wav"
-                        dest_path = os.path.join(audio_output_dir, segment_filename)
-                        shutil.copy2(audio_file, dest_path)
-                        saved_count += 1
-                
-                if saved_count > 0:
-                    add_log(f"💾 Сохранено {saved_count} файлов озвучки в: {audio_output_dir}")
-                
-                # Создание финального видео
-                processing_state['current_step'] = 'making_video'
-                add_log("🎬 Создание финального видео...")
-                
-                # Проверяем флаг остановки перед созданием видео
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                video_maker = VideoMaker(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                output_path = os.path.join(
-                    os.path.dirname(video_path),
-                    f"{os.path.splitext(os.path.basename(video_path))[0]}_dubbed.mp4"
-                )
-                
-                try:
-                    video_maker.make_video(
-                        video_path,
-                        segments_with_audio,
-                        output_path
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Проверяем флаг остановки после создания видео
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                add_log(f"✅ Видео создано: {output_path}")
-        
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-        add_log("✅ Обработка завершена!")
-        
-    except (InterruptedError, KeyboardInterrupt) as e:
-        add_log("⏹️ Обработка прервана пользователем")
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-        processing_state['progress'] = 0
-        processing_state['should_stop'] = False
-    except Exception as e:
-        add_log(f"❌ Ошибка: {str(e)}")
-        import traceback
-        add_log(traceback.format_exc())
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-    finally:
-        # Всегда сбрасываем флаг остановки
-        processing_state['should_stop'] = False
+def warm_ollama_for_job(options, log=None):
+    """Заранее загружает модель Ollama, если она понадобится для перевода или коррекции спикеров"""
+    if options.get('provider', 'api') != 'ollama' and not options.get('correct_speakers', False):
+        return
+    OllamaManager(progress_callback=log or add_log).warm_in_background(get_ollama_model(options))
 
 @app.route('/api/process/file', methods=['POST'])
 def process_file():
-    """Обработка загруженного файла"""
+    """
+    Обработка локального файла (задача ставится в общую очередь).
+    JSON {"path", "options"} - файл по пути, без загрузки через HTTP;
+    multipart с полем file - загрузка файла целиком.
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('path'):
+        file_path, method = ingest_local_file(data['path'], progress_callback=add_log)
+        job = submit_job('file', {'file_path': file_path, 'options': data.get('options') or {}})
+        return jsonify({'status': 'started', 'job_id': job.id, 'ingest': method})
+    
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
-    file = request.files['file']
     options = json.loads(request.form.get('options', '{}'))
+    file_path = save_uploaded_file(request.files['file'])
     
-    # Создаем папку проекта (как в downloader.py)
-    downloads_dir = APP_PATHS['downloads']
-    os.makedirs(downloads_dir, exist_ok=True)
+    job = submit_job('file', {'file_path': file_path, 'options': options})
     
-    # Получаем имя файла без расширения для папки проекта
-    file_name_without_ext = os.path.splitext(file.filename)[0]
-    video_folder_name = f"{file_name_without_ext}_local"
-    video_folder = os.path.join(downloads_dir, video_folder_name)
-    os.makedirs(video_folder, exist_ok=True)
+    return jsonify({'status': 'started', 'job_id': job.id})
+
+# Преобразование опций UI в параметры модулей
+WHISPER_MODEL_MAP = {
+    'Tiny': 'tiny',
+    'Base': 'base',
+    'Small': 'small',
+    'Medium': 'medium',
+    'LARGE': 'large-v3'
+}
+TRANSLATE_LANG_MAP = {
+    'RUSSIAN': 'ru',
+    'ENGLISH': 'en',
+    'SPANISH': 'es',
+    'FRENCH': 'fr',
+    'GERMAN': 'de'
+}
+VOICE_LANG_MAP = {
+    **TRANSLATE_LANG_MAP,
+    'ITALIAN': 'it',
+    'PORTUGUESE': 'pt',
+    'POLISH': 'pl',
+    'TURKISH': 'tr',
+    'DUTCH': 'nl',
+    'CZECH': 'cs',
+    'ARABIC': 'ar',
+    'CHINESE': 'zh-cn',
+    'HUNGARIAN': 'hu',
+    'KOREAN': 'ko',
+    'JAPANESE': 'ja',
+    'HINDI': 'hi'
+}
+
+def normalize_language(language):
+    """AUTO -> None, RU -> ru"""
+    if language and language.upper() == 'AUTO':
+        return None
+    return language.lower() if language else None
+
+def format_timestamp(seconds):
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
+
+def write_transcript(path, title, segments):
+    """Сохраняет текстовый сценарий по сегментам (спикер, время, текст)"""
+    speakers_set = set(seg.get("speaker", "SPEAKER_UNKNOWN") for seg in segments)
     
-    add_log(f"📁 Создана папка проекта: {video_folder_name}")
+    transcript_text = f"{title}\n"
+    transcript_text += "=" * 50 + "\n\n"
     
-    # Сохраняем файл в папку проекта
-    file_path = os.path.join(video_folder, file.filename)
-    file.save(file_path)
+    current_speaker = None
+    for seg in segments:
+        speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
+        
+        if speaker != current_speaker:
+            transcript_text += f"\n👤 {speaker} "
+            current_speaker = speaker
+        
+        start_time = format_timestamp(float(seg.get("start", 0)))
+        end_time = format_timestamp(float(seg.get("end", 0)))
+        text = seg.get("text", "").strip()
+        
+        transcript_text += f"[{start_time} -> {end_time}]: {text}\n"
     
-    add_log(f"📁 Файл загружен: {file.filename}")
+    transcript_text += "\n" + "=" * 50 + "\n"
+    transcript_text += f"📊 СТАТИСТИКА:\n"
+    transcript_text += f"- Всего спикеров: {len(speakers_set)}\n"
+    transcript_text += f"- Список спикеров: {', '.join(sorted(speakers_set))}\n"
+    transcript_text += f"- Сегментов со спикерами: {len(segments)}\n"
+    
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(transcript_text)
+
+# Этапы обработки. Каждый этап получает контекст задачи (ctx): state, log, options,
+# источник (url или video_path) и результаты предыдущих этапов. Этап возвращает
+# False, если дальше делать нечего; остановка пользователем - InterruptedError.
+
+def get_job_work_dir(job_id):
+    """Временная папка задачи: референсы спикеров, сегменты озвучки, сборка аудио"""
+    return APP_PATHS['temp'] / 'jobs' / job_id
+
+def make_job_context(kind, params, state=None, log=None, job_id=None):
+    """
+    Контекст задачи для этапов обработки.
+    У каждой задачи своя временная папка (work_dir), чтобы параллельные
+    задачи не перезаписывали файлы друг друга.
+    """
+    ctx = {
+        'state': processing_state if state is None else state,
+        'log': log or add_log,
+        'options': params.get('options') or {},
+        'url': None,
+        'quality': None,
+        'video_path': None,
+        'segments': None,
+        'segments_with_audio': None,
+        # Результаты и ключи этапов графа (см. processing_dag)
+        'artifacts': {},
+        'artifact_keys': {},
+        'transcriber': None,
+        'work_dir': get_job_work_dir(job_id or uuid.uuid4().hex[:12]),
+    }
+    if kind == 'youtube':
+        ctx['url'] = params['url']
+        ctx['quality'] = params.get('quality', '1080p')
+    else:
+        ctx['video_path'] = params['file_path']
+    return ctx
+
+def check_stop(ctx):
+    """Прерывает обработку, если пользователь нажал стоп"""
+    if ctx['state'].get('should_stop'):
+        raise InterruptedError("Обработка остановлена пользователем")
+
+# Граф этапов обработки. Каждый узел объявляет входы и параметры; результат
+# хранится в кэше артефактов по ключу (входы + параметры), поэтому при повторной
+# обработке того же видео с другими опциями выполняются только затронутые этапы
+# (например, при смене языка перевода - перевод, озвучка, сборка и mux).
+
+def get_whisper_model(options):
+    """Размер модели Whisper из опций UI"""
+    return WHISPER_MODEL_MAP.get(options.get('model', 'LARGE'), options.get('model', 'large-v3').lower())
+
+def get_num_speakers(options):
+    """Число спикеров из опций UI (None - определить автоматически)"""
+    if not options.get('diarization', True):
+        return None
+    num_speakers = options.get('speakers')
+    if num_speakers and isinstance(num_speakers, str) and num_speakers.upper() == 'AUTO':
+        return None
+    elif num_speakers:
+        return int(num_speakers) if isinstance(num_speakers, (str, int)) else num_speakers
+    return None
+
+def get_target_lang(options):
+    """Код языка перевода"""
+    target_lang = options.get('target_lang', 'ru')
+    return TRANSLATE_LANG_MAP.get(target_lang.upper(), target_lang.lower())
+
+def get_ollama_model(options):
+    """Модель Ollama для перевода и коррекции спикеров"""
+    return options.get('ollama_model') or os.getenv('OLLAMA_MODEL', 'qwen2.5:7b')
+
+def get_transcriber(ctx):
+    """Transcriber задачи (один на задачу, модели при этом общие - core.model_registry)"""
+    if ctx['transcriber'] is None:
+        state = ctx['state']
+        ctx['transcriber'] = Transcriber(
+            model_size=get_whisper_model(ctx['options']),
+            progress_callback=ctx['log'],
+            should_stop_callback=lambda: state.get('should_stop', False)
+        )
+    return ctx['transcriber']
+
+def video_fingerprint(path):
+    """Хэш содержимого видео (без кэша артефактов - путь, время изменения и размер)"""
+    if artifact_cache is not None:
+        return artifact_cache.file_sha256(path)
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}:{stat.st_mtime}:{stat.st_size}"
+
+def dag_ingest(ctx, inputs):
+    """Декодирование аудио (у PCM кэша core.audio_ingest свой кэш, в артефакты не пишется)"""
+    check_stop(ctx)
+    _audio, audio_cache = ingest_audio(ctx['video_path'], ctx['log'])
+    return {'audio_cache': audio_cache}
+
+def dag_asr(ctx, inputs):
+    """Распознавание текста (Whisper)"""
+    check_stop(ctx)
+    audio = load_audio_array(inputs['ingest']['audio_cache'])
+    transcriber = get_transcriber(ctx)
+    # При параллельной диаризации ядра делятся с ее процессом (ASR_THREADS/DIARIZATION_THREADS)
+    threads = None
+    if transcriber.parallel_diarization and transcriber.hf_token:
+        threads = transcriber._thread_budget()[0]
+    return transcriber.run_asr(
+        audio,
+        language=normalize_language(ctx['options'].get('language')),
+        threads=threads
+    )
+
+def dag_align(ctx, inputs):
+    """Выравнивание таймингов по словам"""
+    check_stop(ctx)
+    audio = load_audio_array(inputs['ingest']['audio_cache'])
+    result = get_transcriber(ctx).run_alignment(copy.deepcopy(inputs['asr']), audio)
+    # Пропущенное из-за ошибки выравнивание не кэшируем - в следующий раз попробуем снова
+    if not result.get('aligned'):
+        result['no_cache'] = True
+    return result
+
+def dag_diarize(ctx, inputs):
+    """Диаризация (реплики спикеров)"""
+    check_stop(ctx)
+    transcriber = get_transcriber(ctx)
+    audio_cache = inputs['ingest']['audio_cache']
+    diarize_segments = transcriber.run_diarization(
+        load_audio_array(audio_cache),
+        audio_cache=audio_cache,
+        num_speakers=get_num_speakers(ctx['options'])
+    )
+    return {'turns': Transcriber.diarization_to_records(diarize_segments)}
+
+def dag_correct(ctx, inputs):
+    """Спикеры по словам, разбиение на предложения и (опционально) коррекция спикеров LLM"""
+    check_stop(ctx)
+    options = ctx['options']
+    segments = get_transcriber(ctx).assign_speakers(
+        copy.deepcopy(inputs['align']),
+        Transcriber.diarization_from_records(inputs['diarize']['turns'])
+    )
+    if options.get('correct_speakers', False):
+        corrector = SpeakerCorrector(model=get_ollama_model(options), progress_callback=ctx['log'])
+        segments = corrector.correct(segments)
+    return {'segments': segments, 'language': inputs['align'].get('language', 'en')}
+
+def dag_correct_params(ctx):
+    options = ctx['options']
+    if not options.get('correct_speakers', False):
+        return {'llm': False}
+    return {'llm': True, 'model': get_ollama_model(options)}
+
+def dag_translate(ctx, inputs):
+    """Перевод сегментов (без перевода - сегменты как есть)"""
+    options, state, log = ctx['options'], ctx['state'], ctx['log']
+    segments = inputs['correct']['segments']
+    if not options.get('translate', False):
+        return {'segments': segments}
+    check_stop(ctx)
+    log("🌍 Запуск перевода...")
+    translator = Translator(
+        progress_callback=log,
+        should_stop_callback=lambda: state.get('should_stop', False)
+    )
+    provider = options.get('provider', 'api')
+    segments = translator.translate_segments(
+        copy.deepcopy(segments),
+        target_lang=get_target_lang(options),
+        source_lang=normalize_language(options.get('language')),
+        model=get_ollama_model(options),
+        use_fallback=True,
+        force_fallback=(provider == 'api'),
+        prefer_ollama=(provider == 'ollama')
+    )
+    check_stop(ctx)
+    log(f"✅ Перевод завершен")
+    result = {'segments': segments}
+    # Сегменты с оригинальным текстом (все провайдеры недоступны) не кэшируем - в следующий раз переведем снова
+    if translator.untranslated_count:
+        result['no_cache'] = True
+    return result
+
+def dag_translate_params(ctx):
+    options = ctx['options']
+    if not options.get('translate', False):
+        return {'translate': False}
+    return {
+        'translate': True,
+        'target_lang': get_target_lang(options),
+        'source_lang': normalize_language(options.get('language')),
+        'provider': options.get('provider', 'api'),
+        'model': get_ollama_model(options),
+    }
+
+def get_voice_lang(options):
+    """Код языка озвучки (XTTS)"""
+    target_lang = options.get('target_lang', 'ru')
+    return VOICE_LANG_MAP.get(target_lang.upper(), target_lang.lower())
+
+def dag_tts(ctx, inputs):
+    """Клонирование голоса: образцы спикеров и озвучка сегментов"""
+    check_stop(ctx)
+    state, log = ctx['state'], ctx['log']
+    segments = inputs['translate']['segments']
+    cloner = VoiceCloner(
+        progress_callback=log,
+        should_stop_callback=lambda: state.get('should_stop', False),
+        work_dir=str(ctx['work_dir'])
+    )
+    speaker_samples = cloner.extract_speaker_samples(ctx['video_path'], segments)
+    check_stop(ctx)
+    segments_with_audio = cloner.generate_dubbing(
+        copy.deepcopy(segments),
+        speaker_samples,
+        get_voice_lang(ctx['options'])
+    )
+    check_stop(ctx)
+    files = {
+        f"seg_{i:04d}": seg['audio_file']
+        for i, seg in enumerate(segments_with_audio)
+        if seg.get('audio_file') and os.path.exists(seg['audio_file'])
+    }
+    result = {'segments': segments_with_audio, 'files': files}
+    # Неозвученные сегменты (ошибка референса или синтеза) не кэшируем - повтор дешевый благодаря кэшу TTS
+    missing = sum(
+        1 for i, seg in enumerate(segments_with_audio)
+        if seg.get('text', '').strip() and f"seg_{i:04d}" not in files
+    )
+    if missing:
+        log(f"⚠️ Не озвучено {missing} сегментов, результат озвучки не сохраняется в кэш")
+        result['no_cache'] = True
+    return result
+
+def tts_segments(artifact):
+    """Сегменты с audio_file, указывающими на файлы результата этапа tts"""
+    files = artifact.get('files') or {}
+    segments = []
+    for i, seg in enumerate(artifact['segments']):
+        seg = dict(seg)
+        seg['audio_file'] = files.get(f"seg_{i:04d}")
+        segments.append(seg)
+    return segments
+
+def dag_assemble(ctx, inputs):
+    """Сборка дублированной аудиодорожки по таймингам сегментов"""
+    check_stop(ctx)
+    state, video_path = ctx['state'], ctx['video_path']
+    video_maker = VideoMaker(
+        progress_callback=ctx['log'],
+        should_stop_callback=lambda: state.get('should_stop', False),
+        temp_dir=str(ctx['work_dir'] / 'video')
+    )
+    duration = video_maker.probe_video_duration(video_path)
+    audio_path = video_maker.temp_dir / f"{os.path.splitext(os.path.basename(video_path))[0]}_dubbed_audio.wav"
+    video_maker.assemble_audio(tts_segments(inputs['tts']), duration, str(audio_path))
+    return {'duration': duration, 'files': {'audio': str(audio_path)}}
+
+def get_output_path(video_path):
+    """Путь итогового видео рядом с исходным"""
+    return os.path.join(
+        os.path.dirname(video_path),
+        f"{os.path.splitext(os.path.basename(video_path))[0]}_dubbed.mp4"
+    )
+
+def dag_mux(ctx, inputs):
+    """Замена аудиодорожки видео (видео в кэш не копируется - запоминается путь и размер)"""
+    check_stop(ctx)
+    state, video_path = ctx['state'], ctx['video_path']
+    video_maker = VideoMaker(
+        progress_callback=ctx['log'],
+        should_stop_callback=lambda: state.get('should_stop', False),
+        temp_dir=str(ctx['work_dir'] / 'video')
+    )
+    output_path = get_output_path(video_path)
+    assembled = inputs['assemble']
+    video_maker.mux(video_path, assembled['files']['audio'], output_path, assembled['duration'])
+    return {'output_path': output_path, 'size': os.path.getsize(output_path)}
+
+def mux_output_valid(ctx, value):
+    """Готовое видео еще на месте и не изменилось"""
+    path = value.get('output_path')
+    return bool(path) and os.path.exists(path) and os.path.getsize(path) == value.get('size')
+
+# Версию этапа (version) нужно увеличивать, когда меняется его результат при тех же
+# входах и параметрах - иначе будут использоваться старые результаты из кэша.
+DAG_STAGES = [
+    DagStage('ingest', dag_ingest, params=lambda ctx: {'video': video_fingerprint(ctx['video_path'])}, cache=False),
+    DagStage('asr', dag_asr, inputs=['ingest'], params=lambda ctx: {
+        'model': get_whisper_model(ctx['options']),
+        'language': normalize_language(ctx['options'].get('language')),
+    }),
+    DagStage('align', dag_align, inputs=['asr', 'ingest']),
+    DagStage('diarize', dag_diarize, inputs=['ingest'], params=lambda ctx: {
+        'enabled': bool(os.getenv('HF_TOKEN')),
+        'speakers': get_num_speakers(ctx['options']),
+    }),
+    DagStage('correct', dag_correct, inputs=['align', 'diarize'], params=dag_correct_params),
+    DagStage('translate', dag_translate, inputs=['correct'], params=dag_translate_params),
+    DagStage('tts', dag_tts, inputs=['translate', 'ingest'], params=lambda ctx: {
+        'lang': get_voice_lang(ctx['options']),
+    }),
+    DagStage('assemble', dag_assemble, inputs=['tts', 'ingest'], params=lambda ctx: {
+        'render_mode': os.getenv('VIDEO_RENDER_MODE', 'filtergraph').lower(),
+    }),
+    DagStage('mux', dag_mux, inputs=['assemble', 'ingest'], params=lambda ctx: {
+        'output': get_output_path(ctx['video_path']),
+    }, is_valid=mux_output_valid),
+]
+
+# Кэш артефактов (ARTIFACT_CACHE=0 - выключить; ARTIFACT_CACHE_MAX_GB - размер)
+if os.getenv('ARTIFACT_CACHE', '1').lower() in ('1', 'true', 'yes'):
+    artifact_cache = ArtifactCache(
+        str(APP_PATHS['temp'] / 'artifacts'),
+        max_size_bytes=int(float(os.getenv('ARTIFACT_CACHE_MAX_GB', '10')) * 1024 ** 3),
+        progress_callback=add_log
+    )
+else:
+    artifact_cache = None
+
+# Транскрипция и диаризация независимы: при параллельной диаризации
+# (отдельный процесс) выполняем их одновременно
+processing_dag = DagExecutor(
+    DAG_STAGES,
+    artifact_cache,
+    max_workers=int(os.getenv('DAG_WORKERS', '0')) or (
+        2 if os.getenv('PARALLEL_DIARIZATION', '0').lower() in ('1', 'true', 'yes') else 1
+    )
+)
+
+def run_dag(ctx, targets):
+    """Результаты этапов графа targets (выполняя только этапы с новыми ключами)"""
+    return processing_dag.run(ctx, targets, ctx['log'])
+
+def stage_download(ctx):
+    """Скачивание видео (только для YouTube)"""
+    if not ctx['url']:
+        return
+    state, log = ctx['state'], ctx['log']
+    check_stop(ctx)
+    state['current_step'] = 'downloading'
+    state['progress'] = 5
+    log(f"📥 Скачивание видео: {ctx['url']}")
+    
+    video_path = download_video(ctx['url'], log, ctx['quality'])
+    check_stop(ctx)
     
-    # Останавливаем предыдущий процесс, если он есть
-    global current_thread
-    with process_lock:
-        if current_thread and current_thread.is_alive():
-            processing_state['should_stop'] = True
-            processing_state['is_processing'] = False
+    if not video_path:
+        state['error'] = "Ошибка скачивания видео"
+        log("❌ Ошибка скачивания видео")
+        return False
     
-    # Запускаем обработку в отдельном потоке с возможностью прерывания
-    thread = threading.Thread(
-        target=process_file_sync, 
-        args=(file_path, options),
-        daemon=True
+    ctx['video_path'] = video_path
+    log(f"✅ Видео скачано: {os.path.basename(video_path)}")
+    state['progress'] = 15
+
+def stage_transcribe(ctx):
+    """Транскрипция и диаризация, сохранение сегментов и сценария в папку проекта"""
+    state, log, options = ctx['state'], ctx['log'], ctx['options']
+    if not options.get('transcribe', True):
+        return False
+    check_stop(ctx)
+    state['current_step'] = 'transcribing'
+    state['progress'] = 20
+    log("🎤 Запуск транскрипции...")
+    
+    result = run_dag(ctx, ['correct'])['correct']
+    check_stop(ctx)
+    segments = result['segments']
+    detected_language = result.get('language', 'en')
+    
+    log(f"✅ Транскрипция завершена: {len(segments)} сегментов")
+    
+    # Сохраняем скрипты транскрипции в папку проекта
+    video_path = ctx['video_path']
+    video_dir = os.path.dirname(video_path)
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    transcript_path = os.path.join(video_dir, f"{video_name}_transcript.txt")
+    segments_path = os.path.join(video_dir, f"{video_name}_segments.json")
+    
+    speakers_set = set(seg.get("speaker", "SPEAKER_UNKNOWN") for seg in segments)
+    full_result_json = {
+        "segments": segments,
+        "language": detected_language,
+        "language_probability": 0.99,
+        "diarization": {
+            "total_speakers": len(speakers_set),
+            "speakers": sorted(list(speakers_set))
+        }
+    }
+    with open(segments_path, 'w', encoding='utf-8') as f:
+        json.dump(full_result_json, f, ensure_ascii=False, indent=2)
+    log(f"💾 Сегменты сохранены: {segments_path}")
+    
+    write_transcript(transcript_path, "СЦЕНАРИЙ (WHISPERX PIPELINE)", segments)
+    log(f"💾 Сценарий сохранен: {transcript_path}")
+    
+    ctx['segments'] = segments
+    state['progress'] = 50
+
+def stage_translate(ctx):
+    """Перевод сегментов и сохранение переведенного сценария"""
+    state, log, options = ctx['state'], ctx['log'], ctx['options']
+    if not options.get('translate', False):
+        return
+    check_stop(ctx)
+    state['current_step'] = 'translating'
+    state['progress'] = 60
+    
+    segments = run_dag(ctx, ['translate'])['translate']['segments']
+    check_stop(ctx)
+    ctx['segments'] = segments
+    state['progress'] = 70
+    
+    # Сохраняем переведенную транскрипцию
+    target_lang_code = get_target_lang(options)
+    video_path = ctx['video_path']
+    video_dir = os.path.dirname(video_path)
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    translated_transcript_path = os.path.join(video_dir, f"{video_name}_translated_{target_lang_code}_transcript.txt")
+    write_transcript(
+        translated_transcript_path,
+        f"СЦЕНАРИЙ (ПЕРЕВЕДЕННЫЙ НА {target_lang_code.upper()})",
+        segments
     )
-    thread.start()
+    log(f"💾 Переведенный сценарий сохранен: {translated_transcript_path}")
+
+def stage_voice(ctx):
+    """Клонирование голоса: образцы спикеров, озвучка сегментов, копии в Downloads"""
+    state, log, options = ctx['state'], ctx['log'], ctx['options']
+    if not options.get('voice_cloning', False):
+        return False
+    check_stop(ctx)
+    state['current_step'] = 'voice_cloning'
+    state['progress'] = 75
+    log("🎤 Запуск клонирования голоса...")
     
-    with process_lock:
-        current_thread = thread
+    segments_with_audio = tts_segments(run_dag(ctx, ['tts'])['tts'])
+    check_stop(ctx)
     
-    return jsonify({'status': 'started'})
+    # Сохраняем файлы озвучки в папку Downloads
+    video_path = ctx['video_path']
+    downloads_dir = APP_PATHS['downloads']
+    video_name = os.path.splitext(os.path.basename(video_path))[0]
+    audio_output_dir = os.path.join(downloads_dir, f"{video_name}_audio")
+    os.makedirs(audio_output_dir, exist_ok=True)
+    
+    saved_count = 0
+    for i, seg in enumerate(segments_with_audio):
+        check_stop(ctx)
+        audio_file = seg.get("audio_file")
+        if audio_file and os.path.exists(audio_file):
+            segment_filename = f"segment_{i:04d}_{seg.get('speaker', 'UNKNOWN')}.wav"
+            dest_path = os.path.join(audio_output_dir, segment_filename)
+            shutil.copy2(audio_file, dest_path)
+            saved_count += 1
+    
+    if saved_count > 0:
+        log(f"💾 Сохранено {saved_count} файлов озвучки в: {audio_output_dir}")
+    
+    ctx['segments_with_audio'] = segments_with_audio
+    state['progress'] = 85
+
+def stage_video(ctx):
+    """Сборка финального видео с дубляжом"""
+    state, log = ctx['state'], ctx['log']
+    check_stop(ctx)
+    state['current_step'] = 'making_video'
+    state['progress'] = 90
+    log("🎬 Создание финального видео...")
+    
+    output_path = run_dag(ctx, ['mux'])['mux']['output_path']
+    check_stop(ctx)
+    
+    state['output_path'] = output_path
+    log(f"✅ Видео создано: {output_path}")
+
+# Этапы по порядку: (имя, обработчик, исполнителей по умолчанию).
+# Тяжелые по памяти этапы (Whisper, XTTS) - по одному исполнителю,
+# сетевые и дисковые - по два.
+PROCESSING_STAGES = [
+    ('download', stage_download, 2),
+    ('transcribe', stage_transcribe, 1),
+    ('translate', stage_translate, 2),
+    ('voice', stage_voice, 1),
+    ('video', stage_video, 2),
+]
+
+def begin_job(ctx):
+    """Сбрасывает состояние задачи перед обработкой"""
+    state = ctx['state']
+    state['is_processing'] = True
+    state['current_step'] = None
+    state['progress'] = 0
+    # Флаг остановки сбрасываем только у общего processing_state (прежний режим одной задачи):
+    # у задачи из очереди он уже сброшен при создании, а отмена могла прийти до begin_job
+    if state is processing_state:
+        state['should_stop'] = False
+    # Модель Ollama грузится параллельно со скачиванием и транскрипцией
+    warm_ollama_for_job(ctx['options'], ctx['log'])
+
+def finish_job(ctx, error=None):
+    """Итоговое состояние задачи после всех этапов (или ошибки/остановки)"""
+    state, log = ctx['state'], ctx['log']
+    if isinstance(error, (InterruptedError, KeyboardInterrupt)):
+        log("⏹️ Обработка прервана пользователем")
+        state['progress'] = 0
+    elif error is not None:
+        state['error'] = str(error)
+        log(f"❌ Ошибка: {str(error)}")
+        log(''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+        state['progress'] = 0
+    elif state.get('error'):
+        # Этап сам сообщил об ошибке (например, не удалось скачать видео)
+        state['progress'] = 0
+    else:
+        state['progress'] = 100
+        log("✅ Обработка завершена!")
+    state['is_processing'] = False
+    state['current_step'] = None
+    # Всегда сбрасываем флаг остановки
+    state['should_stop'] = False
+    # Временные файлы задачи больше не нужны (результаты - в Downloads и кэше артефактов)
+    processing_dag.release(ctx)
+    shutil.rmtree(ctx['work_dir'], ignore_errors=True)
 
-def process_file_sync(file_path, options):
-    """Синхронная обработка файла (выполняется в отдельном потоке)"""
-    # Аналогично process_youtube_sync, но без скачивания
+def run_stages_sync(ctx):
+    """Выполняет все этапы задачи подряд в текущем потоке"""
+    begin_job(ctx)
+    error = None
     try:
-        processing_state['is_processing'] = True
-        processing_state['progress'] = 0
-        processing_state['should_stop'] = False
-        
-        # Транскрипция и остальные шаги
-        if options.get('transcribe', True):
-            processing_state['current_step'] = 'transcribing'
-            processing_state['progress'] = 20
-            add_log("🎤 Запуск транскрипции...")
-            
-            # Преобразуем model (LARGE -> large-v3) для конструктора Transcriber
-            model_map = {
-                'Tiny': 'tiny',
-                'Base': 'base',
-                'Small': 'small',
-                'Medium': 'medium',
-                'LARGE': 'large-v3'
-            }
-            model_size = model_map.get(options.get('model', 'LARGE'), options.get('model', 'large-v3').lower())
-            
-            # Проверяем флаг остановки перед началом транскрипции
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Создаем callback для проверки остановки
-            def check_should_stop():
-                return processing_state.get('should_stop', False)
-            
-            # Создаем Transcriber с правильным model_size и callback для проверки остановки
-            transcriber = Transcriber(
-                model_size=model_size, 
-                progress_callback=add_log,
-                should_stop_callback=check_should_stop
-            )
-            
-            # Преобразуем language (AUTO -> None, RU -> ru)
-            language = options.get('language')
-            if language and language.upper() == 'AUTO':
-                language = None
-            elif language:
-                language = language.lower()
-            
-            enable_diarization = options.get('diarization', True)
-            num_speakers = options.get('speakers')
-            if num_speakers and isinstance(num_speakers, str) and num_speakers.upper() == 'AUTO':
-                num_speakers = None
-            elif num_speakers:
-                num_speakers = int(num_speakers) if isinstance(num_speakers, (str, int)) else num_speakers
-            
-            result = transcriber.transcribe_full(
-                file_path,
-                language=language,
-                num_speakers=num_speakers if enable_diarization else None
-            )
-            
-            # Проверяем, была ли транскрипция прервана
-            if isinstance(result, dict) and result.get("stopped"):
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Проверяем флаг остановки после транскрипции
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # transcribe_full может возвращать словарь или список
-            if isinstance(result, dict):
-                segments = result.get("segments", [])
-                detected_language = result.get("language", "en")
-            else:
-                segments = result if isinstance(result, list) else []
-                detected_language = "en"
-            
-            add_log(f"✅ Транскрипция завершена: {len(segments)} сегментов")
-            
-            # Сохраняем скрипты транскрипции в папку проекта
-            video_dir = os.path.dirname(file_path)
-            video_name = os.path.splitext(os.path.basename(file_path))[0]
-            
-            # Пути для сохранения скриптов
-            transcript_path = os.path.join(video_dir, f"{video_name}_transcript.txt")
-            segments_path = os.path.join(video_dir, f"{video_name}_segments.json")
-            
-            # Сохраняем JSON сегментов
-            import json as json_lib
-            speakers_set = set(seg.get("speaker", "SPEAKER_UNKNOWN") for seg in segments)
-            full_result_json = {
-                "segments": segments,
-                "language": detected_language,
-                "language_probability": 0.99,
-                "diarization": {
-                    "total_speakers": len(speakers_set),
-                    "speakers": sorted(list(speakers_set))
-                }
-            }
-            with open(segments_path, 'w', encoding='utf-8') as f:
-                json_lib.dump(full_result_json, f, ensure_ascii=False, indent=2)
-            add_log(f"💾 Сегменты сохранены: {segments_path}")
-            
-            # Формируем и сохраняем текстовый сценарий
-            transcript_text = "СЦЕНАРИЙ (WHISPERX PIPELINE)\n"
-            transcript_text += "=" * 50 + "\n\n"
-            
-            current_speaker = None
-            
-            def format_timestamp(seconds):
-                m, s = divmod(seconds, 60)
-                h, m = divmod(m, 60)
-                return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
-            
-                for seg in segments:
-                    # Проверяем флаг остановки в цикле
-                    if processing_state['should_stop']:
-                        add_log("⏹️ Обработка остановлена пользователем")
-                        processing_state['is_processing'] = False
-                        processing_state['current_step'] = None
-                        processing_state['progress'] = 0
-                        return
-                    
-                    speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
-                    
-                    if speaker != current_speaker:
-                        transcript_text += f"\n👤 {speaker} "
-                        current_speaker = speaker
-                    
-                    start_time = format_timestamp(float(seg.get("start", 0)))
-                    end_time = format_timestamp(float(seg.get("end", 0)))
-                    text = seg.get("text", "").strip()
-                    
-                    transcript_text += f"[{start_time} -> {end_time}]: {text}\n"
-            
-            transcript_text += "\n" + "=" * 50 + "\n"
-            transcript_text += f"📊 СТАТИСТИКА:\n"
-            transcript_text += f"- Всего спикеров: {len(speakers_set)}\n"
-            transcript_text += f"- Список спикеров: {', '.join(sorted(speakers_set))}\n"
-            transcript_text += f"- Сегментов со спикерами: {len(segments)}\n"
-            
-            with open(transcript_path, 'w', encoding='utf-8') as f:
-                f.write(transcript_text)
-            add_log(f"💾 Сценарий сохранен: {transcript_path}")
-            processing_state['progress'] = 50
-            
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Перевод
-            if options.get('translate', False):
-                processing_state['current_step'] = 'translating'
-                processing_state['progress'] = 60
-                add_log("🌍 Запуск перевода...")
-                
-                # Проверяем флаг остановки перед переводом
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                translator = Translator(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                
-                # Преобразуем target_lang (RUSSIAN -> ru)
-                lang_map = {
-                    'RUSSIAN': 'ru',
-                    'ENGLISH': 'en',
-                    'SPANISH': 'es',
-                    'FRENCH': 'fr',
-                    'GERMAN': 'de'
-                }
-                target_lang_code = lang_map.get(options.get('target_lang', 'ru').upper(), options.get('target_lang', 'ru').lower())
-                provider = options.get('provider', 'api')
-                
-                # Преобразуем model (LARGE -> large-v3)
-                model_map = {
-                    'Tiny': 'tiny',
-                    'Base': 'base',
-                    'Small': 'small',
-                    'Medium': 'medium',
-                    'LARGE': 'large-v3'
-                }
-                model_size = model_map.get(options.get('model', 'LARGE'), options.get('model', 'large-v3').lower())
-                
-                # Преобразуем language для source_lang
-                source_lang = options.get('language')
-                if source_lang and source_lang.upper() == 'AUTO':
-                    source_lang = None
-                elif source_lang:
-                    source_lang = source_lang.lower()
-                
-                try:
-                    segments = translator.translate_segments(
-                        segments,
-                        target_lang=target_lang_code,
-                        source_lang=source_lang,
-                        model=model_size,
-                        use_fallback=(provider == 'api'),
-                        force_fallback=(provider == 'api')
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                add_log(f"✅ Перевод завершен")
-                processing_state['progress'] = 70
-                
-                # Сохраняем переведенную транскрипцию
-                video_dir = os.path.dirname(file_path)
-                video_name = os.path.splitext(os.path.basename(file_path))[0]
-                translated_transcript_path = os.path.join(video_dir, f"{video_name}_translated_{target_lang_code}_transcript.txt")
-                
-                # Получаем список спикеров из переведенных сегментов
-                translated_speakers_set = set(seg.get("speaker", "SPEAKER_UNKNOWN") for seg in segments)
-                
-                # Формируем переведенный текстовый сценарий
-                translated_transcript_text = f"СЦЕНАРИЙ (ПЕРЕВЕДЕННЫЙ НА {target_lang_code.upper()})\n"
-                translated_transcript_text += "=" * 50 + "\n\n"
-                
-                current_speaker = None
-                
-                def format_timestamp(seconds):
-                    m, s = divmod(seconds, 60)
-                    h, m = divmod(m, 60)
-                    return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
-                
-                for seg in segments:
-                    # Проверяем флаг остановки в цикле
-                    if processing_state['should_stop']:
-                        add_log("⏹️ Обработка остановлена пользователем")
-                        processing_state['is_processing'] = False
-                        processing_state['current_step'] = None
-                        processing_state['progress'] = 0
-                        return
-                    
-                    speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
-                    
-                    if speaker != current_speaker:
-                        translated_transcript_text += f"\n👤 {speaker} "
-                        current_speaker = speaker
-                    
-                    start_time = format_timestamp(float(seg.get("start", 0)))
-                    end_time = format_timestamp(float(seg.get("end", 0)))
-                    text = seg.get("text", "").strip()
-                    
-                    translated_transcript_text += f"[{start_time} -> {end_time}]: {text}\n"
-                
-                translated_transcript_text += "\n" + "=" * 50 + "\n"
-                translated_transcript_text += f"📊 СТАТИСТИКА:\n"
-                translated_transcript_text += f"- Всего спикеров: {len(translated_speakers_set)}\n"
-                translated_transcript_text += f"- Список спикеров: {', '.join(sorted(translated_speakers_set))}\n"
-                translated_transcript_text += f"- Сегментов со спикерами: {len(segments)}\n"
-                
-                with open(translated_transcript_path, 'w', encoding='utf-8') as f:
-                    f.write(translated_transcript_text)
-                add_log(f"💾 Переведенный сценарий сохранен: {translated_transcript_path}")
-            
-            if processing_state['should_stop']:
-                add_log("⏹️ Обработка остановлена пользователем")
-                processing_state['is_processing'] = False
-                processing_state['current_step'] = None
-                processing_state['progress'] = 0
-                return
-            
-            # Voice Cloning
-            if options.get('voice_cloning', False):
-                processing_state['current_step'] = 'voice_cloning'
-                processing_state['progress'] = 75
-                add_log("🎤 Запуск клонирования голоса...")
-                
-                # Проверяем флаг остановки перед voice cloning
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                cloner = VoiceCloner(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                speaker_samples = cloner.extract_speaker_samples(
-                    file_path,
-                    segments
-                )
-                
-                # Проверяем флаг остановки после извлечения образцов
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Преобразуем target_lang для voice cloning (RUSSIAN -> ru)
-                lang_map = {
-                    'RUSSIAN': 'ru',
-                    'ENGLISH': 'en',
-                    'SPANISH': 'es',
-                    'FRENCH': 'fr',
-                    'GERMAN': 'de',
-                    'ITALIAN': 'it',
-                    'PORTUGUESE': 'pt',
-                    'POLISH': 'pl',
-                    'TURKISH': 'tr',
-                    'DUTCH': 'nl',
-                    'CZECH': 'cs',
-                    'ARABIC': 'ar',
-                    'CHINESE': 'zh-cn',
-                    'HUNGARIAN': 'hu',
-                    'KOREAN': 'ko',
-                    'JAPANESE': 'ja',
-                    'HINDI': 'hi'
-                }
-                target_lang_for_voice = lang_map.get(options.get('target_lang', 'ru').upper(), options.get('target_lang', 'ru').lower())
-                
-                try:
-                    segments_with_audio = cloner.generate_dubbing(
-                        segments,
-                        speaker_samples,
-                        target_lang_for_voice
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Проверяем флаг остановки после генерации дубляжа
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Сохраняем файлы озвучки в папку Downloads
-                import shutil
-                downloads_dir = APP_PATHS['downloads']
-                video_name = os.path.splitext(os.path.basename(file_path))[0]
-                audio_output_dir = os.path.join(downloads_dir, f"{video_name}_audio")
-                os.makedirs(audio_output_dir, exist_ok=True)
-                
-                saved_count = 0
-                for i, seg in enumerate(segments_with_audio):
-                    # Проверяем флаг остановки в цикле
-                    if processing_state['should_stop']:
-                        add_log("⏹️ Обработка остановлена пользователем")
-                        processing_state['is_processing'] = False
-                        processing_state['current_step'] = None
-                        processing_state['progress'] = 0
-                        return
-                    
-                    audio_file = seg.get("audio_file")
-                    if audio_file and os.path.exists(audio_file):
-                        # Копируем файл в папку Downloads
-                        segment_filename = f"segment_{i:04d}_{seg.get('speaker', 'UNKNOWN')}.wav"
-                        dest_path = os.path.join(audio_output_dir, segment_filename)
-                        shutil.copy2(audio_file, dest_path)
-                        saved_count += 1
-                
-                if saved_count > 0:
-                    add_log(f"💾 Сохранено {saved_count} файлов озвучки в: {audio_output_dir}")
-                
-                processing_state['progress'] = 85
-                
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создание финального видео
-                processing_state['current_step'] = 'making_video'
-                processing_state['progress'] = 90
-                add_log("🎬 Создание финального видео...")
-                
-                # Проверяем флаг остановки перед созданием видео
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Создаем callback для проверки остановки
-                def check_should_stop():
-                    return processing_state.get('should_stop', False)
-                
-                video_maker = VideoMaker(
-                    progress_callback=add_log,
-                    should_stop_callback=check_should_stop
-                )
-                output_path = os.path.join(
-                    os.path.dirname(file_path),
-                    f"{os.path.splitext(os.path.basename(file_path))[0]}_dubbed.mp4"
-                )
-                
-                try:
-                    video_maker.make_video(
-                        file_path,
-                        segments_with_audio,
-                        output_path
-                    )
-                except InterruptedError:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                # Проверяем флаг остановки после создания видео
-                if processing_state['should_stop']:
-                    add_log("⏹️ Обработка остановлена пользователем")
-                    processing_state['is_processing'] = False
-                    processing_state['current_step'] = None
-                    processing_state['progress'] = 0
-                    return
-                
-                add_log(f"✅ Видео создано: {output_path}")
-        
-        processing_state['progress'] = 100
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-        add_log("✅ Обработка завершена!")
-        
-    except (InterruptedError, KeyboardInterrupt) as e:
-        add_log("⏹️ Обработка прервана пользователем")
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-        processing_state['progress'] = 0
-        processing_state['should_stop'] = False
-    except Exception as e:
-        add_log(f"❌ Ошибка: {str(e)}")
-        import traceback
-        add_log(traceback.format_exc())
-        processing_state['is_processing'] = False
-        processing_state['current_step'] = None
-        processing_state['progress'] = 0
-    finally:
-        # Всегда сбрасываем флаг остановки
-        processing_state['should_stop'] = False
+        for _name, handler, _workers in PROCESSING_STAGES:
+            if handler(ctx) is False:
+                break
+    except (Exception, KeyboardInterrupt) as e:
+        error = e
+    finish_job(ctx, error)
+
+def run_stages_pipelined(ctx):
+    """Проводит задачу через общий конвейер этапов и ждет ее завершения"""
+    begin_job(ctx)
+    ctx['state']['current_step'] = 'waiting'
+    error = None
+    try:
+        stage_pipeline.run(ctx)
+    except (Exception, KeyboardInterrupt) as e:
+        error = e
+    finish_job(ctx, error)
+
+def process_youtube_sync(url, quality, options, state=None, log=None):
+    """
+    Синхронная обработка YouTube видео (выполняется в отдельном потоке).
+    state/log - состояние и лог задачи (по умолчанию глобальные processing_state и add_log).
+    """
+    run_stages_sync(make_job_context('youtube', {'url': url, 'quality': quality, 'options': options}, state, log))
+
+def process_file_sync(file_path, options, state=None, log=None):
+    """
+    Синхронная обработка файла (выполняется в отдельном потоке).
+    state/log - состояние и лог задачи (по умолчанию глобальные processing_state и add_log).
+    """
+    run_stages_sync(make_job_context('file', {'file_path': file_path, 'options': options}, state, log))
+
+def run_job(job):
+    """Выполняет задачу из очереди (в потоке JobManager)"""
+    if job.should_stop():
+        return
+    ctx = make_job_context(job.kind, job.params, job.state, job.log, job_id=job.id)
+    if stage_pipeline is not None:
+        run_stages_pipelined(ctx)
+    else:
+        run_stages_sync(ctx)
+
+# Режим обработки: staged - общий конвейер этапов (разные задачи одновременно
+# на разных этапах), sequential - каждая задача проходит все этапы в своем потоке
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'staged').lower()
+
+if PIPELINE_MODE == 'staged':
+    stage_pipeline = StagePipeline(
+        [(name, handler, get_stage_workers(name, workers)) for name, handler, workers in PROCESSING_STAGES],
+        progress_callback=add_log
+    )
+    # Память ограничивают исполнители этапов (один Whisper, один XTTS), поэтому
+    # очередь задач допускает столько задач, сколько вмещает конвейер без блокировки
+    job_pool = ResourcePool(stage_pipeline.capacity(), ResourcePool.from_env().ram_budget_bytes)
+else:
+    stage_pipeline = None
+    job_pool = ResourcePool.from_env()
+
+# Очередь задач: несколько видео обрабатываются параллельно в пределах ресурсов
+job_manager = JobManager(run_job, job_pool, log_sink=add_log)
+
+def submit_job(kind, params):
+    """Ставит задачу в очередь и возвращает ее"""
+    options = params.get('options') or {}
+    ram_bytes = 0 if stage_pipeline is not None else estimate_job_ram(options)
+    job = job_manager.submit(kind, params, cpu_slots=1, ram_bytes=ram_bytes)
+    add_log(f"📥 Задача {job.id} в очереди ({job_manager.snapshot()['queued']} ожидают)")
+    return job
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
-    """Получить статус обработки"""
+    """Получить статус обработки (последняя запущенная из выполняющихся задач)"""
+    active = job_manager.active()
+    current = max(active, key=lambda job: job.started_at or 0) if active else None
+    snapshot = job_manager.snapshot()
+    return jsonify({
+        'is_processing': bool(active),
+        'current_step': current.state.get('current_step') if current else None,
+        'progress': current.state.get('progress', 0) if current else 0,
+        'job_id': current.id if current else None,
+        'running': snapshot['running'],
+        'queued': snapshot['queued'],
+        'stages': stage_pipeline.snapshot() if stage_pipeline is not None else []
+    })
+
+@app.route('/api/ollama/models', methods=['GET'])
+def get_ollama_models():
+    """Модели, загруженные в память Ollama, и текущая политика keep_alive"""
+    manager = OllamaManager()
     return jsonify({
-        'is_processing': processing_state['is_processing'],
-        'current_step': processing_state['current_step'],
-        'progress': processing_state['progress']
+        'running': manager.running_models(),
+        'keep_alive': get_keep_alive()
     })
 
+@app.route('/api/ollama/warm', methods=['POST'])
+def warm_ollama_model():
+    """Прогреть модель Ollama в фоне"""
+    data = request.json or {}
+    model = data.get('model') or os.getenv('OLLAMA_MODEL', 'qwen2.5:7b')
+    OllamaManager(progress_callback=add_log).warm_in_background(model)
+    return jsonify({'status': 'warming', 'model': model})
+
 @app.route('/api/stop', methods=['POST'])
 def stop_processing():
-    """Остановить обработку"""
-    global current_thread
-    
+    """Остановить обработку (все задачи)"""
     add_log("⏹️ Запрос на остановку обработки...")
     force_stop_all_processing()
     
@@ -1122,22 +1079,19 @@ def open_folder():
 
 def force_stop_all_processing():
     """Принудительно останавливает все процессы обработки"""
-    global current_thread
-    
     add_log("⏹️ Принудительная остановка всех процессов...")
+    job_manager.cancel_all()
     processing_state['should_stop'] = True
     processing_state['is_processing'] = False
     processing_state['current_step'] = None
     processing_state['progress'] = 0
     
-    # Принудительно останавливаем поток, если он еще работает
-    with process_lock:
-        if current_thread and current_thread.is_alive():
-            add_log("⏹️ Принудительное завершение потока обработки...")
-            # Поток будет проверять флаг и завершится сам
-            # Даем немного времени на корректное завершение
-            import time
-            time.sleep(0.5)
+    # Задачи проверяют флаг остановки и завершатся сами
+    if job_manager.active():
+        add_log("⏹️ Ожидание завершения задач...")
+        # Даем немного времени на корректное завершение
+        import time
+        time.sleep(0.5)
     
     add_log("⏹️ Все процессы остановлены")
 
@@ -1160,6 +1114,9 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 if __name__ == '__main__':
+    # Нужно для дочерних процессов (spawn) в упакованном exe
+    multiprocessing.freeze_support()
+    
     # Регистрируем обработчики сигналов для принудительного завершения
     # SIGTERM доступен на Unix-системах (Linux, macOS)
     if hasattr(signal, 'SIGTERM'):
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed кэш результатов этапов обработки.
+
+Ключ записи = sha256(имя этапа, версия, ключи входных артефактов, параметры
+этапа). Ключ исходного этапа строится из хэша содержимого видео, поэтому ключи
+всех следующих этапов зависят только от содержимого и параметров: при смене
+языка перевода транскрипция берется из кэша, а при смене голоса - еще и перевод.
+
+Запись - папка <ключ>/ с artifact.json (результат этапа) и файлами этапа
+(озвученные сегменты, собранная аудиодорожка).
+"""
+import os
+import json
+import shutil
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_VALUE_FILE = "artifact.json"
+# Временная папка записи старше этого считается брошенной (процесс упал во время put)
+_STALE_TMP_SECONDS = 3600
+
+
+def _json_default(value: Any):
+    """numpy скаляры и массивы (тайминги WhisperX) -> обычные числа и списки"""
+    if hasattr(value, "item"):
+        try:
+            return value.item()
+        except (ValueError, TypeError):
+            pass
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def hash_payload(payload: Any) -> str:
+    """Стабильный хэш JSON-сериализуемых данных"""
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False, default=_json_default).encode("utf-8")
+    ).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Кэш артефактов этапов. Размер ограничен, при переполнении удаляются
+    давно не использованные записи (LRU по времени доступа). Записи, с которыми
+    сейчас работают задачи (get/put с pin=True, до release), не удаляются.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size_bytes: int = 10 * 1024 ** 3,
+        progress_callback: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            cache_dir: Папка кэша
+            max_size_bytes: Максимальный суммарный размер кэша
+            progress_callback: Функция для логирования
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.progress_callback = progress_callback or (lambda msg: None)
+
+        self._lock = threading.Lock()
+        self._file_hashes = {}  # {путь: (mtime, size, sha256)}
+        self._entries = OrderedDict()  # {ключ: размер}, от давно использованных к свежим
+        self._pins = {}  # {ключ: сколько задач используют запись}
+        self._total_size = 0
+        self._load_index()
+
+    def _log(self, message: str):
+        """Внутренний метод для логирования"""
+        self.progress_callback(message)
+        logger.info(message)
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+    def _load_index(self):
+        """Восстанавливает LRU порядок по времени последнего доступа к записям"""
+        entries = []
+        now = time.time()
+        for path in self.cache_dir.iterdir():
+            value_path = path / _VALUE_FILE
+            try:
+                if path.is_dir() and value_path.exists():
+                    entries.append((value_path.stat().st_mtime, path.name, self._dir_size(path)))
+                elif path.name.endswith(".tmp") and now - path.stat().st_mtime > _STALE_TMP_SECONDS:
+                    # Недописанная запись (процесс прерван во время put). Свежие не трогаем:
+                    # их может прямо сейчас писать другой процесс с тем же кэшем
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_size += size
+
+    def file_sha256(self, path: str) -> str:
+        """Хэш содержимого файла (с мемоизацией по mtime/размеру)"""
+        stat = os.stat(path)
+        real_path = os.path.realpath(path)
+        cached = self._file_hashes.get(real_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        self._file_hashes[real_path] = (stat.st_mtime, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(stage: str, version: str, inputs: Dict[str, str], params: Optional[Dict] = None) -> str:
+        """
+        Ключ результата этапа.
+
+        Args:
+            stage: Имя этапа
+            version: Версия логики этапа (меняется, когда меняется результат при тех же входах)
+            inputs: {имя входного этапа: ключ его результата}
+            params: Параметры этапа (должны быть JSON-сериализуемы)
+        """
+        return hash_payload({
+            "stage": stage,
+            "version": version,
+            "inputs": inputs,
+            "params": params or {},
+        })
+
+    def get(self, key: str, pin: bool = False) -> Optional[Dict]:
+        """
+        Результат этапа из кэша. Пути в value["files"] указывают на файлы в кэше.
+
+        Args:
+            key: Ключ записи
+            pin: Не удалять запись до release(key) (файлы нужны следующим этапам)
+
+        Returns:
+            Результат или None при промахе
+        """
+        entry_dir = self._entry_dir(key)
+        value_path = entry_dir / _VALUE_FILE
+
+        with self._lock:
+            if key not in self._entries or not value_path.exists():
+                if not self._pins.get(key):
+                    self._total_size -= self._entries.pop(key, 0)
+                return None
+            self._entries.move_to_end(key)
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+
+        value = None
+        try:
+            with open(value_path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Время доступа хранит LRU порядок между запусками
+            os.utime(value_path, None)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать артефакт {key}: {e}")
+
+        files = (value or {}).get("files") or {}
+        if value is None or any(not (entry_dir / name).exists() for name in files.values()):
+            if pin:
+                self.release(key)
+            return None
+        value["files"] = {label: str(entry_dir / name) for label, name in files.items()}
+        return value
+
+    def put(self, key: str, value: Dict, pin: bool = False) -> Dict:
+        """
+        Сохраняет результат этапа. Файлы из value["files"] ({метка: путь})
+        копируются в запись.
+
+        Args:
+            key: Ключ записи
+            value: Результат этапа
+            pin: Не удалять запись до release(key)
+
+        Returns:
+            Результат, где value["files"] указывают на файлы в кэше
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = self.cache_dir / f".{key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        stored = dict(value)
+        stored_files = {}
+        try:
+            for index, (label, path) in enumerate((value.get("files") or {}).items()):
+                if not path or not os.path.exists(path):
+                    continue
+                name = f"{index:05d}{Path(path).suffix}"
+                # Копия, а не жесткая ссылка: исходные пути (temp_tts и т.п.)
+                # перезаписываются следующими задачами на месте
+                shutil.copyfile(path, tmp_dir / name)
+                stored_files[label] = name
+            stored["files"] = stored_files
+
+            with open(tmp_dir / _VALUE_FILE, "w", encoding="utf-8") as f:
+                json.dump(stored, f, ensure_ascii=False, default=_json_default)
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.warning(f"Не удалось записать артефакт {key}: {e}")
+            return value
+
+        size = self._dir_size(entry_dir)
+        with self._lock:
+            self._total_size -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_size += size
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+            self._evict()
+
+        stored["files"] = {label: str(entry_dir / name) for label, name in stored_files.items()}
+        return stored
+
+    def release(self, key: str):
+        """Снимает pin, поставленный get/put"""
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока размер не уложится в лимит"""
+        # Самую свежую запись не удаляем, даже если она одна больше лимита
+        for key in list(self._entries)[:-1]:
+            if self._total_size <= self.max_size_bytes:
+                break
+            if self._pins.get(key):
+                continue
+            self._total_size -= self._entries.pop(key)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "pinned": len(self._pins),
+                "size_bytes": self._total_size,
+            }
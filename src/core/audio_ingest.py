@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Audio Ingest Module
+Однократное декодирование исходного видео в 16 кГц моно float32.
+
+Результат сохраняется рядом с видео как сырой PCM (<имя файла>.audio16k.f32,
+с размером и временем изменения источника в <имя файла>.audio16k.f32.json) и
+открывается через memory-map, поэтому транскрипция, выравнивание и
+диаризация используют один и тот же массив вместо того, чтобы каждый раз
+заново запускать FFmpeg.
+
+Референсы спикеров для XTTS берутся не из этого кэша, а из источника в
+исходной частоте (extract_clip): XTTS считает кондиционирование на 22.05/24 кГц,
+и 16 кГц срезали бы у голоса все выше 8 кГц.
+"""
+import os
+import json
+import shutil
+import subprocess
+import threading
+import wave
+from pathlib import Path
+from typing import Optional, Callable
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Частота, которую ожидают Whisper, wav2vec2 и pyannote
+SAMPLE_RATE = 16000
+PCM_DTYPE = "<f4"
+CACHE_SUFFIX = ".audio16k.f32"
+SOURCE_INFO_SUFFIX = ".json"
+
+# Блокировки декодирования по пути кэша: параллельные задачи с одним файлом
+# декодируют его один раз, остальные ждут и берут готовый кэш
+_decode_locks = {}
+_decode_locks_guard = threading.Lock()
+
+
+def _decode_lock(cache_path: Path) -> threading.Lock:
+    with _decode_locks_guard:
+        return _decode_locks.setdefault(str(cache_path), threading.Lock())
+
+
+def find_ffmpeg() -> Optional[str]:
+    """Ищет путь к FFmpeg"""
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path:
+        return ffmpeg_path
+
+    for path in ("/usr/local/bin/ffmpeg", "/opt/homebrew/bin/ffmpeg", "/usr/bin/ffmpeg"):
+        if os.path.exists(path) and os.access(path, os.X_OK):
+            return path
+
+    return None
+
+
+def get_cache_path(media_path: str) -> Path:
+    """Путь к PCM кэшу рядом с исходным файлом (по полному имени: talk.mp4 и talk.mov - разные кэши)"""
+    source = Path(media_path)
+    return source.with_name(source.name + CACHE_SUFFIX)
+
+
+def _source_info(media_path: str) -> dict:
+    """Размер и время изменения источника, для которых декодирован кэш"""
+    stat = os.stat(media_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _source_info_path(cache_path: Path) -> Path:
+    return cache_path.with_name(cache_path.name + SOURCE_INFO_SUFFIX)
+
+
+def _is_cache_fresh(media_path: str, cache_path: Path) -> bool:
+    """Кэш валиден, если он не пустой и декодирован из файла с тем же размером и временем изменения"""
+    try:
+        if cache_path.stat().st_size == 0:
+            return False
+        with open(_source_info_path(cache_path), "r", encoding="utf-8") as f:
+            return json.load(f) == _source_info(media_path)
+    except (OSError, ValueError):
+        return False
+
+
+def decode_audio(
+    media_path: str,
+    progress_callback: Optional[Callable[[str], None]] = None
+) -> str:
+    """
+    Декодирует аудио дорожку в 16 кГц моно float32 (один раз на файл).
+
+    Args:
+        media_path: Путь к видео/аудио файлу
+        progress_callback: Функция для логирования
+
+    Returns:
+        Путь к PCM кэшу
+    """
+    log = progress_callback or (lambda msg: None)
+    cache_path = get_cache_path(media_path)
+
+    with _decode_lock(cache_path):
+        if _is_cache_fresh(media_path, cache_path):
+            log(f"♻️ Аудио уже декодировано: {cache_path.name}")
+            return str(cache_path)
+        return _decode_to_cache(media_path, cache_path, log)
+
+
+def _decode_to_cache(media_path: str, cache_path: Path, log: Callable[[str], None]) -> str:
+    """Запускает FFmpeg и атомарно публикует PCM кэш (вызывается под блокировкой пути)"""
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("FFmpeg не найден! Установите FFmpeg для декодирования аудио.")
+
+    log(f"🎼 Декодирование аудио (16 кГц моно)...")
+    # Имя уникально и для процесса, и для потока (другой процесс может декодировать тот же файл)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    source_info = _source_info(media_path)
+
+    cmd = [
+        ffmpeg_path,
+        "-nostdin",
+        "-y",
+        "-i", media_path,
+        "-vn",
+        "-ac", "1",
+        "-ar", str(SAMPLE_RATE),
+        "-f", "f32le",
+        str(tmp_path)
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        stderr_tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+        raise RuntimeError(f"Ошибка декодирования аудио: {stderr_tail}")
+
+    if not tmp_path.exists() or tmp_path.stat().st_size == 0:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise RuntimeError(f"Ошибка декодирования аудио: в файле нет аудио дорожки ({Path(media_path).name})")
+
+    os.replace(tmp_path, cache_path)
+    with open(_source_info_path(cache_path), "w", encoding="utf-8") as f:
+        json.dump(source_info, f)
+
+    duration = cache_path.stat().st_size / (4 * SAMPLE_RATE)
+    log(f"✅ Аудио декодировано: {duration:.1f} сек ({cache_path.name})")
+    return str(cache_path)
+
+
+def load_audio_array(cache_path: str) -> np.ndarray:
+    """
+    Открывает PCM кэш как memory-mapped массив.
+
+    Режим copy-on-write: потребители могут писать в массив (torch.from_numpy
+    требует записываемый буфер), а файл на диске при этом не меняется.
+    Пустой файл (np.memmap его не открывает) - пустой массив.
+    """
+    if os.path.getsize(cache_path) == 0:
+        return np.zeros(0, dtype=PCM_DTYPE)
+    return np.memmap(cache_path, dtype=PCM_DTYPE, mode="c")
+
+
+def ingest_audio(
+    media_path: str,
+    progress_callback: Optional[Callable[[str], None]] = None
+) -> tuple:
+    """
+    Декодирует (или берет из кэша) аудио и открывает его.
+
+    Returns:
+        (массив float32 16 кГц, путь к PCM кэшу)
+    """
+    cache_path = decode_audio(media_path, progress_callback)
+    return load_audio_array(cache_path), cache_path
+
+
+def write_wav(output_path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> str:
+    """Сохраняет float32 моно фрагмент в 16-bit PCM WAV"""
+    pcm = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+    pcm = np.rint(pcm * 32767.0).astype("<i2")
+
+    with wave.open(str(output_path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+
+    return str(output_path)
+
+
+def extract_clip(media_path: str, output_path: str, start: float, duration: float) -> str:
+    """
+    Вырезает фрагмент аудио из источника в 16-bit PCM WAV без передискретизации
+    (исходная частота и каналы; FFmpeg читает только нужный участок)
+    """
+    ffmpeg_path = find_ffmpeg()
+    if not ffmpeg_path:
+        raise RuntimeError("FFmpeg не найден! Установите FFmpeg для извлечения аудио.")
+
+    cmd = [
+        ffmpeg_path,
+        "-nostdin",
+        "-y",
+        "-ss", f"{max(0.0, start):.3f}",
+        "-t", f"{max(0.0, duration):.3f}",
+        "-i", media_path,
+        "-vn",
+        "-acodec", "pcm_s16le",
+        str(output_path)
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        stderr_tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+        raise RuntimeError(f"Ошибка извлечения аудио: {stderr_tail}")
+
+    return str(output_path)
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Audio Mixer Module
+Сборка аудио временной линии в одном предвыделенном NumPy буфере.
+
+Вместо pydub overlay (который на каждый сегмент пересоздает весь холст)
+сегменты добавляются в буфер на месте по смещению в сэмплах.
+"""
+import wave
+from pathlib import Path
+from typing import Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# XTTS v2 генерирует 24 кГц моно - используем ту же частоту для временной линии
+DEFAULT_SAMPLE_RATE = 24000
+
+# Размер блока при записи WAV (в сэмплах), чтобы не копировать весь буфер в bytes разом
+_WRITE_CHUNK_SAMPLES = 1 << 20
+
+
+def get_wav_duration(path: str) -> Optional[float]:
+    """
+    Длительность WAV файла по заголовку (без декодирования).
+
+    Returns:
+        Длительность в секундах или None, если файл не PCM WAV
+    """
+    try:
+        with wave.open(str(path), "rb") as wf:
+            rate = wf.getframerate()
+            if rate <= 0:
+                return None
+            return wf.getnframes() / float(rate)
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Линейная передискретизация (достаточно для речи при совпадающих в основном частотах)"""
+    if src_rate == dst_rate or samples.size == 0:
+        return samples
+    target_len = int(round(samples.size * dst_rate / float(src_rate)))
+    src_positions = np.linspace(0, samples.size - 1, num=target_len)
+    return np.interp(src_positions, np.arange(samples.size), samples).astype(np.float32)
+
+
+def _read_wav(path: str) -> Optional[tuple]:
+    """
+    Читает PCM WAV через стандартный модуль wave.
+
+    Returns:
+        (float32 моно в диапазоне [-1, 1], частота) или None для неподдерживаемого формата
+    """
+    try:
+        with wave.open(str(path), "rb") as wf:
+            channels = wf.getnchannels()
+            sample_width = wf.getsampwidth()
+            rate = wf.getframerate()
+            raw = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+    if sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        return None
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+
+    return samples, rate
+
+
+def load_audio(path: str, sample_rate: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    Загружает аудио как float32 моно с заданной частотой.
+
+    WAV читается напрямую, остальные форматы - через pydub (FFmpeg).
+    """
+    result = _read_wav(path)
+    if result is None:
+        from pydub import AudioSegment
+        audio = AudioSegment.from_file(path)
+        array = np.array(audio.get_array_of_samples(), dtype=np.float32)
+        array /= float(1 << (8 * audio.sample_width - 1))
+        if audio.channels > 1:
+            array = array.reshape(-1, audio.channels).mean(axis=1)
+        result = (array, audio.frame_rate)
+
+    samples, rate = result
+    return _resample(samples, rate, sample_rate)
+
+
+class AudioTimelineMixer:
+    """
+    Временная линия в одном int16 буфере.
+
+    Каждый сегмент суммируется с буфером на месте (в int32 только по своему
+    участку) с ограничением амплитуды, поэтому память на сегмент постоянна,
+    а итоговый файл пишется один раз.
+    """
+
+    def __init__(
+        self,
+        duration_sec: Optional[float] = None,
+        sample_rate: int = DEFAULT_SAMPLE_RATE
+    ):
+        """
+        Args:
+            duration_sec: Длительность временной линии. None - буфер растет по мере добавления
+            sample_rate: Частота дискретизации временной линии
+        """
+        self.sample_rate = sample_rate
+        self.fixed_length = duration_sec is not None
+        self.length = int(round(duration_sec * sample_rate)) if self.fixed_length else 0
+        capacity = self.length if self.fixed_length else sample_rate * 60
+        self._buffer = np.zeros(max(capacity, 1), dtype=np.int16)
+
+    @property
+    def duration_sec(self) -> float:
+        return self.length / float(self.sample_rate)
+
+    def _ensure_capacity(self, end: int):
+        """Увеличивает буфер (только для временной линии без фиксированной длины)"""
+        if end <= self._buffer.size:
+            return
+        new_size = max(end, self._buffer.size * 2)
+        grown = np.zeros(new_size, dtype=np.int16)
+        grown[:self.length] = self._buffer[:self.length]
+        self._buffer = grown
+
+    def add(
+        self,
+        samples: np.ndarray,
+        start_sec: float,
+        max_duration_sec: Optional[float] = None
+    ) -> int:
+        """
+        Добавляет float32 сэмплы в позицию start_sec.
+
+        Args:
+            samples: Моно сэмплы в диапазоне [-1, 1] с частотой временной линии
+            start_sec: Позиция начала в секундах
+            max_duration_sec: Обрезать сегмент до этой длительности
+
+        Returns:
+            Количество фактически добавленных сэмплов
+        """
+        offset = max(int(round(start_sec * self.sample_rate)), 0)
+
+        if max_duration_sec is not None:
+            samples = samples[:max(int(max_duration_sec * self.sample_rate), 0)]
+
+        end = offset + samples.size
+        if self.fixed_length:
+            end = min(end, self.length)
+        else:
+            self._ensure_capacity(end)
+            self.length = max(self.length, end)
+
+        count = end - offset
+        if count <= 0:
+            return 0
+
+        region = self._buffer[offset:end]
+        mixed = region.astype(np.int32)
+        mixed += np.rint(samples[:count] * 32767.0).astype(np.int32)
+        np.clip(mixed, -32768, 32767, out=mixed)
+        region[:] = mixed
+        return count
+
+    def add_file(
+        self,
+        path: str,
+        start_sec: float,
+        max_duration_sec: Optional[float] = None
+    ) -> int:
+        """Загружает аудио файл и добавляет его в позицию start_sec"""
+        return self.add(load_audio(path, self.sample_rate), start_sec, max_duration_sec)
+
+    def append_silence(self, duration_sec: float):
+        """Добавляет тишину в конец (для временной линии без фиксированной длины)"""
+        if self.fixed_length or duration_sec <= 0:
+            return
+        end = self.length + int(round(duration_sec * self.sample_rate))
+        self._ensure_capacity(end)
+        self.length = end
+
+    def write(self, output_path: str) -> str:
+        """Записывает временную линию в 16-bit PCM WAV"""
+        output_path_obj = Path(output_path)
+        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
+
+        with wave.open(str(output_path_obj), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            for pos in range(0, self.length, _WRITE_CHUNK_SAMPLES):
+                chunk = self._buffer[pos:min(pos + _WRITE_CHUNK_SAMPLES, self.length)]
+                wf.writeframes(chunk.astype("<i2", copy=False).tobytes())
+
+        return str(output_path_obj)
@@ -63,5 +63,36 @@ def open_folder(path):
     except Exception as e:
         print(f"Не удалось открыть папку: {e}")
 
+def get_available_memory_bytes():
+    """
+    Возвращает объем доступной оперативной памяти в байтах.
+    Если определить не удалось - возвращает None.
+    """
+    # psutil точнее всего, но он необязателен
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except Exception:
+        pass
+    
+    # Linux: MemAvailable учитывает кэш страниц, который можно освободить
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    
+    # macOS и прочие: свободных страниц нет в sysconf, берем половину физической памяти
+    try:
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        try:
+            return int(os.sysconf("SC_AVPHYS_PAGES") * page_size)
+        except (ValueError, OSError, AttributeError):
+            return int(os.sysconf("SC_PHYS_PAGES") * page_size // 2)
+    except (ValueError, OSError, AttributeError):
+        return None
+
 # Инициализируем пути при импорте
 APP_PATHS = get_app_paths()
\ No newline at end of file
@@ -1,13 +1,33 @@
 # -*- coding: utf-8 -*-
+import os
 import json
-import requests
 import logging
 import re
-from typing import List, Dict, Optional, Callable, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Any, Tuple
+
+from core.http_client import http_post
+from core.json_stream import stream_json_items
+from core.ollama_manager import get_keep_alive
 
 # Логирование
 logger = logging.getLogger(__name__)
 
+# Бюджет токенов на одно окно коррекции (вход + ожидаемый ответ, без системного промпта)
+DEFAULT_WINDOW_TOKENS = 3000
+# Перекрытие соседних окон (в сегментах)
+DEFAULT_WINDOW_OVERLAP = 6
+# Примерная цена ответа LLM на один сегмент ({"id": N, "speaker": "SPEAKER_XX"})
+_OUTPUT_TOKENS_PER_SEGMENT = 12
+# Сколько раз запрашивать сегменты, пропущенные в оборванном или неполном ответе
+MAX_CORRECTION_ATTEMPTS = 3
+
+# Предфильтр: короткая реплика ("Да", "Что?") - кандидат на смену спикера
+SHORT_REACTION_WORDS = 3
+SHORT_REACTION_SEC = 1.2
+# Сколько соседних сегментов отправлять вокруг кандидата для контекста
+CANDIDATE_CONTEXT = 1
+
 class SpeakerCorrector:
     """
     Класс для исправления ошибок присвоения спикеров с помощью LLM
@@ -18,11 +38,37 @@ class SpeakerCorrector:
         self,
         ollama_url: str = "http://localhost:11434",
         model: str = "qwen2.5:7b",
-        progress_callback: Optional[Callable[[str], None]] = None
+        progress_callback: Optional[Callable[[str], None]] = None,
+        window_tokens: Optional[int] = None,
+        window_overlap: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        prefilter: Optional[bool] = None
     ):
+        """
+        Args:
+            ollama_url: URL сервера Ollama
+            model: Модель Ollama
+            progress_callback: Функция для логирования
+            window_tokens: Бюджет токенов на окно (по умолчанию CORRECTOR_WINDOW_TOKENS или 3000)
+            window_overlap: Перекрытие окон в сегментах (по умолчанию CORRECTOR_WINDOW_OVERLAP или 6)
+            max_workers: Параллельных запросов к Ollama (по умолчанию CORRECTOR_WORKERS или 2)
+            prefilter: Отправлять в LLM только неоднозначные сегменты (по умолчанию CORRECTOR_PREFILTER или True)
+        """
         self.ollama_url = ollama_url.rstrip('/')
         self.model = model
         self.progress_callback = progress_callback or (lambda msg: None)
+        self.window_tokens = max(500, window_tokens or int(
+            os.getenv("CORRECTOR_WINDOW_TOKENS", str(DEFAULT_WINDOW_TOKENS))
+        ))
+        self.window_overlap = max(0, window_overlap if window_overlap is not None else int(
+            os.getenv("CORRECTOR_WINDOW_OVERLAP", str(DEFAULT_WINDOW_OVERLAP))
+        ))
+        self.max_workers = max(1, max_workers or int(os.getenv("CORRECTOR_WORKERS", "2")))
+        # Контекст модели: системный промпт + окно + ответ с запасом
+        self.num_ctx = int(os.getenv("CORRECTOR_NUM_CTX", "8192"))
+        if prefilter is None:
+            prefilter = os.getenv("CORRECTOR_PREFILTER", "1").lower() not in ("0", "false", "no")
+        self.prefilter = prefilter
     
     def _log(self, message: str):
         """Внутренний метод для логирования"""
@@ -163,9 +209,9 @@ class SpeakerCorrector:
             "they are ONE sentence = SAME speaker (use the speaker from the segment with comma).\n\n"
             
             "### OUTPUT FORMAT\n"
-            "Return a strictly valid JSON LIST of objects with 'id' and 'speaker'. "
+            "Return a JSON object with a 'segments' list of objects with 'id' and 'speaker', in input order. "
             "Example:\n"
-            "[{\"id\": 0, \"speaker\": \"SPEAKER_00\"}, {\"id\": 1, \"speaker\": \"SPEAKER_01\"}, {\"id\": 2, \"speaker\": \"SPEAKER_00\"}]\n"
+            "{\"segments\": [{\"id\": 0, \"speaker\": \"SPEAKER_00\"}, {\"id\": 1, \"speaker\": \"SPEAKER_01\"}, {\"id\": 2, \"speaker\": \"SPEAKER_00\"}]}\n"
             "CRITICAL: The output list MUST contain exactly the same number of items as the input. Return ALL segments.\n"
             "CRITICAL: When you detect grammatical continuity (comma + lowercase continuation), assign the SAME speaker to both segments, using the speaker from the segment that ENDS with comma.\n"
             "CRITICAL: Analyze the 'prev_text' and 'next_text' fields to understand context and detect split sentences."
@@ -199,116 +245,276 @@ class SpeakerCorrector:
                     if current['speaker'] != next_seg['speaker']:
                         self._log(f"   ❌ РАЗНЫЕ спикеры! LLM должен исправить это!")
         
-        try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "system": system_prompt,
-                    "prompt": json.dumps(simplified, ensure_ascii=False),
-                    "stream": False,
-                    "options": {"temperature": 0.1}
-                },
-                timeout=120
+        if self.prefilter:
+            candidates = self._select_candidates(segments_with_id)
+            skipped = len(simplified) - len(candidates)
+            self._log(
+                f"⏭️ Предфильтр: пропущено {skipped}/{len(simplified)} однозначных сегментов "
+                f"({skipped / len(simplified) * 100:.0f}%), в LLM: {len(candidates)}"
             )
-            
-            if response.status_code != 200:
-                self._log(f"⚠️ Ошибка Ollama: {response.status_code}")
+            if not candidates:
+                self._log("ℹ️ Неоднозначных сегментов нет - запрос к LLM не нужен")
                 return {}
+            simplified = [simplified[idx] for idx in candidates]
 
-            response_text = response.json().get("response", "").strip()
-            
-            # ОТЛАДКА: Показываем сырой ответ
-            self._log(f"📥 Получен ответ от LLM (длина: {len(response_text)} символов)")
-            if len(response_text) > 0:
-                preview_response = response_text[:500] if len(response_text) > 500 else response_text
-                self._log(f"📄 Начало ответа: {preview_response}...")
-            
-            # Чистка от Markdown
-            if "```" in response_text:
-                response_text = response_text.replace("```json", "").replace("```", "").strip()
-            
-            # Парсинг с улучшенной обработкой ошибок
-            data = None
+        # Допустимые значения спикера для схемы ответа
+        speakers = sorted({
+            seg.get("speaker") for seg in segments_with_id
+            if seg.get("speaker") and seg.get("speaker") != "SPEAKER_UNKNOWN"
+        })
+
+        windows = self._build_windows(simplified)
+        if len(windows) == 1:
+            result_map = self._request_correction(simplified, system_prompt, speakers)
+        else:
+            result_map = self._correct_windows(simplified, windows, system_prompt, speakers)
+
+        # ОТЛАДКА: Показываем детальную информацию
+        self._log(f"📥 LLM вернул {len(result_map)}/{len(simplified)} сегментов")
+        
+        if len(result_map) < len(simplified):
+            missing = len(simplified) - len(result_map)
+            self._log(f"⚠️ LLM не вернул {missing} сегментов - они останутся без изменений")
+        
+        # Показываем примеры исправлений
+        if result_map:
+            changes_examples = []
+            for seg_id, new_speaker in list(result_map.items())[:5]:  # Первые 5
+                if seg_id < len(segments_with_id):
+                    old_speaker = segments_with_id[seg_id].get("speaker", "UNKNOWN")
+                    if old_speaker != new_speaker:
+                        changes_examples.append(f"ID {seg_id}: {old_speaker} → {new_speaker}")
+            
+            if changes_examples:
+                self._log(f"📋 Примеры изменений: {', '.join(changes_examples)}")
+            else:
+                self._log(f"ℹ️ LLM подтвердил текущих спикеров (изменений нет)")
+        
+        return result_map
+
+    def _select_candidates(self, segments: List[Dict]) -> List[int]:
+        """
+        Локальная оценка неоднозначности: индексы сегментов, которые стоит
+        показать LLM (вместе с CANDIDATE_CONTEXT соседями).
+
+        Кандидаты: границы смены спикера, короткие реакции, грамматические
+        продолжения (как в _smart_merge), переходы вопрос → ответ и SPEAKER_UNKNOWN.
+        Длинные участки одного спикера без этих признаков пропускаются.
+        """
+        flagged = set()
+        for idx, seg in enumerate(segments):
+            text = seg.get("text", "").strip()
+            speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
+
+            if speaker == "SPEAKER_UNKNOWN":
+                flagged.add(idx)
+
+            duration = float(seg.get("end", 0)) - float(seg.get("start", 0))
+            if len(text.split()) <= SHORT_REACTION_WORDS or duration < SHORT_REACTION_SEC:
+                flagged.add(idx)
+
+            if idx == 0:
+                continue
+            prev = segments[idx - 1]
+            prev_text = prev.get("text", "").strip()
+            is_boundary = prev.get("speaker", "SPEAKER_UNKNOWN") != speaker
+            is_answer = prev_text.endswith("?")
+            is_continuation = self._detect_continuation(prev_text, text)["continues"]
+            if is_boundary or is_answer or is_continuation:
+                flagged.update((idx - 1, idx))
+
+        selected = set()
+        for idx in flagged:
+            low = max(0, idx - CANDIDATE_CONTEXT)
+            high = min(len(segments) - 1, idx + CANDIDATE_CONTEXT)
+            selected.update(range(low, high + 1))
+        return sorted(selected)
+
+    @staticmethod
+    def _estimate_tokens(item: Dict) -> int:
+        """Грубая оценка числа токенов сегмента (≈3 символа на токен для кириллицы)"""
+        return len(json.dumps(item, ensure_ascii=False)) // 3 + 1
+
+    def _build_windows(self, items: List[Dict]) -> List[Tuple[int, int]]:
+        """
+        Делит сегменты на перекрывающиеся окна по бюджету токенов.
+
+        Returns:
+            Список окон (start, end) - индексы в items, end не включается
+        """
+        costs = [self._estimate_tokens(item) + _OUTPUT_TOKENS_PER_SEGMENT for item in items]
+        windows = []
+        start = 0
+        while start < len(items):
+            end = start
+            used = 0
+            while end < len(items) and (end == start or used + costs[end] <= self.window_tokens):
+                used += costs[end]
+                end += 1
+            windows.append((start, end))
+            if end >= len(items):
+                break
+            # Следующее окно начинается с перекрытием, но всегда продвигается вперед
+            start = max(end - self.window_overlap, start + 1)
+        return windows
+
+    def _correct_windows(
+        self,
+        items: List[Dict],
+        windows: List[Tuple[int, int]],
+        system_prompt: str,
+        speakers: List[str]
+    ) -> Dict[int, str]:
+        """
+        Корректирует окна параллельно и сводит результаты.
+
+        В зоне перекрытия побеждает окно, в котором сегмент ближе к центру
+        (там у модели больше контекста с обеих сторон); при равенстве - более раннее окно.
+        """
+        workers = min(self.max_workers, len(windows))
+        self._log(
+            f"🪟 Коррекция окнами: {len(windows)} окон по ~{self.window_tokens} токенов, "
+            f"перекрытие {self.window_overlap} сегм., потоков: {workers}"
+        )
+
+        def run_window(number: int, window: Tuple[int, int]) -> Dict[int, str]:
+            start, end = window
+            label = f" (окно {number + 1}/{len(windows)})"
+            return self._request_correction(items[start:end], system_prompt, speakers, label)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            window_results = list(executor.map(run_window, range(len(windows)), windows))
+
+        result_map: Dict[int, str] = {}
+        best_distance: Dict[int, float] = {}
+        failed_windows = 0
+        for (start, end), window_map in zip(windows, window_results):
+            if not window_map:
+                failed_windows += 1
+                continue
+            center = (start + end - 1) / 2
+            for position in range(start, end):
+                seg_id = items[position]["id"]
+                if seg_id not in window_map:
+                    continue
+                distance = abs(position - center)
+                if seg_id not in best_distance or distance < best_distance[seg_id]:
+                    best_distance[seg_id] = distance
+                    result_map[seg_id] = window_map[seg_id]
+
+        if failed_windows:
+            self._log(f"⚠️ Окон без ответа LLM: {failed_windows}/{len(windows)} - их сегменты останутся без изменений")
+        return result_map
+
+    def _request_correction(
+        self,
+        items: List[Dict],
+        system_prompt: str,
+        speakers: List[str],
+        label: str = ""
+    ) -> Dict[int, str]:
+        """
+        Коррекция группы сегментов с перезапросом недостающих.
+
+        Ответ разбирается потоково; если он оборвался или модель пропустила
+        часть сегментов, повторно отправляются только недостающие id.
+
+        Returns:
+            Маппинг {id: speaker} (пустой при ошибке)
+        """
+        result_map: Dict[int, str] = {}
+        pending = items
+        for attempt in range(1, MAX_CORRECTION_ATTEMPTS + 1):
             try:
-                data = json.loads(response_text)
-                self._log(f"🔍 Распарсено: {type(data).__name__}")
-            except json.JSONDecodeError as e:
-                self._log(f"⚠️ Ошибка парсинга JSON: {e}")
-                
-                # Попытка 1: Исправить распространенные ошибки LLM
-                fixed_text = response_text
-                
-                # Исправляем двойные кавычки в ключах: {"id": 1": 10} → {"id": 10}
-                fixed_text = re.sub(r'"id":\s*(\d+)"\s*:\s*(\d+)', r'"id": \2', fixed_text)
-                
-                # Исправляем лишние кавычки: "id": "0" → "id": 0
-                fixed_text = re.sub(r'"id":\s*"(\d+)"', r'"id": \1', fixed_text)
-                
-                # Исправляем отсутствие запятых между объектами
-                fixed_text = re.sub(r'}\s*{', r'}, {', fixed_text)
-                
-                # Добавляем закрывающую скобку, если отсутствует
-                if not fixed_text.rstrip().endswith("]"):
-                    # Проверяем, что это список
-                    if fixed_text.strip().startswith("["):
-                        fixed_text = fixed_text.rstrip() + "]"
-                
-                try:
-                    data = json.loads(fixed_text)
-                    self._log(f"✅ JSON исправлен и распарсен")
-                except Exception as e2:
-                    self._log(f"⚠️ Первая попытка исправления не удалась: {e2}")
-                    
-                    # Попытка 2: Извлечь все объекты с помощью regex
-                    try:
-                        # Ищем все объекты вида {"id": X, "speaker": "Y"}
-                        pattern = r'\{"id"\s*:\s*(\d+)\s*,\s*"speaker"\s*:\s*"([^"]+)"\}'
-                        matches = re.findall(pattern, fixed_text)
-                        
-                        if matches:
-                            data = [{"id": int(m[0]), "speaker": m[1]} for m in matches]
-                            self._log(f"✅ JSON извлечен через regex: найдено {len(data)} сегментов")
-                        else:
-                            raise ValueError("Не найдено совпадений")
-                    except Exception as e3:
-                        self._log(f"❌ Не удалось распарсить ответ LLM после всех попыток: {e3}")
-                        self._log(f"📄 Проблемный текст (первые 500 символов): {response_text[:500]}...")
-                        return {}
-
-            # Преобразование в map {id: speaker}
-            result_map = {}
-            if isinstance(data, list):
-                for item in data:
-                    if "id" in item and "speaker" in item:
-                        result_map[item["id"]] = item["speaker"]
-            
-            # ОТЛАДКА: Показываем детальную информацию
-            self._log(f"📥 LLM вернул {len(result_map)}/{len(simplified)} сегментов")
-            
-            if len(result_map) < len(simplified):
-                missing = len(simplified) - len(result_map)
-                self._log(f"⚠️ LLM не вернул {missing} сегментов - они останутся без изменений")
-            
-            # Показываем примеры исправлений
-            if result_map:
-                changes_examples = []
-                for seg_id, new_speaker in list(result_map.items())[:5]:  # Первые 5
-                    if seg_id < len(segments_with_id):
-                        old_speaker = segments_with_id[seg_id].get("speaker", "UNKNOWN")
-                        if old_speaker != new_speaker:
-                            changes_examples.append(f"ID {seg_id}: {old_speaker} → {new_speaker}")
-                
-                if changes_examples:
-                    self._log(f"📋 Примеры изменений: {', '.join(changes_examples)}")
-                else:
-                    self._log(f"ℹ️ LLM подтвердил текущих спикеров (изменений нет)")
-            
-            return result_map
+                received, truncated = self._stream_correction(pending, system_prompt, speakers)
+            except Exception as e:
+                self._log(f"❌ Сбой запроса к LLM{label}: {e}")
+                break
+
+            result_map.update(received)
+            missing = [item for item in pending if item["id"] not in result_map]
+            truncated_info = " (ответ оборван)" if truncated else ""
+            self._log(f"📥 Получено от LLM{label}: {len(received)}/{len(pending)}{truncated_info}")
+
+            # Без прогресса перезапрашивать бессмысленно
+            if not missing or not received:
+                break
+            if attempt < MAX_CORRECTION_ATTEMPTS:
+                self._log(f"🔁 Перезапрос {len(missing)} недостающих сегментов{label}")
+            pending = missing
+
+        return result_map
+
+    def _stream_correction(
+        self,
+        items: List[Dict],
+        system_prompt: str,
+        speakers: List[str]
+    ) -> Tuple[Dict[int, str], bool]:
+        """
+        Один потоковый запрос к Ollama с JSON схемой ответа.
+
+        Returns:
+            (полученные {id: speaker}, был ли ответ оборван)
+        """
+        expected = {item["id"] for item in items}
+        received: Dict[int, str] = {}
+
+        def on_item(item: Dict) -> bool:
+            seg_id, speaker = item.get("id"), item.get("speaker")
+            if seg_id in expected and isinstance(speaker, str) and speaker:
+                received.setdefault(seg_id, speaker)
+            # Все получено - дальше не читаем
+            return len(received) < len(expected)
+
+        with http_post(
+            f"{self.ollama_url}/api/generate",
+            json={
+                "model": self.model,
+                "system": system_prompt,
+                "prompt": json.dumps(items, ensure_ascii=False),
+                "stream": True,
+                "keep_alive": get_keep_alive(),
+                "format": self._correction_schema(speakers),
+                "options": {
+                    "temperature": 0.1,
+                    "num_ctx": self.num_ctx,
+                    # Ограничение длины ответа: зациклившаяся модель обрывается быстро
+                    "num_predict": len(items) * _OUTPUT_TOKENS_PER_SEGMENT * 2 + 64,
+                }
+            },
+            timeout="long",
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Ошибка Ollama: {response.status_code}")
+            truncated = stream_json_items(response, on_item)
 
-        except Exception as e:
-            self._log(f"❌ Сбой запроса к LLM: {e}")
-            return {}
+        return received, truncated
+
+    @staticmethod
+    def _correction_schema(speakers: List[str]) -> Dict:
+        """JSON схема ответа коррекции (structured outputs Ollama)"""
+        speaker_schema: Dict[str, Any] = {"type": "string"}
+        if speakers:
+            speaker_schema["enum"] = speakers
+        return {
+            "type": "object",
+            "properties": {
+                "segments": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "speaker": speaker_schema,
+                        },
+                        "required": ["id", "speaker"],
+                    },
+                },
+            },
+            "required": ["segments"],
+        }
 
     def _apply_corrections(self, segments: List[Dict], correction_map: Dict[int, str]) -> List[Dict]:
         """Применяет исправления, не трогая тайминги"""
@@ -380,74 +586,18 @@ class SpeakerCorrector:
             current_text = current.get('text', '').strip()
             next_text = next_seg.get('text', '').strip()
             
-            # КРИТИЧНО: Если текущий сегмент заканчивается на запятую, а следующий продолжает грамматически
-            # - это ОДНО предложение, разбитое посередине = ОДИН спикер
-            ends_with_comma = current_text.endswith(',') or current_text.endswith('，')  # Запятая или китайская запятая
-            
-            # НОВОЕ: Проверяем незавершенные предложения (сегмент заканчивается на союз/предлог без пунктуации)
-            # НО: Будем осторожны - "А еще" может быть началом новой мысли другого спикера
-            current_text_lower = current_text.lower().strip()
-            
-            # КРИТИЧНО: Проверяем, есть ли перед "А еще" / "И еще" точка или другой знак завершения предложения
-            # Если есть - это НЕ продолжение, а новая мысль
-            has_sentence_end_before = bool(re.search(
-                r'[.!?]\s+(а\s+еще|и\s+еще|но\s+при|а\s+вот|и\s+вот)\s*$',
-                current_text_lower
-            ))
-            
-            # Проверка 1: Заканчивается на союз/предлог без пунктуации (но не после точки)
-            ends_with_single_conjunction = bool(re.search(
-                r'\s+(а|и|но|да|в|на|с|к|от|до|за|по|под|над|при|про|без|для|из|о|об|у|со|во|что|который|где|когда)\s*$',
-                current_text_lower
-            )) and not has_sentence_end_before
-            
-            # Проверка 2: Заканчивается на фразы типа "А еще", "И еще" (но не после точки)
-            ends_with_phrase = bool(re.search(
-                r'(а\s+еще|и\s+еще|но\s+при|а\s+вот|и\s+вот|а\s+вот\s+еще|и\s+вот\s+еще|а\s+потом|и\s+потом|а\s+теперь|и\s+теперь)\s*$',
-                current_text_lower
-            )) and not has_sentence_end_before
-            
-            # Проверка 3: Заканчивается на "еще" (но не после точки)
-            ends_with_еще = (current_text_lower.endswith('еще') or current_text_lower.endswith('ещё')) and not has_sentence_end_before
-            
-            ends_with_incomplete = ends_with_single_conjunction or ends_with_phrase or ends_with_еще
+            continuation = self._detect_continuation(current_text, next_text)
+            ends_with_comma = continuation["ends_with_comma"]
+            ends_with_incomplete = continuation["ends_with_incomplete"]
+            has_sentence_end_before = continuation["has_sentence_end_before"]
+            next_starts_lowercase = continuation["next_starts_lowercase"]
+            next_starts_russian_lowercase = continuation["next_starts_russian_lowercase"]
+            next_continues_grammatically = continuation["continues"]
             
             # ОТЛАДКА: Если обнаружили "А еще" после точки - это НЕ продолжение
             if has_sentence_end_before:
                 self._log(f"⚠️ Обнаружено 'А еще' после точки - это НЕ продолжение, а новая мысль: '{current_text[-50:]}'")
-            
-            # Проверяем грамматическое продолжение
-            if next_text and len(next_text) > 0:
-                next_first_char = next_text[0]
-                next_starts_lowercase = next_first_char.islower()  # С маленькой буквы
-                # Проверяем русские буквы (маленькие)
-                next_starts_russian_lowercase = bool(re.search(r'^[а-яё]', next_text))
-                # Проверяем союзы/местоимения/предлоги
-                next_starts_with_connector = bool(re.search(
-                    r'^(и|а|но|да|нет|что|который|где|когда|в|на|с|к|от|до|за|по|под|над|при|про|без|для|из|о|об|у|со|во)',
-                    next_text.lower()
-                ))
-            else:
-                next_starts_lowercase = False
-                next_starts_russian_lowercase = False
-                next_starts_with_connector = False
-            
-            # Грамматическое продолжение: 
-            # 1. Запятая + продолжение (маленькая буква или союз/местоимение)
-            # 2. НЕЗАВЕРШЕННОЕ предложение (союз/предлог без пунктуации) + продолжение
-            # НО: "А еще" после точки - это НЕ продолжение, а новая мысль
-            next_continues_grammatically = (
-                (ends_with_comma and (
-                    next_starts_lowercase or 
-                    next_starts_russian_lowercase or
-                    next_starts_with_connector
-                )) or
-                (ends_with_incomplete and not has_sentence_end_before and (
-                    next_starts_lowercase or 
-                    next_starts_russian_lowercase
-                ))
-            )
-            
+
             # ОТЛАДКА: Логируем обнаружение незавершенных предложений
             if ends_with_incomplete and not ends_with_comma:
                 self._log(f"🔍 Обнаружено незавершенное предложение: '{current_text[-50:]}'")
@@ -518,6 +668,91 @@ class SpeakerCorrector:
         
         return merged
     
+    def _detect_continuation(self, current_text: str, next_text: str) -> Dict[str, bool]:
+        """
+        Проверяет, продолжает ли next_text грамматически предложение current_text
+        (запятая или незавершенный союз/предлог + продолжение с маленькой буквы).
+
+        Returns:
+            Флаги: continues, ends_with_comma, ends_with_incomplete, has_sentence_end_before,
+            next_starts_lowercase, next_starts_russian_lowercase
+        """
+        current_text = (current_text or '').strip()
+        next_text = (next_text or '').strip()
+
+        # КРИТИЧНО: Если текущий сегмент заканчивается на запятую, а следующий продолжает грамматически
+        # - это ОДНО предложение, разбитое посередине = ОДИН спикер
+        ends_with_comma = current_text.endswith(',') or current_text.endswith('，')  # Запятая или китайская запятая
+        
+        # НОВОЕ: Проверяем незавершенные предложения (сегмент заканчивается на союз/предлог без пунктуации)
+        # НО: Будем осторожны - "А еще" может быть началом новой мысли другого спикера
+        current_text_lower = current_text.lower().strip()
+        
+        # КРИТИЧНО: Проверяем, есть ли перед "А еще" / "И еще" точка или другой знак завершения предложения
+        # Если есть - это НЕ продолжение, а новая мысль
+        has_sentence_end_before = bool(re.search(
+            r'[.!?]\s+(а\s+еще|и\s+еще|но\s+при|а\s+вот|и\s+вот)\s*$',
+            current_text_lower
+        ))
+        
+        # Проверка 1: Заканчивается на союз/предлог без пунктуации (но не после точки)
+        ends_with_single_conjunction = bool(re.search(
+            r'\s+(а|и|но|да|в|на|с|к|от|до|за|по|под|над|при|про|без|для|из|о|об|у|со|во|что|который|где|когда)\s*$',
+            current_text_lower
+        )) and not has_sentence_end_before
+        
+        # Проверка 2: Заканчивается на фразы типа "А еще", "И еще" (но не после точки)
+        ends_with_phrase = bool(re.search(
+            r'(а\s+еще|и\s+еще|но\s+при|а\s+вот|и\s+вот|а\s+вот\s+еще|и\s+вот\s+еще|а\s+потом|и\s+потом|а\s+теперь|и\s+теперь)\s*$',
+            current_text_lower
+        )) and not has_sentence_end_before
+        
+        # Проверка 3: Заканчивается на "еще" (но не после точки)
+        ends_with_еще = (current_text_lower.endswith('еще') or current_text_lower.endswith('ещё')) and not has_sentence_end_before
+        
+        ends_with_incomplete = ends_with_single_conjunction or ends_with_phrase or ends_with_еще
+        
+        # Проверяем грамматическое продолжение
+        if next_text and len(next_text) > 0:
+            next_first_char = next_text[0]
+            next_starts_lowercase = next_first_char.islower()  # С маленькой буквы
+            # Проверяем русские буквы (маленькие)
+            next_starts_russian_lowercase = bool(re.search(r'^[а-яё]', next_text))
+            # Проверяем союзы/местоимения/предлоги
+            next_starts_with_connector = bool(re.search(
+                r'^(и|а|но|да|нет|что|который|где|когда|в|на|с|к|от|до|за|по|под|над|при|про|без|для|из|о|об|у|со|во)',
+                next_text.lower()
+            ))
+        else:
+            next_starts_lowercase = False
+            next_starts_russian_lowercase = False
+            next_starts_with_connector = False
+        
+        # Грамматическое продолжение: 
+        # 1. Запятая + продолжение (маленькая буква или союз/местоимение)
+        # 2. НЕЗАВЕРШЕННОЕ предложение (союз/предлог без пунктуации) + продолжение
+        # НО: "А еще" после точки - это НЕ продолжение, а новая мысль
+        next_continues_grammatically = (
+            (ends_with_comma and (
+                next_starts_lowercase or 
+                next_starts_russian_lowercase or
+                next_starts_with_connector
+            )) or
+            (ends_with_incomplete and not has_sentence_end_before and (
+                next_starts_lowercase or 
+                next_starts_russian_lowercase
+            ))
+        )
+
+        return {
+            "continues": next_continues_grammatically,
+            "ends_with_comma": ends_with_comma,
+            "ends_with_incomplete": ends_with_incomplete,
+            "has_sentence_end_before": has_sentence_end_before,
+            "next_starts_lowercase": next_starts_lowercase,
+            "next_starts_russian_lowercase": next_starts_russian_lowercase,
+        }
+    
     def _fix_unknown_speakers(self, segments: List[Dict]) -> List[Dict]:
         """Исправляет SPEAKER_UNKNOWN, заменяя на ближайшего спикера"""
         if not segments:
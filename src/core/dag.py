@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Граф этапов обработки с кэшем артефактов.
+
+Каждый этап объявляет входные этапы и свои параметры. Перед запуском этапа
+вычисляется его ключ (ключи входов + параметры, см. core.artifact_cache);
+если результат с таким ключом уже есть - в этой задаче или в кэше - этап не
+выполняется. В лог пишется, какие этапы выполнены, а какие взяты из кэша.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+import logging
+
+from core.artifact_cache import ArtifactCache
+
+logger = logging.getLogger(__name__)
+
+
+class DagStage:
+    """
+    Этап графа.
+
+    run(ctx, inputs) получает контекст задачи и {имя входа: результат} и
+    возвращает JSON-сериализуемый словарь; файлы результата перечисляются
+    в value["files"] ({метка: путь}) и сохраняются в кэше вместе с ним.
+    Результат с value["no_cache"] = True не сохраняется (например, выравнивание,
+    которое не удалось и было пропущено).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Dict, Dict[str, Dict]], Dict],
+        inputs: Iterable[str] = (),
+        params: Optional[Callable[[Dict], Dict]] = None,
+        version: str = "1",
+        cache: bool = True,
+        is_valid: Optional[Callable[[Dict, Dict], bool]] = None
+    ):
+        """
+        Args:
+            name: Имя этапа
+            run: Функция этапа
+            inputs: Имена этапов, результаты которых нужны на входе
+            params: Параметры этапа из контекста задачи (входят в ключ)
+            version: Версия логики этапа (входит в ключ)
+            cache: Сохранять результат в кэш артефактов
+            is_valid: Проверка результата из кэша перед использованием (ctx, value)
+        """
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.params = params or (lambda ctx: {})
+        self.version = version
+        self.cache = cache
+        self.is_valid = is_valid
+
+
+class DagExecutor:
+    """
+    Выполняет нужную часть графа для запрошенных этапов.
+
+    Результаты и ключи хранятся в контексте задачи (ctx["artifacts"],
+    ctx["artifact_keys"]), так что повторный вызов для следующих этапов
+    (например, из конвейера этапов) не пересчитывает уже полученное.
+    Записи кэша, на которые ссылаются результаты, закреплены до release(ctx),
+    чтобы их файлы не удалил LRU другой задачи.
+    Независимые этапы (транскрипция и диаризация) могут выполняться
+    параллельно, если max_workers > 1.
+    """
+
+    def __init__(
+        self,
+        stages: List[DagStage],
+        cache: Optional[ArtifactCache] = None,
+        max_workers: Optional[int] = None
+    ):
+        """
+        Args:
+            stages: Этапы графа
+            cache: Кэш артефактов (None - без кэша между задачами)
+            max_workers: Сколько независимых этапов выполнять одновременно
+                (по умолчанию DAG_WORKERS или 1)
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"Этап {stage.name}: неизвестные входы {missing}")
+        self.cache = cache
+        self.max_workers = max(1, max_workers or int(os.getenv("DAG_WORKERS", "1")))
+
+    def _required(self, targets: Iterable[str]) -> List[str]:
+        """Этапы, нужные для targets, в порядке зависимостей"""
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Цикл в графе этапов: {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def run(self, ctx: Dict, targets: Iterable[str], log: Optional[Callable[[str], None]] = None) -> Dict[str, Dict]:
+        """
+        Получает результаты этапов targets (выполняя или беря из кэша нужные этапы).
+
+        Returns:
+            {имя этапа: результат} для всех затронутых этапов
+        """
+        log = log or ctx.get("log") or (lambda msg: None)
+        artifacts = ctx.setdefault("artifacts", {})
+        keys = ctx.setdefault("artifact_keys", {})
+        pending = [name for name in self._required(targets) if name not in artifacts]
+        executed, reused = [], []
+
+        while pending:
+            ready = [name for name in pending if all(dep in artifacts for dep in self.stages[name].inputs)]
+            batch = ready[:self.max_workers]
+            if len(batch) > 1:
+                with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+                    outcomes = list(pool.map(lambda name: self._resolve(ctx, name), batch))
+            else:
+                outcomes = [self._resolve(ctx, batch[0])]
+
+            for name, (key, value, from_cache) in zip(batch, outcomes):
+                keys[name] = key
+                artifacts[name] = value
+                (reused if from_cache else executed).append(name)
+                pending.remove(name)
+
+        if reused:
+            log(f"♻️ Этапы из кэша: {', '.join(reused)}")
+        if executed:
+            log(f"▶️ Выполнены этапы: {', '.join(executed)}")
+        return {name: artifacts[name] for name in self._required(targets)}
+
+    def _resolve(self, ctx: Dict, name: str):
+        """(ключ, результат, взят ли из кэша) для одного этапа"""
+        stage = self.stages[name]
+        inputs = {dep: ctx["artifacts"][dep] for dep in stage.inputs}
+        key = ArtifactCache.make_key(
+            name,
+            stage.version,
+            {dep: ctx["artifact_keys"][dep] for dep in stage.inputs},
+            stage.params(ctx)
+        )
+
+        pins = ctx.setdefault("artifact_pins", [])
+        if stage.cache and self.cache is not None:
+            value = self.cache.get(key, pin=True)
+            if value is not None:
+                if stage.is_valid is None or stage.is_valid(ctx, value):
+                    pins.append(key)
+                    return key, value, True
+                self.cache.release(key)
+
+        value = stage.run(ctx, inputs) or {}
+        volatile = value.pop("no_cache", False)
+        if stage.cache and self.cache is not None and not volatile:
+            value = self.cache.put(key, value, pin=True)
+            pins.append(key)
+        return key, value, False
+
+    def release(self, ctx: Dict):
+        """Открепляет записи кэша задачи (после завершения всех ее этапов)"""
+        pins = ctx.pop("artifact_pins", [])
+        if self.cache is not None:
+            for key in pins:
+                self.cache.release(key)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Diarization Worker Module
+Диаризация (PyAnnote) в отдельном процессе, параллельно с транскрипцией.
+
+Процесс получает путь к PCM кэшу (core.audio_ingest), а не массив,
+поэтому аудио не копируется между процессами - оба открывают один memory-map.
+"""
+import multiprocessing
+import queue
+import traceback
+from typing import Callable, Optional
+
+
+def _diarization_entry(
+    audio_cache: str,
+    hf_token: str,
+    device: str,
+    num_threads: int,
+    min_speakers: Optional[int],
+    max_speakers: Optional[int],
+    num_speakers: Optional[int],
+    result_queue
+):
+    """Точка входа дочернего процесса"""
+    try:
+        import torch
+        torch.set_num_threads(max(1, num_threads))
+
+        # Импорт transcriber применяет патч torch.load, нужный pyannote
+        import core.transcriber  # noqa: F401
+        from core.audio_ingest import load_audio_array
+        from whisperx import diarize
+
+        audio = load_audio_array(audio_cache)
+        diarize_model = diarize.DiarizationPipeline(
+            use_auth_token=hf_token,
+            device=device
+        )
+        diarize_segments = diarize_model(
+            audio,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+            num_speakers=num_speakers
+        )
+        result_queue.put(("ok", diarize_segments))
+    except Exception as e:
+        result_queue.put(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+class DiarizationProcess:
+    """
+    Диаризация в фоновом процессе (spawn - безопасно для torch/CUDA и macOS).
+    """
+
+    def __init__(
+        self,
+        audio_cache: str,
+        hf_token: str,
+        device: str = "cpu",
+        num_threads: int = 1,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+        num_speakers: Optional[int] = None
+    ):
+        ctx = multiprocessing.get_context("spawn")
+        self._queue = ctx.Queue()
+        self._process = ctx.Process(
+            target=_diarization_entry,
+            args=(
+                audio_cache, hf_token, device, num_threads,
+                min_speakers, max_speakers, num_speakers, self._queue
+            ),
+            daemon=True
+        )
+
+    def start(self):
+        self._process.start()
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def result(self, should_stop: Optional[Callable[[], bool]] = None, poll_interval: float = 1.0):
+        """
+        Ждет результат диаризации.
+
+        Returns:
+            DataFrame сегментов диаризации
+
+        Raises:
+            InterruptedError: если пользователь остановил обработку
+            RuntimeError: если процесс диаризации завершился с ошибкой
+        """
+        while True:
+            if should_stop and should_stop():
+                self.stop()
+                raise InterruptedError("Processing stopped by user")
+            try:
+                # Читаем очередь до join: иначе большой результат может заблокировать процесс
+                status, payload = self._queue.get(timeout=poll_interval)
+                break
+            except queue.Empty:
+                if not self._process.is_alive():
+                    # Результат мог прийти между таймаутом get и проверкой процесса
+                    try:
+                        status, payload = self._queue.get(timeout=poll_interval)
+                        break
+                    except queue.Empty:
+                        raise RuntimeError(
+                            f"Процесс диаризации завершился без результата (код {self._process.exitcode})"
+                        )
+
+        self._process.join(timeout=10)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def stop(self):
+        """Завершает процесс диаризации"""
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(timeout=5)
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+"""
+Приём локальных видео без копирования через HTTP.
+
+Десктопный фронтенд знает путь к файлу, поэтому вместо загрузки многогигабайтного
+видео через Flask (в память, во временный файл и снова на диск) сервер получает
+путь, проверяет, что он внутри разрешенных папок (INGEST_ALLOWED_ROOTS), и
+помещает файл в папку проекта без копирования данных:
+
+1. жесткая ссылка (тот же том);
+2. reflink / clonefile (copy-on-write: Btrfs, XFS, APFS);
+3. символическая ссылка;
+4. обработка файла на месте (результаты пишутся рядом с исходником).
+
+Для настоящих загрузок (браузер без доступа к пути) - загрузка частями с
+возобновлением: сервер пишет части в .part файл по смещению и считает SHA-256
+на лету, без повторного чтения файла.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import shutil
+import platform
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+import logging
+
+from core.config import APP_PATHS
+
+logger = logging.getLogger(__name__)
+
+# Способы помещения файла в папку проекта
+INGEST_HARDLINK = "hardlink"
+INGEST_REFLINK = "reflink"
+INGEST_SYMLINK = "symlink"
+INGEST_REFERENCE = "reference"
+INGEST_IN_PLACE = "in_place"
+
+# Размер блока при чтении тела запроса загрузки
+UPLOAD_READ_BYTES = 1024 * 1024
+# Рекомендуемый размер части для клиента
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+# ioctl FICLONE (linux/fs.h): клонирование содержимого файла (Btrfs, XFS, OCFS2)
+_FICLONE = 0x40049409
+
+
+class IngestError(Exception):
+    """Ошибка приёма файла; status - HTTP код для ответа API"""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def _default_roots() -> List[Path]:
+    """Папки загрузок и видео пользователя (Movies на macOS)"""
+    home = Path.home()
+    roots = [home / "Downloads", home / "Videos"]
+    if platform.system() == "Darwin":
+        roots.append(home / "Movies")
+    return roots
+
+
+def get_allowed_roots() -> List[Path]:
+    """
+    Папки, из которых разрешено брать локальные файлы.
+    INGEST_ALLOWED_ROOTS - список через os.pathsep (":" или ";" на Windows),
+    по умолчанию папки загрузок и видео пользователя (не вся домашняя папка:
+    иначе через API можно прочитать ~/.ssh и подобное). Папка Downloads
+    приложения разрешена всегда (туда попадают завершенные загрузки).
+    """
+    value = os.getenv("INGEST_ALLOWED_ROOTS", "")
+    roots = [Path(p).expanduser() for p in value.split(os.pathsep) if p.strip()] or _default_roots()
+    roots.append(Path(APP_PATHS["downloads"]))
+
+    resolved = []
+    for root in roots:
+        try:
+            resolved.append(root.resolve())
+        except OSError:
+            continue
+    return resolved
+
+
+def _is_within(path: Path, root: Path) -> bool:
+    try:
+        return os.path.commonpath([str(path), str(root)]) == str(root)
+    except ValueError:
+        # Разные диски на Windows
+        return False
+
+
+def resolve_local_path(path: str) -> Path:
+    """
+    Проверяет путь к локальному файлу: существует, это файл, и он (после
+    раскрытия символических ссылок) лежит внутри разрешенных папок.
+    """
+    if not path:
+        raise IngestError("Path is required")
+    try:
+        resolved = Path(path).expanduser().resolve(strict=True)
+    except (OSError, RuntimeError):
+        raise IngestError(f"File not found: {path}", status=404)
+    if not resolved.is_file():
+        raise IngestError(f"Not a file: {path}")
+    if not any(_is_within(resolved, root) for root in get_allowed_roots()):
+        raise IngestError(f"Path is outside of allowed folders: {path}", status=403)
+    return resolved
+
+
+def get_project_dir(filename: str) -> Path:
+    """Папка проекта для локального файла (как для загрузки): Downloads/<имя>_local"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    project_dir = Path(APP_PATHS["downloads"]) / f"{name}_local"
+    project_dir.mkdir(parents=True, exist_ok=True)
+    return project_dir
+
+
+def try_reflink(src: Path, dst: Path) -> bool:
+    """
+    Copy-on-write копия: данные не копируются, блоки общие до первой записи.
+    Linux - ioctl FICLONE, macOS - clonefile(). Возвращает False, если ФС не умеет.
+    """
+    system = platform.system()
+    if system == "Linux":
+        try:
+            import fcntl
+            with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            return True
+        except (OSError, ImportError):
+            if dst.exists():
+                dst.unlink()
+            return False
+    if system == "Darwin":
+        try:
+            import ctypes
+            libc = ctypes.CDLL("libc.dylib", use_errno=True)
+            return libc.clonefile(os.fsencode(str(src)), os.fsencode(str(dst)), 0) == 0
+        except (OSError, AttributeError):
+            return False
+    return False
+
+
+def ingest_local_file(path: str, progress_callback: Optional[Callable[[str], None]] = None) -> Tuple[str, str]:
+    """
+    Помещает локальный файл в папку проекта без копирования данных.
+
+    Returns:
+        (путь для обработки, способ: hardlink / reflink / symlink / reference / in_place)
+    """
+    src = resolve_local_path(path)
+    project_dir = get_project_dir(src.name)
+
+    if src.parent == project_dir.resolve():
+        method = INGEST_IN_PLACE
+        dst = src
+    else:
+        dst = project_dir / src.name
+        if dst.is_symlink() or dst.exists():
+            if dst.exists() and os.path.samefile(src, dst):
+                # Тот же файл уже связан с проектом (повторная обработка)
+                return str(dst), INGEST_SYMLINK if dst.is_symlink() else INGEST_HARDLINK
+            dst.unlink()
+
+        method = INGEST_REFERENCE
+        try:
+            os.link(src, dst)
+            method = INGEST_HARDLINK
+        except OSError:
+            if try_reflink(src, dst):
+                method = INGEST_REFLINK
+            else:
+                try:
+                    os.symlink(src, dst)
+                    method = INGEST_SYMLINK
+                except (OSError, NotImplementedError):
+                    # Windows без прав на symlink: обрабатываем исходный файл на месте
+                    dst = src
+
+    message = {
+        INGEST_HARDLINK: "🔗 Файл подключен жесткой ссылкой",
+        INGEST_REFLINK: "🔗 Файл подключен copy-on-write копией",
+        INGEST_SYMLINK: "🔗 Файл подключен символической ссылкой",
+        INGEST_REFERENCE: "📄 Файл обрабатывается на месте",
+        INGEST_IN_PLACE: "📄 Файл уже в папке проекта",
+    }[method]
+    if progress_callback:
+        progress_callback(f"{message}: {dst}")
+    logger.info(f"{message}: {src} -> {dst}")
+    return str(dst), method
+
+
+class UploadManager:
+    """
+    Загрузки частями с возобновлением.
+
+    Каждая загрузка - <id>.part (данные) и <id>.json (имя, размер, смещение)
+    в папке Temp/uploads. Части принимаются строго по порядку (offset должен
+    совпадать с уже полученным объемом), поэтому SHA-256 считается на лету.
+    После перезапуска сервера загрузка продолжается с сохраненного смещения,
+    хэш восстанавливается однократным чтением уже полученной части файла.
+    """
+
+    def __init__(self, upload_dir: Optional[Path] = None):
+        self.upload_dir = Path(upload_dir or Path(APP_PATHS["temp"]) / "uploads")
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._hashers: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check_id(upload_id: str):
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            raise IngestError(f"Upload not found: {upload_id}", status=404)
+
+    def _part_path(self, upload_id: str) -> Path:
+        return self.upload_dir / f"{upload_id}.part"
+
+    def _meta_path(self, upload_id: str) -> Path:
+        return self.upload_dir / f"{upload_id}.json"
+
+    def _save_meta(self, session: Dict[str, Any]):
+        meta_path = self._meta_path(session["id"])
+        tmp_path = meta_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def create(self, filename: str, size: int) -> Dict[str, Any]:
+        """Начинает загрузку и возвращает ее описание"""
+        filename = os.path.basename(filename or "")
+        if not filename or filename in (".", ".."):
+            raise IngestError("Filename is required")
+        if size is None or isinstance(size, bool):
+            raise IngestError("Size is required")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise IngestError(f"Invalid size: {size!r}")
+        if size < 0:
+            raise IngestError(f"Invalid size: {size}")
+
+        upload_id = uuid.uuid4().hex
+        session = {
+            "id": upload_id,
+            "filename": filename,
+            "size": size,
+            "offset": 0,
+            "sha256": None,
+            "created_at": time.time(),
+        }
+        self._part_path(upload_id).touch()
+        self._save_meta(session)
+        with self._lock:
+            self._sessions[upload_id] = session
+            self._hashers[upload_id] = hashlib.sha256()
+        return dict(session)
+
+    def get(self, upload_id: str) -> Dict[str, Any]:
+        """Описание загрузки (из памяти или из .json после перезапуска)"""
+        self._check_id(upload_id)
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+
+        meta_path = self._meta_path(upload_id)
+        if not meta_path.exists():
+            raise IngestError(f"Upload not found: {upload_id}", status=404)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            session = json.load(f)
+
+        # Фактический размер .part важнее сохраненного смещения (запись могла оборваться)
+        part_path = self._part_path(upload_id)
+        session["offset"] = min(session["offset"], part_path.stat().st_size) if part_path.exists() else 0
+        with self._lock:
+            self._sessions.setdefault(upload_id, session)
+            return self._sessions[upload_id]
+
+    def _hasher(self, session: Dict[str, Any]):
+        """Хэш уже полученных данных (после перезапуска - дочитываем .part один раз)"""
+        upload_id = session["id"]
+        hasher = self._hashers.get(upload_id)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            remaining = session["offset"]
+            with open(self._part_path(upload_id), "rb") as f:
+                while remaining > 0:
+                    block = f.read(min(UPLOAD_READ_BYTES, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+            self._hashers[upload_id] = hasher
+        return hasher
+
+    def write_chunk(self, upload_id: str, offset: int, stream: BinaryIO) -> Dict[str, Any]:
+        """
+        Дописывает часть из потока (тело запроса) с позиции offset.
+        Если offset не совпадает с полученным объемом - IngestError 409 с текущим смещением,
+        клиент продолжает с него.
+        """
+        with self._session_lock(upload_id):
+            session = self.get(upload_id)
+            if session["sha256"]:
+                raise IngestError("Upload is already complete", status=409, offset=session["offset"])
+            if offset != session["offset"]:
+                raise IngestError("Offset mismatch", status=409, offset=session["offset"])
+
+            hasher = self._hasher(session)
+            try:
+                with open(self._part_path(upload_id), "r+b") as f:
+                    f.seek(offset)
+                    f.truncate()
+                    while True:
+                        block = stream.read(UPLOAD_READ_BYTES)
+                        if not block:
+                            break
+                        if session["offset"] + len(block) > session["size"]:
+                            raise IngestError("Upload exceeds declared size", status=413, offset=session["offset"])
+                        f.write(block)
+                        hasher.update(block)
+                        session["offset"] += len(block)
+            finally:
+                # Смещение сохраняем даже при обрыве соединения - продолжим с него
+                self._save_meta(session)
+            return dict(session)
+
+    def complete(self, upload_id: str, expected_sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Завершает загрузку: проверяет размер и хэш, переносит файл в папку проекта.
+
+        Returns:
+            Описание загрузки с file_path и sha256
+        """
+        with self._session_lock(upload_id):
+            session = self.get(upload_id)
+            if session["offset"] != session["size"]:
+                raise IngestError("Upload is incomplete", status=409, offset=session["offset"])
+
+            sha256 = self._hasher(session).hexdigest()
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                raise IngestError("Checksum mismatch", status=422, sha256=sha256)
+
+            project_dir = get_project_dir(session["filename"])
+            file_path = project_dir / session["filename"]
+            # Temp и Downloads обычно на одном томе - перенос без копирования
+            shutil.move(str(self._part_path(upload_id)), str(file_path))
+
+            session["sha256"] = sha256
+            session["file_path"] = str(file_path)
+            self._meta_path(upload_id).unlink(missing_ok=True)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+                self._hashers.pop(upload_id, None)
+                self._locks.pop(upload_id, None)
+            return dict(session)
+
+    def abort(self, upload_id: str):
+        """Отменяет загрузку и удаляет полученные данные"""
+        self._check_id(upload_id)
+        with self._session_lock(upload_id):
+            self._part_path(upload_id).unlink(missing_ok=True)
+            self._meta_path(upload_id).unlink(missing_ok=True)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+                self._hashers.pop(upload_id, None)
+                self._locks.pop(upload_id, None)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP клиент для Ollama и сервисов перевода.
+
+Один requests.Session на процесс с keep-alive пулом соединений вместо
+нового TCP соединения на каждый запрос, единая политика таймаутов и
+кэш клиентов deep-translator по языковым парам.
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Таймауты чтения по типу запроса (секунды); таймаут соединения общий
+TIMEOUTS = {
+    "probe": 2,       # проверка доступности сервиса
+    "short": 5,       # служебные запросы (списки моделей и т.п.)
+    "request": 60,    # перевод одной реплики
+    "long": 120,      # длинные LLM запросы
+}
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Общая для процесса сессия с пулом соединений"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def get_timeout(kind: Union[str, float, None] = "request") -> Tuple[float, float]:
+    """
+    Таймаут (соединение, чтение) для requests.
+
+    Args:
+        kind: Ключ из TIMEOUTS или явное значение таймаута чтения в секундах
+    """
+    if isinstance(kind, (int, float)):
+        read_timeout = float(kind)
+    else:
+        read_timeout = float(TIMEOUTS.get(kind or "request", TIMEOUTS["request"]))
+    return min(CONNECT_TIMEOUT, read_timeout), read_timeout
+
+
+def http_get(url: str, timeout: Union[str, float] = "request", **kwargs) -> requests.Response:
+    """GET через общий пул соединений"""
+    return get_session().get(url, timeout=get_timeout(timeout), **kwargs)
+
+
+def http_post(url: str, timeout: Union[str, float] = "request", **kwargs) -> requests.Response:
+    """POST через общий пул соединений"""
+    return get_session().post(url, timeout=get_timeout(timeout), **kwargs)
+
+
+def get_provider_client(client_class: type, **kwargs: Any) -> Any:
+    """
+    Возвращает закэшированный экземпляр клиента перевода (deep-translator)
+    для данной языковой пары.
+
+    Кэш на поток: клиенты deep-translator хранят состояние и не рассчитаны
+    на одновременное использование из нескольких потоков.
+    """
+    cache: Dict = getattr(_thread_local, "clients", None)
+    if cache is None:
+        cache = _thread_local.clients = {}
+
+    key = (client_class, tuple(sorted(kwargs.items())))
+    client = cache.get(key)
+    if client is None:
+        client = cache[key] = client_class(**kwargs)
+    return client
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь задач обработки видео.
+
+Каждая задача (Job) имеет свой id, состояние, прогресс и логи.
+JobManager запускает задачи из очереди по мере освобождения ресурсов
+(ResourcePool: слоты CPU и бюджет RAM), так что несколько видео
+обрабатываются параллельно, а новые запросы не прерывают текущие.
+"""
+import os
+import time
+import uuid
+import datetime
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+from core.config import get_available_memory_bytes
+from core.log_buffer import LogRingBuffer
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+_FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+# Сколько строк лога хранить на задачу
+_JOB_LOG_LIMIT = 1000
+
+
+class Job:
+    """
+    Задача обработки одного видео.
+
+    state - словарь в формате processing_state из api_server
+    (is_processing, current_step, progress, should_stop),
+    его обновляет функция обработки. Логи задачи - в logs (LogRingBuffer).
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        cpu_slots: int = 1,
+        ram_bytes: int = 0,
+        log_sink: Optional[Callable[[str], None]] = None
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.cpu_slots = max(1, cpu_slots)
+        self.ram_bytes = max(0, ram_bytes)
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.logs = LogRingBuffer(_JOB_LOG_LIMIT)
+        self.state: Dict[str, Any] = {
+            'is_processing': False,
+            'current_step': None,
+            'progress': 0,
+            'should_stop': False,
+        }
+        self._log_sink = log_sink
+
+    def log(self, message: str):
+        """Добавляет сообщение в лог задачи (и в общий лог с коротким id задачи)"""
+        timestamp = datetime.datetime.now().strftime('%H:%M:%S')
+        self.logs.append(f"[{timestamp}] {message}")
+        if self._log_sink:
+            self._log_sink(f"[{self.id[:6]}] {message}")
+
+    def cancel(self):
+        self.cancel_requested = True
+        self.state['should_stop'] = True
+
+    def should_stop(self) -> bool:
+        return self.cancel_requested or bool(self.state.get('should_stop'))
+
+    def to_dict(self, include_logs: bool = False, logs_since: int = 0) -> Dict[str, Any]:
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'current_step': self.state.get('current_step'),
+            'progress': self.state.get('progress', 0),
+            'error': self.state.get('error'),
+            'output_path': self.state.get('output_path'),
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'cpu_slots': self.cpu_slots,
+            'ram_bytes': self.ram_bytes,
+        }
+        if include_logs:
+            logs = self.logs.since(logs_since)
+            data['logs'] = logs['lines']
+            data['last_seq'] = logs['last_seq']
+        return data
+
+
+class ResourcePool:
+    """
+    Слоты CPU и бюджет RAM для одновременно выполняемых задач.
+    Задача, которая больше всего пула, запускается, когда пул пуст.
+    """
+
+    def __init__(self, cpu_slots: int, ram_budget_bytes: int):
+        self.cpu_slots = max(1, cpu_slots)
+        self.ram_budget_bytes = max(0, ram_budget_bytes)
+        self.cpu_used = 0
+        self.ram_used = 0
+
+    @classmethod
+    def from_env(cls) -> "ResourcePool":
+        """
+        Настройки: JOB_CPU_SLOTS (по умолчанию ядра / 4) и JOB_RAM_BUDGET_GB
+        (по умолчанию 80% доступной при запуске памяти).
+        """
+        cpu_slots = int(os.getenv("JOB_CPU_SLOTS", "0") or 0)
+        if cpu_slots <= 0:
+            cpu_slots = max(1, (os.cpu_count() or 1) // 4)
+
+        ram_budget_gb = float(os.getenv("JOB_RAM_BUDGET_GB", "0") or 0)
+        if ram_budget_gb > 0:
+            ram_budget = int(ram_budget_gb * 1024 ** 3)
+        else:
+            available = get_available_memory_bytes()
+            ram_budget = int(available * 0.8) if available else 8 * 1024 ** 3
+        return cls(cpu_slots, ram_budget)
+
+    def fits(self, cpu_slots: int, ram_bytes: int) -> bool:
+        if self.cpu_used == 0 and self.ram_used == 0:
+            return True
+        return (
+            self.cpu_used + cpu_slots <= self.cpu_slots
+            and self.ram_used + ram_bytes <= self.ram_budget_bytes
+        )
+
+    def acquire(self, cpu_slots: int, ram_bytes: int):
+        self.cpu_used += cpu_slots
+        self.ram_used += ram_bytes
+
+    def release(self, cpu_slots: int, ram_bytes: int):
+        self.cpu_used = max(0, self.cpu_used - cpu_slots)
+        self.ram_used = max(0, self.ram_used - ram_bytes)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            'cpu_slots': self.cpu_slots,
+            'cpu_used': self.cpu_used,
+            'ram_budget_bytes': self.ram_budget_bytes,
+            'ram_used_bytes': self.ram_used,
+        }
+
+
+class JobManager:
+    """
+    Очередь задач с планировщиком по ресурсам.
+
+    Задачи запускаются строго в порядке поступления: если первая в очереди
+    не помещается в свободные ресурсы, следующие ее не обгоняют.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[Job], None],
+        pool: ResourcePool,
+        log_sink: Optional[Callable[[str], None]] = None,
+        history_limit: int = 200
+    ):
+        """
+        Args:
+            runner: Функция обработки задачи (выполняется в отдельном потоке)
+            pool: Ресурсы для одновременных задач
+            log_sink: Общий лог, куда дублируются сообщения задач
+            history_limit: Сколько завершенных задач хранить
+        """
+        self.runner = runner
+        self.pool = pool
+        self.log_sink = log_sink
+        self.history_limit = history_limit
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: List[Job] = []
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: Dict[str, Any], cpu_slots: int = 1, ram_bytes: int = 0) -> Job:
+        """Ставит задачу в очередь"""
+        job = Job(kind, params, cpu_slots, ram_bytes, log_sink=self.log_sink)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._trim_history()
+        job.log(f"📥 Задача поставлена в очередь ({kind})")
+        self._schedule()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self) -> List[Job]:
+        """Выполняющиеся задачи"""
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status == JOB_RUNNING]
+
+    def queued(self) -> List[Job]:
+        with self._lock:
+            return list(self._queue)
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменяет задачу: из очереди удаляется сразу, выполняющаяся останавливается"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in _FINISHED_STATES:
+                return False
+            job.cancel()
+            if job in self._queue:
+                self._queue.remove(job)
+                job.status = JOB_CANCELLED
+                job.finished_at = time.time()
+        job.log("⏹️ Задача отменена")
+        return True
+
+    def cancel_all(self):
+        for job in self.list():
+            self.cancel(job.id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'resources': self.pool.snapshot(),
+                'running': sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING),
+                'queued': len(self._queue),
+            }
+
+    def _trim_history(self):
+        """Удаляет самые старые завершенные задачи сверх лимита (вызывается под локом)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in _FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.history_limit)]:
+            del self._jobs[job_id]
+
+    def _schedule(self):
+        """Запускает задачи из головы очереди, пока хватает ресурсов"""
+        to_start = []
+        with self._lock:
+            while self._queue:
+                job = self._queue[0]
+                if not self.pool.fits(job.cpu_slots, job.ram_bytes):
+                    break
+                self._queue.pop(0)
+                self.pool.acquire(job.cpu_slots, job.ram_bytes)
+                job.status = JOB_RUNNING
+                job.started_at = time.time()
+                to_start.append(job)
+
+        for job in to_start:
+            threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job: Job):
+        try:
+            job.state['is_processing'] = True
+            self.runner(job)
+        except Exception as e:
+            job.state['error'] = str(e)
+            job.log(f"❌ Ошибка задачи: {e}")
+            logger.exception(f"Задача {job.id} завершилась с ошибкой")
+        finally:
+            job.state['is_processing'] = False
+            with self._lock:
+                if job.cancel_requested:
+                    job.status = JOB_CANCELLED
+                elif job.state.get('error'):
+                    job.status = JOB_FAILED
+                else:
+                    job.status = JOB_COMPLETED
+                job.finished_at = time.time()
+                self.pool.release(job.cpu_slots, job.ram_bytes)
+            self._schedule()
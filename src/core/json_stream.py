@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковый разбор JSON ответов Ollama.
+
+Ollama со "stream": true присылает ответ кусками (NDJSON). JsonItemStream
+разбирает текст по мере поступления и выдает готовые объекты-элементы
+массивов ({"id": ..., ...}), не дожидаясь конца ответа. Если ответ оборвался
+(лимит токенов, разрыв соединения), все уже полученные элементы сохраняются,
+и вызывающему коду остается перезапросить только недостающие id.
+"""
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class JsonItemStream:
+    """
+    Инкрементальный парсер: на вход - куски текста JSON, на выход - объекты,
+    которые являются элементами массивов (на любом уровне вложенности).
+    """
+
+    def __init__(self):
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._item: Optional[List[str]] = None
+        self._item_depth = 0
+        self._started = False
+        self.complete = False
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Принимает очередной кусок текста.
+
+        Returns:
+            Объекты, полностью полученные в этом куске
+        """
+        items = []
+        for char in chunk:
+            if self.complete:
+                break
+            if self._item is not None:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._item is None and self._stack and self._stack[-1] == "[":
+                    self._item = [char]
+                    self._item_depth = len(self._stack) + 1
+                self._stack.append(char)
+                self._started = True
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == "}" and self._item is not None and len(self._stack) == self._item_depth - 1:
+                    try:
+                        items.append(json.loads("".join(self._item)))
+                    except json.JSONDecodeError as e:
+                        logger.debug(f"Пропущен некорректный элемент JSON: {e}")
+                    self._item = None
+                if self._started and not self._stack:
+                    self.complete = True
+        return items
+
+
+def iter_ollama_stream(response) -> Iterator[Tuple[str, Dict]]:
+    """
+    Читает потоковый ответ Ollama (/api/generate или /api/chat).
+
+    Yields:
+        (кусок текста ответа, исходный JSON чанка)
+    """
+    for line in response.iter_lines():
+        if not line:
+            continue
+        data = json.loads(line)
+        if data.get("error"):
+            raise RuntimeError(f"Ollama: {data['error']}")
+        text = data.get("response")
+        if text is None:
+            text = data.get("message", {}).get("content", "")
+        yield text, data
+
+
+def stream_json_items(response, on_item: Callable[[Dict], Any]) -> bool:
+    """
+    Разбирает потоковый ответ Ollama и передает элементы в on_item по мере поступления.
+    Если on_item вернул False - чтение прекращается (все нужное уже получено).
+
+    Returns:
+        True если ответ оборван: JSON не закрыт или модель уперлась в лимит токенов
+    """
+    parser = JsonItemStream()
+    done_reason = None
+    for text, data in iter_ollama_stream(response):
+        for item in parser.feed(text):
+            if isinstance(item, dict) and on_item(item) is False:
+                return False
+        if data.get("done"):
+            done_reason = data.get("done_reason")
+            break
+    return not parser.complete or done_reason == "length"
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Кольцевой буфер логов с монотонными номерами строк.
+
+Клиенты (терминал в UI, SSE поток) запоминают номер последней полученной
+строки и запрашивают только новые: since(seq). Буфер фиксированного размера,
+старые строки вытесняются без копирования списка; номера строк не
+сбрасываются даже при очистке, поэтому курсор клиента остается корректным.
+"""
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_LOG_CAPACITY = 1000
+
+
+class LogRingBuffer:
+    """Потокобезопасный буфер последних строк лога"""
+
+    def __init__(self, capacity: int = DEFAULT_LOG_CAPACITY):
+        self.capacity = max(1, capacity)
+        self._lines: "deque[Tuple[int, str]]" = deque(maxlen=self.capacity)
+        self._next_seq = 1
+        self._cond = threading.Condition()
+
+    @property
+    def last_seq(self) -> int:
+        """Номер последней добавленной строки (0 - строк еще не было)"""
+        return self._next_seq - 1
+
+    def append(self, line: str) -> int:
+        """Добавляет строку и возвращает ее номер"""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._lines.append((seq, line))
+            self._cond.notify_all()
+        return seq
+
+    def clear(self):
+        """Удаляет строки (номера продолжают расти)"""
+        with self._cond:
+            self._lines.clear()
+
+    def since(self, seq: int = 0) -> Dict[str, Any]:
+        """
+        Строки с номером больше seq.
+
+        Returns:
+            {'lines': [...], 'first_seq', 'last_seq', 'truncated'} где truncated -
+            часть строк после seq уже вытеснена из буфера (для seq=0 всегда False)
+        """
+        with self._cond:
+            return self._since_locked(seq)
+
+    def wait(self, seq: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Как since(), но ждет появления новых строк до timeout секунд"""
+        with self._cond:
+            seq = self._reset_stale(seq)
+            if self.last_seq <= seq:
+                self._cond.wait_for(lambda: self.last_seq > seq, timeout=timeout)
+            return self._since_locked(seq)
+
+    def lines(self) -> List[str]:
+        """Все строки в буфере"""
+        with self._cond:
+            return [line for _, line in self._lines]
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def _reset_stale(self, seq: int) -> int:
+        """Курсор из будущего (сервер перезапущен, нумерация началась заново) - читаем с начала"""
+        return 0 if seq > self.last_seq else max(0, seq)
+
+    def _since_locked(self, seq: int) -> Dict[str, Any]:
+        seq = self._reset_stale(seq)
+        first_seq = self._lines[0][0] if self._lines else self._next_seq
+        # Номера в буфере идут подряд, поэтому позиция начала выборки вычисляется по номеру
+        start = max(0, seq + 1 - first_seq)
+        return {
+            'lines': [line for _, line in islice(self._lines, start, None)],
+            'first_seq': first_seq,
+            'last_seq': self.last_seq,
+            'truncated': 0 < seq and seq + 1 < first_seq,
+        }
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Model Registry Module
+Общий для процесса кэш загруженных моделей (Whisper, wav2vec2, pyannote).
+
+Модели остаются в памяти между задачами в пределах бюджета RAM
+(MODEL_CACHE_RAM_GB). При нехватке бюджета вытесняются давно не
+использованные модели. Бюджет 0 (по умолчанию) - прежнее поведение:
+модель выгружается сразу после использования.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+from core.config import get_available_memory_bytes
+
+logger = logging.getLogger(__name__)
+
+# Оценка размера модели в RAM, если измерить не удалось (байты)
+_DEFAULT_SIZE_ESTIMATES = {
+    "whisper": 3 * 1024 ** 3,
+    "align": int(1.2 * 1024 ** 3),
+    "diarize": 1024 ** 3,
+}
+
+
+def _estimate_torch_size(obj: Any) -> Optional[int]:
+    """Размер параметров torch модели (для wav2vec2 и подобных)"""
+    try:
+        import torch
+        if isinstance(obj, torch.nn.Module):
+            return sum(p.numel() * p.element_size() for p in obj.parameters())
+    except Exception:
+        pass
+    return None
+
+
+class _Entry:
+    def __init__(self, model: Any, size: int):
+        self.model = model
+        self.size = size
+        self.in_use = 0
+        # Модель из кэша используется одной задачей за раз: вызовы не потокобезопасны,
+        # а run_asr меняет состояние модели (model.tokenizer)
+        self.usage_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    LRU кэш моделей с бюджетом памяти.
+
+    Ключ: (kind, name, language, device, compute_type, threads).
+    Модели, которые сейчас используются, не вытесняются. Параллельные задачи
+    получают общую модель по очереди (use ждет, пока она освободится);
+    модель, которая уже загружается, не загружается второй раз параллельно.
+    """
+
+    def __init__(self, budget_bytes: int = 0):
+        """
+        Args:
+            budget_bytes: Бюджет RAM для резидентных моделей (0 - не держать модели)
+        """
+        self.budget_bytes = max(0, int(budget_bytes))
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._total_size = 0
+        # Модели, которые сейчас загружаются: второй вызов с тем же ключом ждет загрузку
+        self._loading: Dict[Tuple, threading.Event] = {}
+
+    @staticmethod
+    def make_key(
+        kind: str,
+        name: Optional[str],
+        language: Optional[str] = None,
+        device: Optional[str] = None,
+        compute_type: Optional[str] = None,
+        threads: Optional[int] = None
+    ) -> Tuple:
+        # threads входит в ключ: число потоков задается при загрузке модели
+        return (kind, name or "default", language or "auto", device or "cpu", compute_type or "", threads or 0)
+
+    def _evict_until(self, free_needed: int, log: Callable[[str], None]):
+        """Вытесняет LRU модели (кроме используемых), пока не освободится free_needed"""
+        for key in list(self._entries.keys()):
+            if self._total_size + free_needed <= self.budget_bytes:
+                break
+            entry = self._entries[key]
+            if entry.in_use:
+                continue
+            self._drop(key)
+            self.evictions += 1
+            log(f"♻️ Модель выгружена из кэша (LRU): {key[0]}/{key[1]}")
+
+    def _drop(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_size -= entry.size
+            entry.model = None
+
+    def _load(self, key: Tuple, loader: Callable[[], Any], log: Callable[[str], None]) -> _Entry:
+        """Загружает модель и публикует ее в кэше (запись возвращается занятой вызывающим)"""
+        estimate = _DEFAULT_SIZE_ESTIMATES.get(key[0], 1024 ** 3)
+        if self.budget_bytes:
+            # Освобождаем место заранее, чтобы не держать в памяти обе модели сразу
+            with self._lock:
+                self._evict_until(estimate, log)
+
+        available_before = get_available_memory_bytes()
+        model = loader()
+        available_after = get_available_memory_bytes()
+
+        size = _estimate_torch_size(model[0] if isinstance(model, tuple) else model)
+        if size is None and available_before is not None and available_after is not None:
+            measured = available_before - available_after
+            size = measured if measured > 0 else None
+
+        entry = _Entry(model, size or estimate)
+        entry.in_use = 1
+        # Захватываем до публикации в кэше, чтобы другая задача не получила модель раньше
+        entry.usage_lock.acquire()
+        with self._lock:
+            self.loads += 1
+            if self.budget_bytes:
+                self._drop(key)
+                self._entries[key] = entry
+                self._total_size += entry.size
+        return entry
+
+    @contextmanager
+    def use(
+        self,
+        key: Tuple,
+        loader: Callable[[], Any],
+        progress_callback: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Выдает модель по ключу, загружая ее при промахе.
+
+        После выхода из блока модель остается в кэше, если укладывается
+        в бюджет, иначе выгружается.
+
+        Args:
+            key: Ключ из make_key
+            loader: Функция загрузки модели
+            progress_callback: Функция для логирования
+        """
+        log = progress_callback or (lambda msg: None)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.in_use += 1
+                    self.hits += 1
+                    log(f"⚡ Модель {key[0]}/{key[1]} уже загружена (кэш моделей)")
+                    break
+                loading = self._loading.get(key)
+                if loading is None:
+                    # Загружаем сами; остальные вызовы с этим ключом ждут
+                    loading = threading.Event()
+                    self._loading[key] = loading
+                    break
+            # Та же модель уже загружается другой задачей - ждем и берем ее из кэша
+            # (если она не попала в кэш или загрузка упала - загружаем сами)
+            log(f"⏳ Модель {key[0]}/{key[1]} уже загружается, ждем...")
+            loading.wait()
+
+        if entry is None:
+            try:
+                entry = self._load(key, loader, log)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                loading.set()
+        else:
+            # Вне self._lock: ожидание не блокирует остальные модели реестра
+            entry.usage_lock.acquire()
+
+        try:
+            yield entry.model
+        finally:
+            entry.usage_lock.release()
+            with self._lock:
+                entry.in_use -= 1
+                if key in self._entries:
+                    self._evict_until(0, log)
+                    if self._total_size > self.budget_bytes and not entry.in_use:
+                        # Сама модель больше бюджета - держать ее нет смысла
+                        self._drop(key)
+                        self.evictions += 1
+                        log(f"♻️ Модель {key[0]}/{key[1]} не помещается в бюджет кэша, выгружена")
+
+    def clear(self):
+        """Выгружает все неиспользуемые модели"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if not e.in_use]:
+                self._drop(key)
+
+    def stats(self) -> Dict:
+        """Статистика кэша моделей"""
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "resident": len(self._entries),
+                "resident_bytes": self._total_size,
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def log_stats(self, progress_callback: Optional[Callable[[str], None]] = None):
+        """Пишет статистику кэша моделей в лог"""
+        stats = self.stats()
+        message = (
+            f"📦 Кэш моделей: загрузок {stats['loads']}, попаданий {stats['hits']}, "
+            f"вытеснено {stats['evictions']}, в памяти {stats['resident']} "
+            f"({stats['resident_bytes'] / 1024 ** 3:.1f}/{stats['budget_bytes'] / 1024 ** 3:.1f} ГБ)"
+        )
+        if progress_callback:
+            progress_callback(message)
+        logger.info(message)
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Общий реестр моделей процесса (бюджет из MODEL_CACHE_RAM_GB)"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            budget_gb = float(os.getenv("MODEL_CACHE_RAM_GB", "0") or 0)
+            _registry = ModelRegistry(int(budget_gb * 1024 ** 3))
+        return _registry
@@ -1,24 +1,51 @@
 # -*- coding: utf-8 -*-
 """
 Модуль для автоматического управления Ollama сервисом.
-Проверяет и запускает Ollama при необходимости.
+Проверяет и запускает Ollama при необходимости, прогревает модели
+и задает политику keep_alive для всех запросов к Ollama.
 """
+import os
 import subprocess
-import requests
+import threading
 import time
 import platform
 import logging
-from typing import Optional, Callable
+from typing import Dict, List, Optional, Callable, Union
+
+from core.http_client import http_get, http_post
 
 logger = logging.getLogger(__name__)
 
+# Сколько Ollama держит модель в памяти после последнего запроса.
+# По умолчанию Ollama выгружает модель через 5 минут - между этапами
+# (транскрипция, клонирование голоса) она успевает выгрузиться
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def get_keep_alive() -> Union[str, int]:
+    """
+    Значение keep_alive для запросов к Ollama (переменная OLLAMA_KEEP_ALIVE).
+
+    Формат Ollama: длительность ("10m", "1h"), число секунд,
+    "-1" - держать всегда, "0" - выгружать сразу.
+    """
+    value = os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
 
 class OllamaManager:
     """Менеджер для автоматического управления Ollama"""
     
-    def __init__(self, progress_callback: Optional[Callable[[str], None]] = None):
+    def __init__(
+        self,
+        progress_callback: Optional[Callable[[str], None]] = None,
+        ollama_url: str = "http://localhost:11434"
+    ):
         self.progress_callback = progress_callback or (lambda msg: None)
-        self.ollama_url = "http://localhost:11434"
+        self.ollama_url = ollama_url.rstrip('/')
     
     def _log(self, message: str):
         """Логирование"""
@@ -28,7 +55,7 @@ class OllamaManager:
     def _check_ollama_running(self) -> bool:
         """Проверяет, запущен ли Ollama"""
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
+            response = http_get(f"{self.ollama_url}/api/tags", timeout="probe")
             return response.status_code == 200
         except:
             return False
@@ -135,7 +162,7 @@ class OllamaManager:
             return False
         
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
+            response = http_get(f"{self.ollama_url}/api/tags", timeout="short")
             if response.status_code == 200:
                 models = response.json().get("models", [])
                 model_names = [m.get("name", "") for m in models]
@@ -144,3 +171,73 @@ class OllamaManager:
             pass
         
         return False
+    
+    def warm(self, model_name: str = "qwen2.5:7b", keep_alive: Optional[Union[str, int]] = None) -> bool:
+        """
+        Загружает модель в память заранее, чтобы первый запрос перевода
+        или коррекции не ждал холодной загрузки.
+        
+        Args:
+            model_name: Название модели
+            keep_alive: Сколько держать модель (по умолчанию get_keep_alive())
+            
+        Returns:
+            True если модель загружена
+        """
+        if not self._check_ollama_running():
+            self._log("⚠️ Ollama не запущен - прогрев модели пропущен")
+            return False
+        
+        start_time = time.time()
+        try:
+            # Пустой промпт только загружает модель, без генерации
+            response = http_post(
+                f"{self.ollama_url}/api/generate",
+                json={
+                    "model": model_name,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": keep_alive if keep_alive is not None else get_keep_alive()
+                },
+                timeout="long"
+            )
+            if response.status_code != 200:
+                self._log(f"⚠️ Не удалось прогреть модель {model_name}: HTTP {response.status_code}")
+                return False
+        except Exception as e:
+            self._log(f"⚠️ Не удалось прогреть модель {model_name}: {e}")
+            return False
+        
+        self._log(f"🔥 Модель {model_name} загружена в память за {time.time() - start_time:.1f}с")
+        return True
+    
+    def warm_in_background(self, model_name: str = "qwen2.5:7b") -> threading.Thread:
+        """
+        Прогревает модель в фоновом потоке (пока идут скачивание и транскрипция).
+        """
+        thread = threading.Thread(target=self.warm, args=(model_name,), daemon=True)
+        thread.start()
+        return thread
+    
+    def running_models(self) -> List[Dict]:
+        """
+        Модели, загруженные в память Ollama (/api/ps).
+        
+        Returns:
+            Список {name, size, size_vram, expires_at}; пустой, если Ollama недоступен
+        """
+        try:
+            response = http_get(f"{self.ollama_url}/api/ps", timeout="short")
+            if response.status_code != 200:
+                return []
+            return [
+                {
+                    "name": m.get("name", ""),
+                    "size": m.get("size", 0),
+                    "size_vram": m.get("size_vram", 0),
+                    "expires_at": m.get("expires_at"),
+                }
+                for m in response.json().get("models", [])
+            ]
+        except Exception:
+            return []
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Конвейер этапов обработки для нескольких задач одновременно.
+
+Каждый этап (скачивание, транскрипция, перевод, озвучка, видео) имеет свою
+ограниченную очередь и свой набор потоков-исполнителей. Задача проходит этапы
+по порядку, но разные задачи занимают разные этапы одновременно: пока задача A
+переводится, задача B транскрибируется, а задача C собирает видео. Общая
+пропускная способность на пачке задач определяется самым медленным этапом,
+а не суммой всех этапов.
+
+Очереди ограничены: если следующий этап занят, исполнитель ждет места в его
+очереди и не берет новую работу (обратное давление), поэтому этапы не
+накапливают неограниченное количество промежуточных результатов в памяти.
+"""
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Размер очереди перед каждым этапом (сколько задач могут ждать этап)
+DEFAULT_QUEUE_SIZE = 2
+
+# Сигнал остановки исполнителя
+_STOP = object()
+
+
+def get_stage_workers(name: str, default: int = 1) -> int:
+    """Число исполнителей этапа: PIPELINE_WORKERS_<ЭТАП> (например PIPELINE_WORKERS_TRANSCRIBE)"""
+    value = os.getenv(f"PIPELINE_WORKERS_{name.upper()}", "")
+    try:
+        return max(1, int(value)) if value else max(1, default)
+    except ValueError:
+        return max(1, default)
+
+
+class PipelineStage:
+    """Этап конвейера: очередь входящих задач и исполнители"""
+
+    def __init__(self, name: str, handler: Callable[[Any], Any], workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+
+
+class StagePipeline:
+    """
+    Конвейер этапов с отдельной ограниченной очередью и исполнителями на каждом этапе.
+
+    Обработчик этапа получает элемент (контекст задачи) и:
+    - возвращает None/True - элемент переходит на следующий этап;
+    - возвращает False - обработка элемента завершена досрочно (дальше делать нечего);
+    - бросает исключение - элемент завершается с ошибкой.
+    """
+
+    def __init__(
+        self,
+        stages: List[Tuple[str, Callable[[Any], Any], int]],
+        queue_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            stages: Этапы по порядку: (имя, обработчик, число исполнителей)
+            queue_size: Размер очереди перед каждым этапом (по умолчанию из PIPELINE_QUEUE_SIZE)
+            progress_callback: Функция для логирования
+        """
+        if queue_size is None:
+            queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", str(DEFAULT_QUEUE_SIZE)))
+        self.stages = [PipelineStage(name, handler, workers, queue_size) for name, handler, workers in stages]
+        self.progress_callback = progress_callback
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started = False
+
+    def _log(self, message: str):
+        if self.progress_callback:
+            self.progress_callback(message)
+        logger.info(message)
+
+    def start(self):
+        """Запускает исполнителей всех этапов (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for index, stage in enumerate(self.stages):
+                for worker in range(stage.workers):
+                    thread = threading.Thread(
+                        target=self._worker,
+                        args=(index,),
+                        name=f"pipeline-{stage.name}-{worker}",
+                        daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+        layout = ", ".join(f"{stage.name}×{stage.workers}" for stage in self.stages)
+        self._log(f"🏭 Конвейер этапов запущен: {layout}")
+
+    def stop(self):
+        """Останавливает исполнителей (элементы, уже стоящие в очередях, дорабатываются)"""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            threads, self._threads = self._threads, []
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+        for thread in threads:
+            thread.join(timeout=5)
+
+    def submit(self, item: Any, on_done: Callable[[Any, Optional[BaseException]], None]):
+        """
+        Ставит элемент в очередь первого этапа.
+        Блокируется, пока в очереди нет места (обратное давление на источник задач).
+
+        Args:
+            item: Контекст задачи, передается обработчикам этапов
+            on_done: Вызывается по завершении: (item, исключение или None)
+        """
+        self.start()
+        self.stages[0].queue.put((item, on_done))
+
+    def run(self, item: Any):
+        """
+        Проводит элемент через конвейер и ждет завершения.
+        Исключение этапа пробрасывается вызывающему коду.
+        """
+        done = threading.Event()
+        outcome: Dict[str, Optional[BaseException]] = {'error': None}
+
+        def on_done(_item, error):
+            outcome['error'] = error
+            done.set()
+
+        self.submit(item, on_done)
+        done.wait()
+        if outcome['error'] is not None:
+            raise outcome['error']
+
+    def capacity(self) -> int:
+        """Сколько задач вмещает конвейер без блокировки: исполнители плюс места в очередях"""
+        return sum(stage.workers + stage.queue.maxsize for stage in self.stages)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Состояние этапов: глубина очереди, занятые исполнители, счетчики"""
+        with self._lock:
+            return [
+                {
+                    'stage': stage.name,
+                    'workers': stage.workers,
+                    'busy': stage.busy,
+                    'queued': stage.queue.qsize(),
+                    'capacity': stage.queue.maxsize,
+                    'processed': stage.processed,
+                    'failed': stage.failed,
+                }
+                for stage in self.stages
+            ]
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            entry = stage.queue.get()
+            if entry is _STOP:
+                break
+            item, on_done = entry
+            with self._lock:
+                stage.busy += 1
+            try:
+                result = stage.handler(item)
+            except BaseException as e:
+                with self._lock:
+                    stage.busy -= 1
+                    stage.failed += 1
+                self._finish(on_done, item, e)
+                continue
+            with self._lock:
+                stage.busy -= 1
+                stage.processed += 1
+
+            if result is False or next_stage is None:
+                self._finish(on_done, item, None)
+            else:
+                # Ждем места в очереди следующего этапа
+                next_stage.queue.put((item, on_done))
+
+    def _finish(self, on_done, item, error: Optional[BaseException]):
+        try:
+            on_done(item, error)
+        except Exception as e:
+            logger.exception(f"Ошибка в обработчике завершения конвейера: {e}")
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Учет состояния провайдеров перевода (circuit breaker).
+
+После N неудач подряд провайдер исключается из перебора на время
+open_seconds, затем пропускается один пробный запрос (half-open).
+Медленные и ненадежные провайдеры опускаются в конец очереди,
+порядок среди здоровых сохраняет приоритет качества.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class _ProviderStats:
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.avg_latency: Optional[float] = None
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    @property
+    def calls(self) -> int:
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.calls if self.calls else 1.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "avg_latency": self.avg_latency,
+            "state": self.state,
+            "opened_at": self.opened_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "_ProviderStats":
+        stats = cls()
+        stats.successes = int(data.get("successes", 0))
+        stats.failures = int(data.get("failures", 0))
+        stats.consecutive_failures = int(data.get("consecutive_failures", 0))
+        stats.avg_latency = data.get("avg_latency")
+        stats.state = data.get("state", STATE_CLOSED)
+        if stats.state == STATE_HALF_OPEN:
+            stats.state = STATE_OPEN
+        stats.opened_at = float(data.get("opened_at", 0.0))
+        return stats
+
+
+class ProviderHealth:
+    """
+    Здоровье провайдеров: успешность, средняя задержка и circuit breaker.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        open_seconds: float = 60.0,
+        slow_latency_sec: float = 5.0,
+        persist_path: Optional[str] = None
+    ):
+        """
+        Args:
+            failure_threshold: Неудач подряд до отключения провайдера
+            open_seconds: Время отключения до пробного запроса
+            slow_latency_sec: Средняя задержка, после которой провайдер считается медленным
+            persist_path: JSON файл для сохранения состояния между запусками (опционально)
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.slow_latency_sec = slow_latency_sec
+        self.persist_path = Path(persist_path) if persist_path else None
+
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _ProviderStats] = {}
+        self._last_saved = 0.0
+        self._load()
+
+    def _get(self, name: str) -> _ProviderStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = _ProviderStats()
+        return stats
+
+    def allow(self, name: str) -> bool:
+        """
+        Можно ли сейчас обращаться к провайдеру.
+        Для отключенного провайдера по истечении open_seconds пропускается один пробный запрос.
+        """
+        with self._lock:
+            stats = self._get(name)
+            if stats.state == STATE_CLOSED:
+                return True
+            if stats.state == STATE_OPEN and time.time() - stats.opened_at >= self.open_seconds:
+                stats.state = STATE_HALF_OPEN
+                stats.probe_in_flight = False
+            if stats.state == STATE_HALF_OPEN and not stats.probe_in_flight:
+                stats.probe_in_flight = True
+                return True
+            return False
+
+    def seconds_until_retry(self, names: List[str]) -> float:
+        """
+        Через сколько секунд хотя бы один из провайдеров снова примет запрос
+        (0 - уже можно; для идущего пробного запроса - короткий интервал опроса).
+        """
+        with self._lock:
+            waits = []
+            for name in names:
+                stats = self._stats.get(name)
+                if stats is None or stats.state == STATE_CLOSED:
+                    return 0.0
+                if stats.state == STATE_OPEN:
+                    waits.append(max(0.0, stats.opened_at + self.open_seconds - time.time()))
+                else:
+                    waits.append(0.5)
+            return min(waits) if waits else 0.0
+
+    def _update_latency(self, stats: _ProviderStats, latency: float):
+        # Экспоненциальное среднее: свежие замеры важнее
+        if stats.avg_latency is None:
+            stats.avg_latency = latency
+        else:
+            stats.avg_latency = 0.8 * stats.avg_latency + 0.2 * latency
+
+    def record_success(self, name: str, latency: float):
+        with self._lock:
+            stats = self._get(name)
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            stats.state = STATE_CLOSED
+            stats.probe_in_flight = False
+            self._update_latency(stats, latency)
+        self._save()
+
+    def record_failure(self, name: str, latency: float) -> bool:
+        """
+        Returns:
+            True если после этой неудачи провайдер отключен
+        """
+        with self._lock:
+            stats = self._get(name)
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            self._update_latency(stats, latency)
+
+            opened = False
+            if stats.state == STATE_HALF_OPEN or stats.consecutive_failures >= self.failure_threshold:
+                opened = stats.state != STATE_OPEN
+                stats.state = STATE_OPEN
+                stats.opened_at = time.time()
+                stats.probe_in_flight = False
+        self._save()
+        return opened
+
+    def reset(self, name: Optional[str] = None):
+        """Сбрасывает состояние провайдера (или всех)"""
+        with self._lock:
+            if name is None:
+                self._stats.clear()
+            else:
+                self._stats.pop(name, None)
+        self._save(force=True)
+
+    def order(self, names: List[str]) -> List[str]:
+        """
+        Порядок перебора провайдеров.
+
+        Отключенные - в конце, затем ненадежные (успешность < 50%) и медленные;
+        внутри каждой группы сохраняется исходный порядок (приоритет качества).
+        """
+        with self._lock:
+            def sort_key(item):
+                index, name = item
+                stats = self._stats.get(name)
+                if stats is None:
+                    return (0, 0, 0, index)
+                is_open = stats.state != STATE_CLOSED
+                unreliable = stats.calls >= 5 and stats.success_rate < 0.5
+                slow = stats.avg_latency is not None and stats.avg_latency > self.slow_latency_sec
+                return (int(is_open), int(unreliable), int(slow), index)
+
+            return [name for _, name in sorted(enumerate(names), key=sort_key)]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Текущее состояние всех провайдеров"""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def _load(self):
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            data = json.loads(self.persist_path.read_text(encoding="utf-8"))
+            self._stats = {name: _ProviderStats.from_dict(item) for name, item in data.items()}
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Не удалось прочитать состояние провайдеров {self.persist_path}: {e}")
+
+    def _save(self, force: bool = False):
+        """Сохраняет состояние на диск (не чаще раза в несколько секунд)"""
+        if not self.persist_path:
+            return
+        now = time.time()
+        if not force and now - self._last_saved < 5.0:
+            return
+        self._last_saved = now
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.snapshot(), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить состояние провайдеров: {e}")
+
+
+_provider_health: Optional[ProviderHealth] = None
+_provider_health_lock = threading.Lock()
+
+
+def get_provider_health() -> ProviderHealth:
+    """
+    Общее для процесса состояние провайдеров.
+    Настройки: PROVIDER_FAILURE_THRESHOLD, PROVIDER_OPEN_SECONDS,
+    PROVIDER_HEALTH_PATH (если задан - состояние сохраняется между запусками).
+    """
+    global _provider_health
+    with _provider_health_lock:
+        if _provider_health is None:
+            _provider_health = ProviderHealth(
+                failure_threshold=int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3")),
+                open_seconds=float(os.getenv("PROVIDER_OPEN_SECONDS", "60")),
+                persist_path=os.getenv("PROVIDER_HEALTH_PATH") or None
+            )
+        return _provider_health
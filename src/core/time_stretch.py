@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Time Stretch Module
+Изменение темпа речи без изменения высоты тона (WSOLA) прямо на NumPy буферах.
+
+Замена FFmpeg atempo при подгонке TTS аудио к слоту: без запуска процессов
+и записи промежуточных файлов, любой коэффициент без цепочки 0.5-2.0.
+По умолчанию сегменты обрабатываются в текущем процессе; при
+TIME_STRETCH_WORKERS > 1 - в одном общем долгоживущем пуле процессов.
+
+Бенчмарк качества и скорости против FFmpeg atempo:
+    python -m core.time_stretch [--seconds 4] [--segments 200]
+"""
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from core.audio_mixer import DEFAULT_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Длина окна анализа и допуск поиска сдвига (мс) - типичные значения для речи
+DEFAULT_FRAME_MS = 30.0
+DEFAULT_TOLERANCE_MS = 10.0
+
+
+def _periodic_hann(length: int) -> np.ndarray:
+    """Периодическое окно Ханна: при перекрытии 50% сумма окон равна 1"""
+    return (0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(length) / length)).astype(np.float32)
+
+
+def _overlap_add(frames: np.ndarray, hop: int) -> np.ndarray:
+    """
+    Overlap-add кадров с шагом hop = половина кадра.
+    Четные и нечетные кадры между собой не пересекаются - складываются без цикла.
+    """
+    count, length = frames.shape
+    output = np.zeros(count * hop + length, dtype=np.float32)
+    even = frames[0::2].reshape(-1)
+    odd = frames[1::2].reshape(-1)
+    output[:even.size] += even
+    output[hop:hop + odd.size] += odd
+    return output
+
+
+def wsola_stretch(
+    samples: np.ndarray,
+    speed: float,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    frame_ms: float = DEFAULT_FRAME_MS,
+    tolerance_ms: float = DEFAULT_TOLERANCE_MS
+) -> np.ndarray:
+    """
+    Меняет темп в speed раз с сохранением высоты тона (WSOLA).
+
+    Args:
+        samples: Моно float32 сэмплы
+        speed: Коэффициент ускорения (>1 - быстрее/короче, <1 - медленнее/длиннее)
+        sample_rate: Частота дискретизации
+        frame_ms: Длина кадра анализа
+        tolerance_ms: Максимальный сдвиг кадра при поиске наилучшего совпадения
+
+    Returns:
+        Сэмплы длиной round(len(samples) / speed)
+    """
+    x = np.asarray(samples, dtype=np.float32).reshape(-1)
+    if speed <= 0:
+        raise ValueError(f"Коэффициент темпа должен быть положительным: {speed}")
+    if x.size == 0 or abs(speed - 1.0) < 1e-3:
+        return x.copy()
+
+    frame = max(64, int(sample_rate * frame_ms / 1000.0))
+    frame -= frame % 2
+    hop = frame // 2
+    tolerance = max(1, int(sample_rate * tolerance_ms / 1000.0))
+
+    out_len = int(round(x.size / speed))
+    num_frames = int(np.ceil(out_len / hop)) + 1
+
+    # Нули по краям: поиск и последние кадры не выходят за границы
+    pad = tolerance + frame
+    tail = int(np.ceil(num_frames * hop * speed)) + 2 * frame + 2 * tolerance
+    padded = np.concatenate([
+        np.zeros(pad, dtype=np.float32),
+        x,
+        np.zeros(max(tail - x.size, 0) + pad, dtype=np.float32),
+    ])
+
+    # Выбор позиций кадров: последовательный, но корреляция по окну поиска векторная
+    positions = np.empty(num_frames, dtype=np.int64)
+    positions[0] = pad
+    for k in range(1, num_frames):
+        nominal = pad + int(round(k * hop * speed))
+        natural = positions[k - 1] + hop
+        template = padded[natural:natural + frame]
+        region = padded[nominal - tolerance:nominal + tolerance + frame]
+        correlation = np.correlate(region, template, mode="valid")
+        best = int(np.argmax(correlation))
+        # В тишине совпадение не важно - держимся номинальной позиции
+        positions[k] = nominal - tolerance + best if correlation[best] > 0 else nominal
+
+    window = _periodic_hann(frame)
+    frames = padded[positions[:, None] + np.arange(frame)] * window
+    output = _overlap_add(frames, hop)
+    norm = _overlap_add(np.broadcast_to(window, frames.shape), hop)
+
+    # Края, где окна не перекрываются полностью, выравниваем по сумме окон
+    np.divide(output, norm, out=output, where=norm > 0.1)
+    return output[:out_len]
+
+
+def fit_to_slot(
+    samples: np.ndarray,
+    target_duration_sec: float,
+    sample_rate: int = DEFAULT_SAMPLE_RATE
+) -> np.ndarray:
+    """
+    Подгоняет аудио к слоту: сжимает, если длиннее target_duration_sec.
+    Короткое аудио не растягивается (как и в пути с atempo).
+    """
+    target_len = int(round(target_duration_sec * sample_rate))
+    if target_len <= 0:
+        return np.zeros(0, dtype=np.float32)
+    if samples.size <= target_len:
+        return samples
+    stretched = wsola_stretch(samples, samples.size / float(target_len), sample_rate)
+    return stretched[:target_len]
+
+
+def _fit_job(job: Tuple[np.ndarray, float, int]) -> np.ndarray:
+    """Задача для пула процессов (функция модуля - сериализуется при spawn)"""
+    samples, target_duration_sec, sample_rate = job
+    return fit_to_slot(samples, target_duration_sec, sample_rate)
+
+
+def get_stretch_workers() -> int:
+    """
+    Число процессов для пакетной обработки (TIME_STRETCH_WORKERS, по умолчанию 1 -
+    в текущем процессе; "auto" - по числу ядер, до 8).
+
+    Дочерний процесс spawn заново импортирует главный модуль (api_server.py со
+    всеми его зависимостями), поэтому пул оправдан только для длинных видео.
+    """
+    value = (os.getenv("TIME_STRETCH_WORKERS") or "1").strip().lower()
+    if value == "auto":
+        return max(1, min(os.cpu_count() or 1, 8))
+    return max(1, int(value))
+
+
+def create_stretch_executor(max_workers: Optional[int] = None) -> Optional[Executor]:
+    """
+    Новый пул процессов для fit_batch (spawn - безопасно рядом с torch и на macOS).
+
+    Returns:
+        Executor или None, если достаточно одного процесса
+    """
+    workers = max_workers or get_stretch_workers()
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+_shared_executor: Optional[Executor] = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_stretch_executor() -> Optional[Executor]:
+    """
+    Общий пул процессов для fit_batch: создается при первом вызове и живет до выхода,
+    так что стоимость запуска процессов платится один раз, а не на каждую сборку.
+
+    Returns:
+        Executor или None, если TIME_STRETCH_WORKERS <= 1
+    """
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = create_stretch_executor()
+            if _shared_executor is not None:
+                atexit.register(_shared_executor.shutdown, cancel_futures=True)
+        return _shared_executor
+
+
+def fit_batch(
+    jobs: List[Tuple[np.ndarray, float]],
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    executor: Optional[Executor] = None
+) -> List[np.ndarray]:
+    """
+    Подгоняет пачку сегментов к их слотам.
+
+    Args:
+        jobs: Пары (сэмплы, целевая длительность в секундах)
+        sample_rate: Частота дискретизации
+        executor: Пул процессов (get_stretch_executor); None - в текущем процессе
+
+    Returns:
+        Результаты в порядке jobs
+    """
+    tasks = [(samples, duration, sample_rate) for samples, duration in jobs]
+    results: List[Optional[np.ndarray]] = []
+    needs_stretch = []
+    for idx, task in enumerate(tasks):
+        # Сегменты, которые не нужно сжимать, в пул не отправляем - это лишнее копирование
+        samples, duration, _ = task
+        if samples.size > int(round(duration * sample_rate)):
+            needs_stretch.append(idx)
+            results.append(None)
+        else:
+            results.append(fit_to_slot(*task))
+
+    if executor is None or len(needs_stretch) < 2:
+        for idx in needs_stretch:
+            results[idx] = _fit_job(tasks[idx])
+        return results
+
+    chunksize = max(1, len(needs_stretch) // (getattr(executor, "_max_workers", 1) * 4))
+    stretched = executor.map(_fit_job, [tasks[idx] for idx in needs_stretch], chunksize=chunksize)
+    for idx, samples in zip(needs_stretch, stretched):
+        results[idx] = samples
+    return results
+
+
+def _estimate_pitch(samples: np.ndarray, sample_rate: int) -> float:
+    """Основной тон по автокорреляции центрального участка (для бенчмарка)"""
+    size = min(samples.size, 4096)
+    start = (samples.size - size) // 2
+    chunk = samples[start:start + size] - samples[start:start + size].mean()
+    spectrum = np.fft.rfft(chunk, n=2 * size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:size]
+    low, high = int(sample_rate / 400), int(sample_rate / 60)
+    lag = low + int(np.argmax(autocorr[low:high]))
+    return sample_rate / float(lag)
+
+
+def _synthetic_speech(seconds: float, sample_rate: int) -> np.ndarray:
+    """Тестовый сигнал: гармоники 140 Гц со слоговой огибающей и шумом"""
+    t = np.arange(int(seconds * sample_rate)) / float(sample_rate)
+    f0 = 140.0
+    voiced = sum(np.sin(2 * np.pi * f0 * h * t) / h for h in range(1, 12))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4.0 * t)
+    rng = np.random.default_rng(0)
+    signal = voiced * envelope * 0.25 + rng.normal(0, 0.01, t.size)
+    return signal.astype(np.float32)
+
+
+def _atempo_ffmpeg(samples: np.ndarray, speed: float, sample_rate: int, ffmpeg_path: str) -> np.ndarray:
+    """Путь VideoMaker._fit_audio_to_slot: запись WAV, FFmpeg atempo, чтение результата"""
+    import subprocess
+    import tempfile
+    from core.audio_mixer import load_audio, AudioTimelineMixer
+    from core.video_maker import build_atempo_chain
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "in.wav")
+        target = os.path.join(tmp_dir, "out.wav")
+        mixer = AudioTimelineMixer(samples.size / float(sample_rate), sample_rate)
+        mixer.add(samples, 0.0)
+        mixer.write(source)
+        subprocess.run(
+            [ffmpeg_path, "-y", "-v", "error", "-i", source,
+             "-af", ",".join(build_atempo_chain(speed)), target],
+            check=True, capture_output=True
+        )
+        return load_audio(target, sample_rate)
+
+
+def _benchmark(seconds: float, segments: int):
+    import shutil
+    import time
+
+    sample_rate = DEFAULT_SAMPLE_RATE
+    source = _synthetic_speech(seconds, sample_rate)
+    source_pitch = _estimate_pitch(source, sample_rate)
+    ffmpeg_path = shutil.which("ffmpeg")
+
+    print(f"Сигнал: {seconds:.1f} с, {sample_rate} Гц, основной тон {source_pitch:.1f} Гц")
+    print(f"{'speed':>6} | {'метод':<7} | {'время, мс':>9} | {'ошибка длит., мс':>16} | {'сдвиг тона, центы':>17}")
+    for speed in (1.1, 1.25, 1.5, 2.0, 3.0):
+        methods = [("wsola", lambda: wsola_stretch(source, speed, sample_rate))]
+        if ffmpeg_path:
+            methods.append(("atempo", lambda: _atempo_ffmpeg(source, speed, sample_rate, ffmpeg_path)))
+        for name, run in methods:
+            started = time.perf_counter()
+            result = run()
+            elapsed = (time.perf_counter() - started) * 1000
+            expected_len = source.size / speed
+            length_error = abs(result.size - expected_len) / sample_rate * 1000
+            cents = 1200 * np.log2(_estimate_pitch(result, sample_rate) / source_pitch)
+            print(f"{speed:>6.2f} | {name:<7} | {elapsed:>9.1f} | {length_error:>16.1f} | {cents:>17.1f}")
+    if not ffmpeg_path:
+        print("FFmpeg не найден - сравнение с atempo пропущено")
+
+    # Пакет сегментов по 3 секунды в слоты по 2 секунды
+    clip = _synthetic_speech(3.0, sample_rate)
+    jobs = [(clip, 2.0)] * segments
+    started = time.perf_counter()
+    fit_batch(jobs, sample_rate)
+    sequential = time.perf_counter() - started
+
+    executor = create_stretch_executor(max(2, min(os.cpu_count() or 1, 8)))
+    if executor is not None:
+        with executor:
+            fit_batch(jobs[:executor._max_workers], sample_rate, executor)  # прогрев пула
+            started = time.perf_counter()
+            fit_batch(jobs, sample_rate, executor)
+            pooled = time.perf_counter() - started
+        print(f"Пакет {segments} сегментов: в процессе {sequential:.2f} с, пул ({executor._max_workers}) {pooled:.2f} с")
+    else:
+        print(f"Пакет {segments} сегментов: {sequential:.2f} с")
+
+    if ffmpeg_path:
+        count = min(segments, 20)
+        started = time.perf_counter()
+        for _ in range(count):
+            _atempo_ffmpeg(clip, 1.5, sample_rate, ffmpeg_path)
+        per_segment = (time.perf_counter() - started) / count
+        print(f"FFmpeg atempo: {per_segment * 1000:.0f} мс на сегмент, ~{per_segment * segments:.2f} с на {segments}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Бенчмарк WSOLA против FFmpeg atempo")
+    parser.add_argument("--seconds", type=float, default=4.0, help="Длительность тестового сигнала")
+    parser.add_argument("--segments", type=int, default=200, help="Сегментов в пакетном тесте")
+    args = parser.parse_args()
+    _benchmark(args.seconds, args.segments)
@@ -9,6 +9,10 @@ import traceback
 from typing import Optional, Callable, List, Dict
 import torch
 
+from core.audio_ingest import ingest_audio
+from core.model_registry import get_model_registry
+from core.diarization_worker import DiarizationProcess
+
 # Подавляем лишние предупреждения
 warnings.filterwarnings('ignore')
 
@@ -42,7 +46,8 @@ class Transcriber:
     
     Особенности:
     - Полная поддержка Apple Silicon (M1/M2/M3) без крашей.
-    - Оптимизация памяти (выгрузка моделей между шагами).
+    - Оптимизация памяти (выгрузка моделей между шагами, либо кэш моделей
+      в пределах MODEL_CACHE_RAM_GB при обработке задач подряд).
     """
     
     def __init__(
@@ -50,13 +55,31 @@ class Transcriber:
         model_size: str = "large-v3",
         hf_token: Optional[str] = None,
         progress_callback: Optional[Callable[[str], None]] = None,
-        should_stop_callback: Optional[Callable[[], bool]] = None
+        should_stop_callback: Optional[Callable[[], bool]] = None,
+        parallel_diarization: Optional[bool] = None,
+        asr_threads: Optional[int] = None,
+        diarization_threads: Optional[int] = None
     ):
+        """
+        Args:
+            parallel_diarization: Запускать диаризацию в отдельном процессе
+                параллельно с транскрипцией (env PARALLEL_DIARIZATION, по умолчанию выкл.)
+            asr_threads: Потоков CPU для транскрипции/выравнивания в параллельном режиме
+                (env ASR_THREADS, по умолчанию - оставшиеся от диаризации ядра)
+            diarization_threads: Потоков CPU для диаризации в параллельном режиме
+                (env DIARIZATION_THREADS, по умолчанию - треть ядер)
+        """
         self.model_size = model_size
         self.hf_token = hf_token or os.getenv("HF_TOKEN")
         self.progress_callback = progress_callback
         self.should_stop_callback = should_stop_callback
         
+        if parallel_diarization is None:
+            parallel_diarization = os.getenv("PARALLEL_DIARIZATION", "0").lower() in ("1", "true", "yes")
+        self.parallel_diarization = parallel_diarization
+        self.asr_threads = asr_threads or int(os.getenv("ASR_THREADS", "0") or 0) or None
+        self.diarization_threads = diarization_threads or int(os.getenv("DIARIZATION_THREADS", "0") or 0) or None
+        
         # Автоопределение устройства (Mac vs Windows)
         self.device, self.compute_type = self._detect_environment()
         
@@ -96,6 +119,18 @@ class Transcriber:
         if hasattr(torch.backends, 'mps') and torch.backends.mps.is_available():
             torch.mps.empty_cache()
     
+    def _thread_budget(self) -> tuple:
+        """
+        Делит ядра CPU между транскрипцией и параллельной диаризацией.
+        
+        Returns:
+            (потоков для ASR, потоков для диаризации)
+        """
+        cpu_count = os.cpu_count() or 1
+        diarization_threads = self.diarization_threads or max(1, cpu_count // 3)
+        asr_threads = self.asr_threads or max(1, cpu_count - diarization_threads)
+        return asr_threads, diarization_threads
+    
     def _normalize_language_code(self, lang_code: str) -> str:
         """
         Нормализует код языка для WhisperX alignment.
@@ -133,6 +168,12 @@ class Transcriber:
         self._log(f"⚠️ Неизвестный код языка для alignment: {lang_code}, используем как есть")
         return lang_code
 
+    def _check_stop(self, message: str = "⏹️ Обработка прервана пользователем"):
+        """Прерывает шаг, если пользователь нажал стоп"""
+        if self.should_stop_callback and self.should_stop_callback():
+            self._log(message)
+            raise InterruptedError("Processing stopped by user")
+
     def transcribe_full(
         self,
         audio_path: str,
@@ -144,35 +185,137 @@ class Transcriber:
     ) -> Dict:
         """
         Запуск полного пайплайна.
+        
+        Аудио декодируется один раз (core.audio_ingest) и один и тот же массив
+        передается в транскрипцию, выравнивание и диаризацию.
+        Путь к PCM кэшу возвращается в ключе "audio_cache".
+        
+        Шаги доступны и по отдельности (run_asr, run_alignment, run_diarization,
+        assign_speakers) - так их выполняет граф этапов API сервера с кэшем результатов.
         """
         if not os.path.exists(audio_path):
             raise FileNotFoundError(f"Файл не найден: {audio_path}")
 
-        # Импортируем внутри метода, чтобы не грузить память при старте приложения
-        import whisperx
-
+        diarization_process = None
+        previous_torch_threads = None
         try:
             # Проверяем флаг остановки перед началом
-            if self.should_stop_callback and self.should_stop_callback():
-                self._log("⏹️ Транскрипция прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
+            self._check_stop("⏹️ Транскрипция прервана пользователем")
+            
+            # Декодируем аудио один раз для всех этапов
+            audio, audio_cache = ingest_audio(audio_path, self._log)
             
-            # --- ШАГ 1: ТРАНСКРИПЦИЯ ---
-            self._log(f"\n🎧 Шаг 1/4: Транскрипция ({self.model_size})...")
+            # Диаризация зависит только от аудио - при параллельном режиме
+            # запускаем ее сразу, в отдельном процессе
+            asr_threads = None
+            if self.parallel_diarization and self.hf_token:
+                asr_threads, diarization_threads = self._thread_budget()
+                self._log(
+                    f"👥 Диаризация запущена параллельно с транскрипцией "
+                    f"(потоки: ASR {asr_threads}, диаризация {diarization_threads})"
+                )
+                diarization_process = DiarizationProcess(
+                    audio_cache,
+                    self.hf_token,
+                    device=self.device,
+                    num_threads=diarization_threads,
+                    min_speakers=min_speakers,
+                    max_speakers=max_speakers,
+                    num_speakers=num_speakers
+                )
+                diarization_process.start()
+                previous_torch_threads = torch.get_num_threads()
+                torch.set_num_threads(asr_threads)
+            
+            result = self.run_asr(audio, language, batch_size=batch_size, threads=asr_threads)
+            result = self.run_alignment(result, audio)
+            
+            if diarization_process is not None:
+                # Диаризация уже идет в отдельном процессе - ждем результат
+                self._log(f"\n👥 Шаг 3/4: Диаризация (PyAnnote)...")
+                self._log("⏳ Ожидание результата параллельной диаризации...")
+                diarize_segments = diarization_process.result(self.should_stop_callback)
+                diarization_process = None
+            else:
+                diarize_segments = self.run_diarization(
+                    audio,
+                    min_speakers=min_speakers,
+                    max_speakers=max_speakers,
+                    num_speakers=num_speakers
+                )
+            
+            final_segments = self.assign_speakers(result, diarize_segments)
+            get_model_registry().log_stats(self._log)
+            
+            return {
+                "segments": final_segments,
+                "language": result["language"],
+                "audio_cache": audio_cache
+            }
+
+        except InterruptedError:
+            # Обработка прерывания пользователем
+            self._log("⏹️ Транскрипция прервана пользователем")
+            return {"segments": [], "language": "en", "stopped": True}
+        except Exception as e:
+            self._log(f"❌ ОШИБКА: {e}")
+            self._log(traceback.format_exc())
+            # Возвращаем пустой результат, чтобы программа не упала полностью
+            return {"segments": [], "language": "en", "error": str(e)}
+        finally:
+            if diarization_process is not None:
+                diarization_process.stop()
+            if previous_torch_threads is not None:
+                torch.set_num_threads(previous_torch_threads)
+            self._cleanup_memory()
+
+    def run_asr(
+        self,
+        audio,
+        language: Optional[str] = None,
+        batch_size: int = 4,
+        threads: Optional[int] = None
+    ) -> Dict:
+        """
+        Шаг 1: транскрипция (Faster-Whisper).
+        
+        Args:
+            audio: Массив float32 16 кГц (core.audio_ingest)
+            language: Язык оригинала (None - определить)
+            threads: Потоков CPU для модели (None - по умолчанию)
             
-            model = whisperx.load_model(
+        Returns:
+            Результат WhisperX: {"segments": [...], "language": "xx"}
+        """
+        # Импортируем внутри метода, чтобы не грузить память при старте приложения
+        import whisperx
+        
+        self._log(f"\n🎧 Шаг 1/4: Транскрипция ({self.model_size})...")
+        
+        # Модели берутся из общего реестра процесса (остаются в памяти в пределах бюджета)
+        registry = get_model_registry()
+        whisper_key = registry.make_key(
+            "whisper", self.model_size, language, self.device, self.compute_type, threads
+        )
+        
+        with registry.use(
+            whisper_key,
+            lambda: whisperx.load_model(
                 self.model_size,
                 device=self.device,
                 compute_type=self.compute_type,
-                language=language
-            )
-            
+                language=language,
+                **({"threads": threads} if threads else {})
+            ),
+            self._log
+        ) as model:
             # Проверяем флаг остановки перед транскрипцией
-            if self.should_stop_callback and self.should_stop_callback():
-                del model
-                self._cleanup_memory()
-                self._log("⏹️ Транскрипция прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
+            self._check_stop("⏹️ Транскрипция прервана пользователем")
+            
+            # Модель без заданного языка запоминает язык прошлого файла в tokenizer -
+            # сбрасываем, чтобы язык определялся заново
+            if language is None and hasattr(model, "tokenizer"):
+                model.tokenizer = None
             
             # КРИТИЧЕСКИ ВАЖНО: Настройки для точных таймингов
             # chunk_size=10: заставляет Whisper чаще сбрасывать тайминги (по умолчанию 30)
@@ -180,56 +323,68 @@ class Transcriber:
             self._log(f"⚙️ Параметры транскрипции: batch_size={batch_size}, chunk_size=10 (точные тайминги)")
             
             result = model.transcribe(
-                audio_path,
+                audio,
                 batch_size=batch_size,
                 chunk_size=10  # Критично: меньший размер чанка = более точные тайминги для alignment
             )
             
             # Проверяем флаг остановки после транскрипции
-            if self.should_stop_callback and self.should_stop_callback():
-                del model
-                self._cleanup_memory()
-                self._log("⏹️ Транскрипция прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
-            
-            detected_lang = result["language"]
-            self._log(f"🌍 Язык оригинала: {detected_lang}")
-            
-            # Чистим память
-            del model
-            self._cleanup_memory()
-            
-            # Проверяем флаг остановки перед alignment
-            if self.should_stop_callback and self.should_stop_callback():
-                self._log("⏹️ Обработка прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
-            
-            # --- ШАГ 2: ВЫРАВНИВАНИЕ (Alignment) ---
-            self._log(f"\n📐 Шаг 2/4: Выравнивание таймингов...")
-            
-            # Нормализуем код языка для alignment
-            align_lang = self._normalize_language_code(detected_lang)
-            self._log(f"🔤 Код языка для alignment: {align_lang} (исходный: {detected_lang})")
-            
-            alignment_success = False
-            try:
-                self._log(f"📦 Загрузка модели выравнивания для языка: {align_lang}...")
-                align_model, align_metadata = whisperx.load_align_model(
+            self._check_stop("⏹️ Транскрипция прервана пользователем")
+        
+        self._log(f"🌍 Язык оригинала: {result['language']}")
+        
+        # Чистим память
+        self._cleanup_memory()
+        return result
+
+    def run_alignment(self, asr_result: Dict, audio) -> Dict:
+        """
+        Шаг 2: посимвольное выравнивание таймингов (Wav2Vec2).
+        
+        При ошибке выравнивания возвращаются исходные сегменты, а в результате
+        ставится "aligned": False (сегментация будет базовая).
+        
+        Returns:
+            {"segments": [...], "language": "xx", "aligned": bool}
+        """
+        import whisperx
+        
+        # Проверяем флаг остановки перед alignment
+        self._check_stop()
+        
+        self._log(f"\n📐 Шаг 2/4: Выравнивание таймингов...")
+        detected_lang = asr_result["language"]
+        result = asr_result
+        
+        # Нормализуем код языка для alignment
+        align_lang = self._normalize_language_code(detected_lang)
+        self._log(f"🔤 Код языка для alignment: {align_lang} (исходный: {detected_lang})")
+        
+        registry = get_model_registry()
+        alignment_success = False
+        try:
+            self._log(f"📦 Загрузка модели выравнивания для языка: {align_lang}...")
+            align_key = registry.make_key("align", None, align_lang, self.device)
+            with registry.use(
+                align_key,
+                lambda: whisperx.load_align_model(
                     language_code=align_lang,
                     device=self.device
-                )
+                ),
+                self._log
+            ) as (align_model, align_metadata):
                 self._log(f"✅ Модель выравнивания загружена")
-                
+            
                 self._log(f"🔄 Запуск выравнивания...")
                 result = whisperx.align(
-                    result["segments"],
+                    asr_result["segments"],
                     align_model,
                     align_metadata,
-                    audio_path,
+                    audio,
                     device=self.device,
                     return_char_alignments=False
                 )
-                
+            
                 # КРИТИЧЕСКОЕ ОТЛАДОЧНОЕ ЛОГИРОВАНИЕ
                 if result.get("segments") and len(result["segments"]) > 0:
                     seg0 = result["segments"][0]
@@ -250,12 +405,12 @@ class Transcriber:
                     print(f"DEBUG SEGMENT 0 TEXT: {seg0.get('text', 'NO_TEXT')[:100]}")
                     print(f"DEBUG SEGMENT 0 TIME: {seg0.get('start', 'NO_START')} -> {seg0.get('end', 'NO_END')}")
                     print(f"{'='*60}\n")
-                    
+                
                     # Проверяем все сегменты
                     segments_with_words = sum(1 for s in result["segments"] if "words" in s and len(s.get("words", [])) > 0)
                     total_segments = len(result["segments"])
                     self._log(f"📊 Статистика выравнивания: {segments_with_words}/{total_segments} сегментов содержат слова")
-                    
+                
                     if segments_with_words == 0:
                         self._log(f"⚠️ ВНИМАНИЕ: Выравнивание не добавило слова ни в один сегмент!")
                         self._log(f"⚠️ Это означает, что alignment не сработал. Проверьте код языка и модель.")
@@ -264,95 +419,146 @@ class Transcriber:
                     print(f"DEBUG: result['segments'] пуст или отсутствует!")
                     print(f"DEBUG result keys: {list(result.keys())}")
                     print(f"{'='*60}\n")
-                
-                alignment_success = True
-                del align_model
-                del align_metadata
-                
-            except FileNotFoundError as e:
-                self._log(f"❌ Ошибка: Модель выравнивания для языка '{align_lang}' не найдена")
-                self._log(f"💡 Попробуйте другой язык или проверьте доступность моделей")
-                self._log(f"📋 Детали: {str(e)}")
-            except MemoryError as e:
-                self._log(f"❌ Ошибка памяти при выравнивании: {e}")
-                self._log(f"💡 Попробуйте уменьшить batch_size или использовать меньшую модель")
-            except Exception as e:
-                error_type = type(e).__name__
-                self._log(f"❌ Ошибка выравнивания ({error_type}): {str(e)}")
-                self._log(f"📋 Traceback:")
-                self._log(traceback.format_exc())
-                self._log(f"⚠️ Продолжаем без выравнивания (тайминги могут быть неточными)")
             
-            if not alignment_success:
-                self._log(f"⚠️ Выравнивание пропущено. Сегментация будет базовая (без разбиения на предложения)")
-            
-            self._cleanup_memory()
-            
-            # Проверяем флаг остановки перед диаризацией
-            if self.should_stop_callback and self.should_stop_callback():
-                self._log("⏹️ Обработка прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
-            
-            # --- ШАГ 3: ДИАРИЗАЦИЯ ---
-            self._log(f"\n👥 Шаг 3/4: Диаризация (PyAnnote)...")
+                alignment_success = True
             
-            diarize_segments = None
-            if self.hf_token:
-                from whisperx import diarize
-                
-                # Загружаем пайплайн диаризации
-                diarize_model = diarize.DiarizationPipeline(
-                    use_auth_token=self.hf_token,
-                    device=self.device
-                )
-                
-                diarize_segments = diarize_model(
-                    audio_path,
-                    min_speakers=min_speakers,
-                    max_speakers=max_speakers,
-                    num_speakers=num_speakers
-                )
-                
-                del diarize_model
-                self._cleanup_memory()
-                
-                # --- ШАГ 4: СБОРКА И УМНАЯ НАРЕЗКА ---
-                self._log(f"\n🔗 Шаг 4/4: Сборка и разбиение на предложения...")
-                
-                # Присваиваем спикеров словам
-                result = diarize.assign_word_speakers(
-                    diarize_segments,
-                    result
-                )
-            else:
-                self._log("⚠️ HF Token не найден. Диаризация пропущена (будет только текст).")
+        except FileNotFoundError as e:
+            self._log(f"❌ Ошибка: Модель выравнивания для языка '{align_lang}' не найдена")
+            self._log(f"💡 Попробуйте другой язык или проверьте доступность моделей")
+            self._log(f"📋 Детали: {str(e)}")
+        except MemoryError as e:
+            self._log(f"❌ Ошибка памяти при выравнивании: {e}")
+            self._log(f"💡 Попробуйте уменьшить batch_size или использовать меньшую модель")
+        except Exception as e:
+            error_type = type(e).__name__
+            self._log(f"❌ Ошибка выравнивания ({error_type}): {str(e)}")
+            self._log(f"📋 Traceback:")
+            self._log(traceback.format_exc())
+            self._log(f"⚠️ Продолжаем без выравнивания (тайминги могут быть неточными)")
+        
+        if not alignment_success:
+            self._log(f"⚠️ Выравнивание пропущено. Сегментация будет базовая (без разбиения на предложения)")
+        
+        self._cleanup_memory()
+        return {**result, "language": detected_lang, "aligned": alignment_success}
+
+    def run_diarization(
+        self,
+        audio,
+        audio_cache: Optional[str] = None,
+        min_speakers: Optional[int] = None,
+        max_speakers: Optional[int] = None,
+        num_speakers: Optional[int] = None
+    ):
+        """
+        Шаг 3: диаризация (PyAnnote).
+        
+        В параллельном режиме (и если передан audio_cache) выполняется в отдельном
+        процессе, так что может идти одновременно с run_asr в другом потоке.
+        
+        Returns:
+            Таблица реплик спикеров (DataFrame WhisperX) или None без HF токена
+        """
+        # Проверяем флаг остановки перед диаризацией
+        self._check_stop()
+        
+        self._log(f"\n👥 Шаг 3/4: Диаризация (PyAnnote)...")
+        if not self.hf_token:
+            self._log("⚠️ HF Token не найден. Диаризация пропущена (будет только текст).")
+            return None
+        
+        if self.parallel_diarization and audio_cache:
+            _, diarization_threads = self._thread_budget()
+            diarization_process = DiarizationProcess(
+                audio_cache,
+                self.hf_token,
+                device=self.device,
+                num_threads=diarization_threads,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+                num_speakers=num_speakers
+            )
+            diarization_process.start()
+            try:
+                return diarization_process.result(self.should_stop_callback)
+            finally:
+                diarization_process.stop()
+        
+        from whisperx import diarize
+        
+        # Загружаем пайплайн диаризации
+        registry = get_model_registry()
+        diarize_key = registry.make_key("diarize", "pyannote", None, self.device)
+        with registry.use(
+            diarize_key,
+            lambda: diarize.DiarizationPipeline(
+                use_auth_token=self.hf_token,
+                device=self.device
+            ),
+            self._log
+        ) as diarize_model:
+            diarize_segments = diarize_model(
+                audio,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+                num_speakers=num_speakers
+            )
+        
+        self._cleanup_memory()
+        return diarize_segments
+
+    @staticmethod
+    def diarization_to_records(diarize_segments) -> Optional[List[Dict]]:
+        """Таблица реплик спикеров -> список {start, end, speaker} (для кэша)"""
+        if diarize_segments is None:
+            return None
+        return [
+            {"start": float(row["start"]), "end": float(row["end"]), "speaker": row["speaker"]}
+            for _, row in diarize_segments.iterrows()
+        ]
 
-            # Запускаем РАЗБИЕНИЕ ПО ПРЕДЛОЖЕНИЯМ (Sentence-Level Splitter)
-            # Реконструирует сегменты строго по предложениям на уровне слов
-            # Это позволяет LLM видеть переходы между спикерами даже в быстром диалоге
-            # LLM в corrector.py выступит "Script Editor" и исправит спикеров по контексту
-            final_segments = self._smart_sentence_split(result["segments"])
+    @staticmethod
+    def diarization_from_records(records: Optional[List[Dict]]):
+        """Список {start, end, speaker} -> таблица для assign_speakers"""
+        if records is None:
+            return None
+        import pandas as pd
+        return pd.DataFrame(records, columns=["start", "end", "speaker"])
+
+    def assign_speakers(self, aligned_result: Dict, diarize_segments=None) -> List[Dict]:
+        """
+        Шаг 4: присваивание спикеров словам и разбиение на предложения.
+        
+        Args:
+            aligned_result: Результат run_alignment (изменяется на месте)
+            diarize_segments: Результат run_diarization (None - без спикеров)
             
-            # Подсчет статистики
-            speakers_found = set(s.get("speaker") for s in final_segments if "speaker" in s)
-            self._log(f"✅ Готово! Спикеров: {len(speakers_found)}. Сегментов: {len(final_segments)}")
+        Returns:
+            Сегменты по предложениям: [{"start", "end", "text", "speaker"}]
+        """
+        result = aligned_result
+        if diarize_segments is not None:
+            from whisperx import diarize
             
-            return {
-                "segments": final_segments,
-                "language": detected_lang
-            }
+            # --- ШАГ 4: СБОРКА И УМНАЯ НАРЕЗКА ---
+            self._log(f"\n🔗 Шаг 4/4: Сборка и разбиение на предложения...")
+            
+            # Присваиваем спикеров словам
+            result = diarize.assign_word_speakers(
+                diarize_segments,
+                aligned_result
+            )
 
-        except InterruptedError:
-            # Обработка прерывания пользователем
-            self._log("⏹️ Транскрипция прервана пользователем")
-            return {"segments": [], "language": "en", "stopped": True}
-        except Exception as e:
-            self._log(f"❌ ОШИБКА: {e}")
-            self._log(traceback.format_exc())
-            # Возвращаем пустой результат, чтобы программа не упала полностью
-            return {"segments": [], "language": "en", "error": str(e)}
-        finally:
-            self._cleanup_memory()
+        # Запускаем РАЗБИЕНИЕ ПО ПРЕДЛОЖЕНИЯМ (Sentence-Level Splitter)
+        # Реконструирует сегменты строго по предложениям на уровне слов
+        # Это позволяет LLM видеть переходы между спикерами даже в быстром диалоге
+        # LLM в corrector.py выступит "Script Editor" и исправит спикеров по контексту
+        final_segments = self._smart_sentence_split(result["segments"])
+        
+        # Подсчет статистики
+        speakers_found = set(s.get("speaker") for s in final_segments if "speaker" in s)
+        self._log(f"✅ Готово! Спикеров: {len(speakers_found)}. Сегментов: {len(final_segments)}")
+        return final_segments
 
     def _smart_sentence_split(self, whisperx_segments: List[Dict]) -> List[Dict]:
         """
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Память переводов (SQLite).
+Однажды переведенные реплики берутся с диска без обращения к сети и LLM.
+"""
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Callable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять лимит размера (в записях)
+_EVICT_CHECK_INTERVAL = 500
+
+
+class TranslationMemory:
+    """
+    Постоянный кэш переводов.
+
+    Ключ = sha256(провайдер, модель, исходный язык, целевой язык,
+    нормализованный текст, версия промпта). Число записей ограничено,
+    при переполнении удаляются давно не использованные (LRU по last_used).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = 500_000,
+        progress_callback: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            db_path: Путь к файлу базы SQLite
+            max_entries: Максимальное число записей
+            progress_callback: Функция для логирования
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.progress_callback = progress_callback or (lambda msg: None)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used)"
+        )
+        self._conn.commit()
+
+    def _log(self, message: str):
+        """Внутренний метод для логирования"""
+        self.progress_callback(message)
+        logger.info(message)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Нормализация текста: лишние пробелы не должны менять ключ"""
+        return re.sub(r"\s+", " ", text or "").strip()
+
+    def make_key(
+        self,
+        provider: str,
+        model: str,
+        source_lang: str,
+        target_lang: str,
+        text: str,
+        prompt_version: str = ""
+    ) -> str:
+        payload = [
+            provider,
+            model or "",
+            (source_lang or "").lower(),
+            (target_lang or "").lower(),
+            self.normalize_text(text),
+            prompt_version or "",
+        ]
+        return hashlib.sha256(
+            json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def get(
+        self,
+        provider: str,
+        model: str,
+        source_lang: str,
+        target_lang: str,
+        text: str,
+        prompt_version: str = ""
+    ) -> Optional[str]:
+        """
+        Ищет перевод в памяти.
+
+        Returns:
+            Перевод или None при промахе
+        """
+        key = self.make_key(provider, model, source_lang, target_lang, text, prompt_version)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def get_any(
+        self,
+        providers: List[str],
+        model: str,
+        source_lang: str,
+        target_lang: str,
+        text: str,
+        prompt_version: str = ""
+    ) -> Optional[str]:
+        """
+        Ищет перевод любого из провайдеров (в порядке приоритета).
+        Считается одним обращением в статистике.
+        """
+        keys = [
+            self.make_key(provider, model, source_lang, target_lang, text, prompt_version)
+            for provider in providers
+        ]
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT translation FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._conn.commit()
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        provider: str,
+        model: str,
+        source_lang: str,
+        target_lang: str,
+        text: str,
+        translation: str,
+        prompt_version: str = ""
+    ):
+        """Сохраняет перевод и при необходимости вытесняет старые записи"""
+        if not translation or not translation.strip():
+            return
+
+        key = self.make_key(provider, model, source_lang, target_lang, text, prompt_version)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO translations
+                    (key, provider, model, source_lang, target_lang, source_text,
+                     translation, prompt_version, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key, provider, model or "", (source_lang or "").lower(),
+                    (target_lang or "").lower(), self.normalize_text(text),
+                    translation, prompt_version or "", now, now,
+                )
+            )
+            self._writes_since_check += 1
+            if self._writes_since_check >= _EVICT_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи сверх лимита (вызывается под локом)"""
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self._conn.execute(
+            """
+            DELETE FROM translations WHERE key IN (
+                SELECT key FROM translations ORDER BY last_used ASC LIMIT ?
+            )
+            """,
+            (excess,)
+        )
+        self.evictions += excess
+
+    def stats(self) -> Dict:
+        """Статистика памяти переводов"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+            }
+
+    def log_stats(self):
+        """Пишет статистику в лог"""
+        stats = self.stats()
+        self._log(
+            f"📦 Память переводов: попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"({stats['hit_rate'] * 100:.0f}%), вытеснено {stats['evictions']}, "
+            f"{stats['entries']} записей"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -3,18 +3,104 @@
 Модуль перевода сегментов транскрипции.
 Поддерживает Ollama (локальный LLM) и deep-translator/googletrans как резервный вариант.
 """
+import os
 import json
 import requests
 import time
 import subprocess
 import sys
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Optional, Callable
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import logging
 
+from core.config import APP_PATHS
+from core.translation_memory import TranslationMemory
+from core.provider_health import get_provider_health
+from core.http_client import http_get, http_post, get_provider_client, TIMEOUTS
+from core.json_stream import stream_json_items
+from core.ollama_manager import get_keep_alive
+
 # Логирование
 logger = logging.getLogger(__name__)
 
+# Полные названия языков для промптов LLM
+LANGUAGE_NAMES = {
+    "en": "English",
+    "ru": "Russian",
+    "es": "Spanish",
+    "fr": "French",
+    "de": "German",
+    "it": "Italian",
+    "pt": "Portuguese",
+    "ja": "Japanese",
+    "ko": "Korean",
+    "zh": "Chinese",
+}
+
+# Сколько сегментов отправлять в Ollama одним запросом по умолчанию
+DEFAULT_OLLAMA_BATCH_SIZE = 8
+
+# JSON схема ответа батчевого перевода (structured outputs Ollama)
+BATCH_TRANSLATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "translations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "text": {"type": "string"},
+                },
+                "required": ["id", "text"],
+            },
+        },
+    },
+    "required": ["translations"],
+}
+# Сколько раз запрашивать реплики, пропущенные в ответе батча
+MAX_BATCH_ATTEMPTS = 2
+
+# Версия промптов Ollama: меняйте при изменении промптов, чтобы не брать старые переводы из памяти
+OLLAMA_PROMPT_VERSION = "dub-v1"
+
+# Максимум одновременных запросов к каждому провайдеру.
+# Для Ollama больше OLLAMA_NUM_PARALLEL сервера ставить бессмысленно - запросы встанут в очередь
+DEFAULT_PROVIDER_CONCURRENCY = {
+    "Ollama": int(os.getenv("OLLAMA_NUM_PARALLEL", "1") or 1),
+    "DeepL": 4,
+    "LibreTranslate": 2,
+    "MyMemory": 2,
+    "Google Translate": 4,
+    "googletrans": 2,
+}
+
+# Провайдеры последнего резерва: их переводы не сохраняются в память переводов,
+# иначе перевод, полученный во время короткого сбоя DeepL/LibreTranslate, отдавался бы всегда
+LAST_RESORT_PROVIDERS = ("MyMemory", "googletrans")
+
+# Семафоры провайдеров общие для процесса: лимит действует на все задачи сразу,
+# а не на каждый экземпляр Translator
+_provider_slots: Dict[str, threading.BoundedSemaphore] = {}
+_provider_slots_lock = threading.Lock()
+
+
+def get_provider_slot(provider_name: str, limit: int) -> threading.BoundedSemaphore:
+    """
+    Общий семафор провайдера.
+
+    Лимит задается при первом обращении к провайдеру; последующие
+    экземпляры Translator используют уже созданный семафор.
+    """
+    with _provider_slots_lock:
+        slot = _provider_slots.get(provider_name)
+        if slot is None:
+            slot = threading.BoundedSemaphore(max(1, limit))
+            _provider_slots[provider_name] = slot
+        return slot
+
 class Translator:
     """
     Класс для перевода сегментов транскрипции с сохранением временных меток и спикеров.
@@ -24,7 +110,11 @@ class Translator:
         self,
         ollama_url: str = "http://localhost:11434",
         progress_callback: Optional[Callable[[str], None]] = None,
-        should_stop_callback: Optional[Callable[[], bool]] = None
+        should_stop_callback: Optional[Callable[[], bool]] = None,
+        max_workers: Optional[int] = None,
+        provider_concurrency: Optional[Dict[str, int]] = None,
+        use_translation_memory: Optional[bool] = None,
+        translation_memory_path: Optional[str] = None
     ):
         """
         Инициализация переводчика.
@@ -32,18 +122,75 @@ class Translator:
         Args:
             ollama_url: URL Ollama сервера (по умолчанию http://localhost:11434)
             progress_callback: Функция для отчета о прогрессе (принимает строку сообщения)
+            max_workers: Сколько сегментов/батчей переводить одновременно через API
+                (env TRANSLATION_WORKERS, по умолчанию 4; 1 = последовательно)
+            provider_concurrency: Лимиты одновременных запросов по провайдерам
+                (переопределяют DEFAULT_PROVIDER_CONCURRENCY; семафоры общие для
+                процесса, лимит берется у первого создавшего их переводчика)
+            use_translation_memory: Брать уже переведенные реплики из памяти переводов
+                (env TRANSLATION_MEMORY, по умолчанию включено)
+            translation_memory_path: Путь к базе памяти переводов
+                (env TRANSLATION_MEMORY_PATH, по умолчанию Models/translation_memory.sqlite3)
         """
         self.ollama_url = ollama_url.rstrip('/')
         self.progress_callback = progress_callback or (lambda msg: None)
         self.should_stop_callback = should_stop_callback
         self._ollama_available = None  # Кэш для проверки доступности Ollama
         self._deep_translator_installed = None  # Кэш для проверки установки deep-translator
+        self._install_lock = threading.Lock()
+        self._providers_wait_logged_at = 0.0
+        # Сколько сегментов последнего translate_segments осталось без перевода
+        self.untranslated_count = 0
+        
+        # Состояние провайдеров общее для процесса: мертвый провайдер
+        # отключается один раз, а не на каждом сегменте
+        self.provider_health = get_provider_health()
+        
+        # Параллелизм: пул задач и общий для процесса семафор на каждого провайдера
+        self.max_workers = max(1, max_workers or int(os.getenv("TRANSLATION_WORKERS", "4") or 1))
+        self.provider_concurrency = dict(DEFAULT_PROVIDER_CONCURRENCY)
+        self.provider_concurrency.update(provider_concurrency or {})
+        self._provider_slots = {
+            name: get_provider_slot(name, limit)
+            for name, limit in self.provider_concurrency.items()
+        }
+        
+        # Память переводов (повторные реплики не идут в сеть/LLM)
+        if use_translation_memory is None:
+            use_translation_memory = os.getenv("TRANSLATION_MEMORY", "1").lower() not in ("0", "false", "no")
+        self.translation_memory = None
+        if use_translation_memory:
+            db_path = translation_memory_path or os.getenv(
+                "TRANSLATION_MEMORY_PATH",
+                str(APP_PATHS["models"] / "translation_memory.sqlite3")
+            )
+            try:
+                self.translation_memory = TranslationMemory(
+                    db_path,
+                    max_entries=int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "500000")),
+                    progress_callback=self.progress_callback
+                )
+            except Exception as e:
+                logger.warning(f"Память переводов недоступна: {e}")
         
     def _log(self, message: str):
         """Внутренний метод для логирования"""
         self.progress_callback(message)
         logger.info(message)
     
+    @contextmanager
+    def _provider_slot(self, provider_name: str):
+        """Ограничивает число одновременных запросов к провайдеру"""
+        slot = self._provider_slots.get(provider_name)
+        if slot is None:
+            yield
+            return
+        with slot:
+            yield
+    
+    def _should_stop(self) -> bool:
+        return bool(self.should_stop_callback and self.should_stop_callback())
+    
     def _check_deep_translator_installed(self) -> bool:
         """
         Проверяет, установлен ли deep-translator.
@@ -69,6 +216,14 @@ class Translator:
         Returns:
             True если установка успешна, False иначе
         """
+        with self._install_lock:
+            # Другой поток мог уже установить библиотеку, пока мы ждали
+            if self._deep_translator_installed:
+                return True
+            return self._run_deep_translator_install()
+    
+    def _run_deep_translator_install(self) -> bool:
+        """Запускает pip install deep-translator"""
         try:
             self._log("📦 Установка deep-translator...")
             result = subprocess.run(
@@ -81,6 +236,8 @@ class Translator:
             if result.returncode == 0:
                 self._log("✅ deep-translator успешно установлен")
                 self._deep_translator_installed = True
+                # Провайдеры падали из-за отсутствия библиотеки - даем им новый шанс
+                self.provider_health.reset()
                 return True
             else:
                 self._log(f"❌ Ошибка установки deep-translator: {result.stderr}")
@@ -103,7 +260,7 @@ class Translator:
             return self._ollama_available
         
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=2)
+            response = http_get(f"{self.ollama_url}/api/tags", timeout="probe")
             self._ollama_available = response.status_code == 200
             return self._ollama_available
         except (requests.exceptions.RequestException, requests.exceptions.Timeout):
@@ -118,7 +275,7 @@ class Translator:
             Список названий моделей
         """
         try:
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
+            response = http_get(f"{self.ollama_url}/api/tags", timeout="short")
             if response.status_code == 200:
                 data = response.json()
                 models = [model['name'] for model in data.get('models', [])]
@@ -148,22 +305,16 @@ class Translator:
         Returns:
             Переведенный текст
         """
-        # Определяем полные названия языков для промпта
-        lang_names = {
-            "en": "English",
-            "ru": "Russian",
-            "es": "Spanish",
-            "fr": "French",
-            "de": "German",
-            "it": "Italian",
-            "pt": "Portuguese",
-            "ja": "Japanese",
-            "ko": "Korean",
-            "zh": "Chinese",
-        }
+        if self.translation_memory:
+            cached = self.translation_memory.get(
+                "Ollama", model, source_lang, target_lang, text, OLLAMA_PROMPT_VERSION
+            )
+            if cached is not None:
+                return cached
         
-        source_lang_name = lang_names.get(source_lang.lower(), source_lang)
-        target_lang_name = lang_names.get(target_lang.lower(), target_lang)
+        # Определяем полные названия языков для промпта
+        source_lang_name = LANGUAGE_NAMES.get(source_lang.lower(), source_lang)
+        target_lang_name = LANGUAGE_NAMES.get(target_lang.lower(), target_lang)
         
         # Критически важный промпт для профессионального перевода
         system_prompt = (
@@ -183,17 +334,19 @@ class Translator:
                 {"role": "user", "content": user_prompt}
             ],
             "stream": False,
+            "keep_alive": get_keep_alive(),
             "options": {
                 "temperature": 0.3,  # Низкая температура для более точного перевода
             }
         }
         
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/chat",
-                json=payload,
-                timeout=60
-            )
+            with self._provider_slot("Ollama"):
+                response = http_post(
+                    f"{self.ollama_url}/api/chat",
+                    json=payload,
+                    timeout="request"
+                )
             response.raise_for_status()
             
             data = response.json()
@@ -201,7 +354,13 @@ class Translator:
             
             # Если ответ пустой, пробуем старый API /api/generate
             if not translated_text:
-                return self._translate_with_ollama_generate(text, source_lang, target_lang, model)
+                translated_text = self._translate_with_ollama_generate(text, source_lang, target_lang, model)
+            
+            if self.translation_memory:
+                self.translation_memory.put(
+                    "Ollama", model, source_lang, target_lang, text,
+                    translated_text, OLLAMA_PROMPT_VERSION
+                )
             
             return translated_text
             
@@ -222,21 +381,8 @@ class Translator:
         """
         Резервный метод перевода через /api/generate (старый API).
         """
-        lang_names = {
-            "en": "English",
-            "ru": "Russian",
-            "es": "Spanish",
-            "fr": "French",
-            "de": "German",
-            "it": "Italian",
-            "pt": "Portuguese",
-            "ja": "Japanese",
-            "ko": "Korean",
-            "zh": "Chinese",
-        }
-        
-        source_lang_name = lang_names.get(source_lang.lower(), source_lang)
-        target_lang_name = lang_names.get(target_lang.lower(), target_lang)
+        source_lang_name = LANGUAGE_NAMES.get(source_lang.lower(), source_lang)
+        target_lang_name = LANGUAGE_NAMES.get(target_lang.lower(), target_lang)
         
         prompt = (
             f"You are a professional dubbing translator. "
@@ -250,16 +396,18 @@ class Translator:
             "model": model,
             "prompt": prompt,
             "stream": False,
+            "keep_alive": get_keep_alive(),
             "options": {
                 "temperature": 0.3,
             }
         }
         
-        response = requests.post(
-            f"{self.ollama_url}/api/generate",
-            json=payload,
-            timeout=60
-        )
+        with self._provider_slot("Ollama"):
+            response = http_post(
+                f"{self.ollama_url}/api/generate",
+                json=payload,
+                timeout="request"
+            )
         response.raise_for_status()
         
         data = response.json()
@@ -267,6 +415,153 @@ class Translator:
         
         return translated_text
     
+    def _translate_batch_with_ollama(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        model: str = "qwen2.5:7b"
+    ) -> List[Optional[str]]:
+        """
+        Переводит несколько реплик одним запросом к Ollama.
+        
+        Реплики отправляются JSON списком с id, ответ разбирается обратно по id.
+        Затраты на обработку промпта делятся на весь батч.
+        
+        Args:
+            texts: Тексты для перевода
+            source_lang: Исходный язык
+            target_lang: Целевой язык
+            model: Название модели Ollama
+            
+        Returns:
+            Список переводов в том же порядке; None для реплик, которые не удалось разобрать
+        """
+        results: List[Optional[str]] = [None] * len(texts)
+        
+        # Реплики из памяти переводов в запрос не попадают
+        if self.translation_memory:
+            for idx, text in enumerate(texts):
+                results[idx] = self.translation_memory.get(
+                    "Ollama", model, source_lang, target_lang, text, OLLAMA_PROMPT_VERSION
+                )
+        pending = [idx for idx, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
+        translations = self._request_batch_with_ollama(
+            [texts[idx] for idx in pending], source_lang, target_lang, model
+        )
+        for idx, translated_text in zip(pending, translations):
+            results[idx] = translated_text
+            if translated_text is not None and self.translation_memory:
+                self.translation_memory.put(
+                    "Ollama", model, source_lang, target_lang, texts[idx],
+                    translated_text, OLLAMA_PROMPT_VERSION
+                )
+        
+        return results
+    
+    def _request_batch_with_ollama(
+        self,
+        texts: List[str],
+        source_lang: str,
+        target_lang: str,
+        model: str
+    ) -> List[Optional[str]]:
+        """
+        Запрос к Ollama с JSON списком реплик.
+
+        Ответ ограничен JSON схемой и разбирается потоково; реплики,
+        пропущенные в оборванном ответе, перезапрашиваются отдельно.
+        """
+        results: List[Optional[str]] = [None] * len(texts)
+        pending = list(range(len(texts)))
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            received = self._stream_batch_with_ollama(
+                [(idx + 1, texts[idx]) for idx in pending], source_lang, target_lang, model
+            )
+            for item_id, translated_text in received.items():
+                results[item_id - 1] = translated_text
+            missing = [idx for idx in pending if results[idx] is None]
+            if not missing or not received:
+                break
+            if attempt + 1 < MAX_BATCH_ATTEMPTS:
+                self._log(f"🔁 Перезапрос {len(missing)} пропущенных реплик батча")
+            pending = missing
+        return results
+    
+    def _stream_batch_with_ollama(
+        self,
+        items: List[tuple],
+        source_lang: str,
+        target_lang: str,
+        model: str
+    ) -> Dict[int, str]:
+        """
+        Один потоковый запрос батчевого перевода.
+        
+        Args:
+            items: Пары (id, текст)
+            
+        Returns:
+            Полученные переводы {id: текст}; принимаются только известные id с непустым текстом
+        """
+        source_lang_name = LANGUAGE_NAMES.get(source_lang.lower(), source_lang)
+        target_lang_name = LANGUAGE_NAMES.get(target_lang.lower(), target_lang)
+        
+        system_prompt = (
+            f"You are a professional dubbing translator. "
+            f"Translate each line from {source_lang_name} to {target_lang_name}. "
+            f"Lines are consecutive dialogue: use the neighbouring lines as context, "
+            f"but translate every line separately and never merge or split lines. "
+            f"Keep each translation concise and matching the original length/duration. "
+            f"Input is a JSON list of objects with \"id\" and \"text\". "
+            f"Reply ONLY with a JSON object of the form "
+            f"{{\"translations\": [{{\"id\": <id>, \"text\": \"<translation>\"}}, ...]}} "
+            f"containing exactly one entry for every input id, in the same order. "
+            f"Do NOT output any explanations."
+        )
+        
+        expected = {item_id for item_id, _ in items}
+        received: Dict[int, str] = {}
+        
+        def on_item(entry: Dict) -> bool:
+            item_id, text = entry.get("id"), entry.get("text")
+            if item_id in expected and isinstance(text, str) and text.strip():
+                received.setdefault(item_id, text.strip())
+            return len(received) < len(expected)
+        
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps(
+                    [{"id": item_id, "text": text} for item_id, text in items], ensure_ascii=False
+                )}
+            ],
+            "stream": True,
+            "keep_alive": get_keep_alive(),
+            "format": BATCH_TRANSLATION_SCHEMA,
+            "options": {
+                "temperature": 0.3,  # Низкая температура для более точного перевода
+            }
+        }
+        
+        with self._provider_slot("Ollama"):
+            with http_post(
+                f"{self.ollama_url}/api/chat",
+                json=payload,
+                timeout=TIMEOUTS["request"],
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                truncated = stream_json_items(response, on_item)
+        
+        if truncated and len(received) < len(expected):
+            self._log(f"⚠️ Ответ Ollama оборван: получено {len(received)}/{len(expected)} реплик")
+        return received
+    
     def _translate_with_deepl(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
         """
         Переводит текст с помощью DeepL (самое качество).
@@ -295,7 +590,6 @@ class Translator:
         try:
             # DeepL требует API ключ, пропускаем если его нет
             # Проверяем наличие ключа в переменных окружения
-            import os
             if not os.getenv('DEEPL_API_KEY'):
                 logger.debug("DeepL пропущен: требуется API ключ")
                 return None
@@ -309,7 +603,7 @@ class Translator:
             target_deepl = lang_map.get(target_lang.lower(), target_lang.upper())
             
             # Пытаемся использовать DeepL с API ключом
-            translator = DeeplTranslator(source=source_deepl, target=target_deepl)
+            translator = get_provider_client(DeeplTranslator, source=source_deepl, target=target_deepl)
             return translator.translate(text)
         except Exception as e:
             error_msg = str(e)
@@ -346,7 +640,7 @@ class Translator:
                 return None
         
         try:
-            translator = LibreTranslator(source=source_lang, target=target_lang)
+            translator = get_provider_client(LibreTranslator, source=source_lang, target=target_lang)
             result = translator.translate(text)
             if result and result.strip():
                 return result
@@ -382,7 +676,7 @@ class Translator:
                 return None
         
         try:
-            translator = MyMemoryTranslator(source=source_lang, target=target_lang)
+            translator = get_provider_client(MyMemoryTranslator, source=source_lang, target=target_lang)
             result = translator.translate(text)
             if result and result.strip():
                 return result
@@ -418,7 +712,7 @@ class Translator:
                 return None
         
         try:
-            translator = GoogleTranslator(source=source_lang, target=target_lang)
+            translator = get_provider_client(GoogleTranslator, source=source_lang, target=target_lang)
             result = translator.translate(text)
             if result and result.strip():
                 return result
@@ -441,48 +735,110 @@ class Translator:
         Returns:
             Переведенный текст
         """
-        # Пробуем провайдеры в порядке качества
-        providers = [
-            ("DeepL", self._translate_with_deepl),
-            ("LibreTranslate", self._translate_with_libretranslate),
-            ("MyMemory", self._translate_with_mymemory),
-            ("Google Translate", self._translate_with_google),
+        provider_names = [
+            name for name in ["DeepL", "LibreTranslate", "MyMemory", "Google Translate", "googletrans"]
+            if name not in LAST_RESORT_PROVIDERS
         ]
         
-        last_error = None
+        if self.translation_memory:
+            cached = self.translation_memory.get_any(provider_names, "", source_lang, target_lang, text)
+            if cached is not None:
+                return cached
+        
+        provider_name, result = self._translate_with_providers(text, source_lang, target_lang)
+        
+        # Перевод резервного провайдера не запоминаем - в следующий раз попробуем качественные снова
+        if self.translation_memory and provider_name not in LAST_RESORT_PROVIDERS:
+            self.translation_memory.put(provider_name, "", source_lang, target_lang, text, result)
+        
+        return result
+    
+    def _translate_with_googletrans(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """
+        Последний резерв - библиотека googletrans.
+        
+        Returns:
+            Переведенный текст или None если недоступен
+        """
+        from googletrans import Translator as GoogleTrans
+        translator = get_provider_client(GoogleTrans)
+        result = translator.translate(text, src=source_lang, dest=target_lang)
+        if result and result.text and result.text.strip():
+            return result.text
+        return None
+    
+    def _translate_with_providers(self, text: str, source_lang: str, target_lang: str) -> tuple:
+        """
+        Перебирает API провайдеры в порядке качества.
+        
+        Отключенные circuit breaker-ом провайдеры пропускаются, медленные и
+        ненадежные опускаются в конец (см. core.provider_health). Если отключены
+        все провайдеры (например, после кратковременного сбоя сети), ждем, пока
+        первый из них снова примет запрос, а не оставляем сегмент без перевода.
+        
+        Returns:
+            (название сработавшего провайдера, перевод)
+        """
+        # Пробуем провайдеры в порядке качества (googletrans - последний резерв)
+        providers = {
+            "DeepL": self._translate_with_deepl,
+            "LibreTranslate": self._translate_with_libretranslate,
+            "MyMemory": self._translate_with_mymemory,
+            "Google Translate": self._translate_with_google,
+            "googletrans": self._translate_with_googletrans,
+        }
+        
         errors_list = []
-        for provider_name, translate_func in providers:
-            try:
-                result = translate_func(text, source_lang, target_lang)
-                if result and result.strip():
-                    if provider_name != "Google Translate":  # Логируем только качественные провайдеры
-                        logger.debug(f"✅ Использован {provider_name}")
-                    return result
-                else:
+        wait_deadline = None
+        while True:
+            attempted = False
+            for provider_name in self.provider_health.order(list(providers)):
+                if not self.provider_health.allow(provider_name):
+                    errors_list.append(f"{provider_name}: временно отключен")
+                    continue
+                
+                attempted = True
+                started = time.monotonic()
+                try:
+                    with self._provider_slot(provider_name):
+                        result = providers[provider_name](text, source_lang, target_lang)
+                    if result and result.strip():
+                        self.provider_health.record_success(provider_name, time.monotonic() - started)
+                        if provider_name != "Google Translate":  # Логируем только качественные провайдеры
+                            logger.debug(f"✅ Использован {provider_name}")
+                        return provider_name, result
                     error_msg = f"{provider_name} вернул пустой результат"
-                    logger.debug(f"⚠️ {error_msg}")
-                    errors_list.append(error_msg)
-            except Exception as e:
-                last_error = e
-                error_msg = str(e)
-                logger.debug(f"⚠️ {provider_name} недоступен: {error_msg}")
-                errors_list.append(f"{provider_name}: {error_msg}")
-                continue
-        
-        # Если ничего не сработало, пробуем использовать googletrans как последний резерв
-        try:
-            from googletrans import Translator as GoogleTrans
-            translator = GoogleTrans()
-            result = translator.translate(text, src=source_lang, dest=target_lang)
-            if result and result.text and result.text.strip():
-                logger.debug("✅ Использован googletrans (резервный метод)")
-                return result.text
-        except ImportError:
-            logger.debug("⚠️ googletrans не установлен")
-        except Exception as e:
-            error_msg = str(e)
-            logger.debug(f"⚠️ googletrans также недоступен: {error_msg}")
-            errors_list.append(f"googletrans: {error_msg}")
+                except ImportError:
+                    error_msg = f"{provider_name}: библиотека не установлена"
+                except Exception as e:
+                    error_msg = f"{provider_name}: {e}"
+                
+                logger.debug(f"⚠️ {error_msg}")
+                errors_list.append(error_msg)
+                if self.provider_health.record_failure(provider_name, time.monotonic() - started):
+                    self._log(
+                        f"⚡ Провайдер {provider_name} временно отключен после "
+                        f"{self.provider_health.failure_threshold} ошибок подряд"
+                    )
+            
+            # Настоящие ошибки провайдеров или остановка - больше не ждем
+            if attempted or self._should_stop():
+                break
+            
+            # Все провайдеры отключены: ждем ближайшего пробного запроса (не дольше
+            # двух периодов отключения, чтобы не зависнуть на постоянно мертвой сети)
+            if wait_deadline is None:
+                wait_deadline = time.monotonic() + 2 * self.provider_health.open_seconds + 5
+            wait = self.provider_health.seconds_until_retry(list(providers))
+            if time.monotonic() + wait > wait_deadline:
+                break
+            if time.monotonic() - self._providers_wait_logged_at > 10:
+                self._providers_wait_logged_at = time.monotonic()
+                self._log(f"⏳ Все провайдеры перевода временно отключены, ждем {wait:.0f} с...")
+            wait_until = time.monotonic() + wait
+            while time.monotonic() < wait_until and not self._should_stop():
+                time.sleep(min(0.5, max(0.0, wait_until - time.monotonic())))
+            errors_list = []
         
         # Формируем детальное сообщение об ошибке
         errors_summary = "; ".join(errors_list[:3])  # Первые 3 ошибки
@@ -519,6 +875,202 @@ class Translator:
         # По умолчанию английский
         return "en"
     
+    def _translate_segment(
+        self,
+        segment: Dict,
+        current_idx: int,
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        use_ollama: bool,
+        use_fallback: bool
+    ) -> Optional[Dict]:
+        """
+        Переводит один сегмент (с резервными методами при ошибке).
+        
+        Returns:
+            Новый сегмент с переведенным текстом или None, если перевести не удалось
+        """
+        text = segment.get("text", "").strip()
+        
+        if not text:
+            # Если текста нет, просто копируем сегмент
+            return segment.copy()
+        
+        try:
+            # Переводим текст
+            if use_ollama:
+                translated_text = self._translate_with_ollama(
+                    text, source_lang, target_lang, model
+                )
+            else:
+                translated_text = self._translate_with_fallback(
+                    text, source_lang, target_lang
+                )
+            
+            # Создаем новый сегмент с переведенным текстом
+            new_segment = segment.copy()
+            new_segment["text"] = translated_text
+            return new_segment
+            
+        except InterruptedError:
+            self._log("⏹️ Перевод прерван пользователем")
+            raise
+        except RuntimeError as e:
+            error_msg = str(e)
+            # Проверяем, связана ли ошибка с отсутствием deep-translator
+            if "deep-translator" in error_msg.lower() or "установите: pip install" in error_msg.lower():
+                # Проверяем, установлен ли deep-translator
+                if not self._check_deep_translator_installed():
+                    # Пытаемся установить
+                    if self._install_deep_translator():
+                        # Повторяем попытку перевода
+                        try:
+                            self._log(f"🔄 Повторная попытка перевода сегмента {current_idx}...")
+                            if use_ollama:
+                                translated_text = self._translate_with_ollama(
+                                    text, source_lang, target_lang, model
+                                )
+                            else:
+                                translated_text = self._translate_with_fallback(
+                                    text, source_lang, target_lang
+                                )
+                            new_segment = segment.copy()
+                            new_segment["text"] = translated_text
+                            # Успешно переведено
+                            return new_segment
+                        except Exception as retry_error:
+                            self._log(f"❌ Повторная попытка не удалась: {retry_error}")
+                            # Оставляем оригинальный текст
+                            return None
+                    else:
+                        # Установка не удалась
+                        self._log(f"❌ Не удалось установить deep-translator. Оставляем оригинальный текст.")
+                        return None
+                else:
+                    # Библиотека уже установлена, но все равно ошибка
+                    self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {error_msg}")
+                    return None
+            
+            # Другая ошибка
+            self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {error_msg}")
+        except Exception as e:
+            self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {str(e)}")
+        
+        # Если Ollama не сработал, пробуем резервный метод
+        if use_ollama and use_fallback:
+            try:
+                self._log(f"🔄 Пробуем резервный метод для сегмента {current_idx}...")
+                translated_text = self._translate_with_fallback(
+                    text, source_lang, target_lang
+                )
+                new_segment = segment.copy()
+                new_segment["text"] = translated_text
+                return new_segment
+            except Exception as fallback_error:
+                self._log(f"❌ Резервный метод тоже не сработал: {fallback_error}")
+        
+        # Перевести не удалось (оригинальный текст оставит вызывающий)
+        return None
+    
+    def _translate_ollama_batch(
+        self,
+        batch: List[Dict],
+        source_lang: str,
+        target_lang: str,
+        model: str
+    ) -> List[Optional[Dict]]:
+        """
+        Переводит батч сегментов одним запросом к Ollama.
+        
+        Returns:
+            Переведенные сегменты по позициям батча; None там, где ответ
+            не удалось разобрать (такие сегменты переводятся по одному)
+        """
+        results: List[Optional[Dict]] = [None] * len(batch)
+        
+        positions = []
+        texts = []
+        for pos, segment in enumerate(batch):
+            text = segment.get("text", "").strip()
+            if not text:
+                results[pos] = segment.copy()
+            else:
+                positions.append(pos)
+                texts.append(text)
+        
+        if not texts:
+            return results
+        
+        try:
+            translations = self._translate_batch_with_ollama(texts, source_lang, target_lang, model)
+        except Exception as e:
+            self._log(f"⚠️ Ошибка батчевого перевода через Ollama: {e}")
+            return results
+        
+        for pos, translated_text in zip(positions, translations):
+            if translated_text is not None:
+                new_segment = batch[pos].copy()
+                new_segment["text"] = translated_text
+                results[pos] = new_segment
+        
+        return results
+    
+    def _translate_unit(
+        self,
+        start_index: int,
+        batch: List[Dict],
+        total: int,
+        source_lang: str,
+        target_lang: str,
+        model: str,
+        use_ollama: bool,
+        use_fallback: bool
+    ) -> tuple:
+        """
+        Переводит один батч сегментов (единица работы для пула потоков).
+        
+        Returns:
+            (переведенные сегменты в исходном порядке, число реплик, переведенных по одной
+            после неудачного разбора батча, число реплик, оставшихся без перевода)
+        """
+        fallbacks = 0
+        if use_ollama and len(batch) > 1:
+            self._log(f"🔄 Перевод сегментов {start_index + 1}-{start_index + len(batch)}/{total} (один запрос)...")
+            batch_results = self._translate_ollama_batch(batch, source_lang, target_lang, model)
+            fallbacks = sum(1 for result in batch_results if result is None)
+            if fallbacks:
+                self._log(f"⚠️ Не разобрано {fallbacks}/{len(batch)} реплик, переводим их по одной")
+        else:
+            batch_results = [None] * len(batch)
+        
+        translated = []
+        untranslated = 0
+        for seg_idx, segment in enumerate(batch):
+            if batch_results[seg_idx] is not None:
+                translated.append(batch_results[seg_idx])
+                continue
+            
+            # Проверяем флаг остановки в цикле
+            if self._should_stop():
+                self._log("⏹️ Перевод прерван пользователем")
+                raise InterruptedError("Processing stopped by user")
+            
+            current_idx = start_index + seg_idx + 1
+            self._log(f"🔄 Перевод сегмента {current_idx}/{total}...")
+            
+            result = self._translate_segment(
+                segment, current_idx, source_lang, target_lang,
+                model, use_ollama, use_fallback
+            )
+            if result is None:
+                # Оставляем оригинальный текст
+                untranslated += 1
+                result = segment.copy()
+            translated.append(result)
+        
+        return translated, fallbacks, untranslated
+    
     def translate_segments(
         self,
         segments: List[Dict],
@@ -527,7 +1079,8 @@ class Translator:
         model: str = "qwen2.5:7b",
         use_fallback: bool = True,
         force_fallback: bool = False,
-        batch_size: int = 1
+        batch_size: Optional[int] = None,
+        prefer_ollama: bool = False
     ) -> List[Dict]:
         """
         Переводит список сегментов, сохраняя временные метки и спикеров.
@@ -539,11 +1092,15 @@ class Translator:
             model: Название модели Ollama (используется только если Ollama доступен)
             use_fallback: Использовать резервный метод перевода, если Ollama недоступен
             force_fallback: Принудительно использовать только резервный метод (игнорировать Ollama)
-            batch_size: Размер батча для перевода (1 = по одному сегменту)
+            batch_size: Сколько сегментов переводить одним запросом к Ollama
+                (по умолчанию DEFAULT_OLLAMA_BATCH_SIZE; API переводит по одному)
+            prefer_ollama: Использовать Ollama, если он доступен (иначе - качественный API)
             
         Returns:
-            Новый список сегментов с переведенным текстом
+            Новый список сегментов с переведенным текстом. Сегменты, которые не удалось
+            перевести, остаются с оригинальным текстом; их число - в self.untranslated_count
         """
+        self.untranslated_count = 0
         if not segments:
             self._log("ℹ️ Список сегментов пуст")
             return []
@@ -552,9 +1109,6 @@ class Translator:
         if not isinstance(segments, list):
             raise TypeError("segments должен быть списком")
         
-        if batch_size < 1:
-            batch_size = 1
-        
         # Определяем исходный язык
         if source_lang is None:
             source_lang = self._detect_language(segments)
@@ -574,12 +1128,12 @@ class Translator:
             use_ollama = False
             self._log("🌐 Используется качественный API перевод (DeepL/LibreTranslate/MyMemory/Google)")
         else:
-            # Проверяем доступность Ollama, но не делаем его приоритетным
             ollama_available = self._check_ollama_available()
-            # По умолчанию используем API, но если пользователь хочет Ollama - используем
-            use_ollama = False  # Отключаем Ollama по умолчанию для лучшего качества
-            if ollama_available:
+            use_ollama = prefer_ollama and ollama_available
+            if ollama_available and not use_ollama:
                 self._log("💡 Ollama доступен, но используется качественный API перевод для лучшего результата")
+            elif prefer_ollama and not ollama_available:
+                self._log("⚠️ Ollama недоступен")
         
         if use_ollama:
             self._log(f"🤖 Используется Ollama (модель: {model})")
@@ -591,135 +1145,80 @@ class Translator:
                 "Установите: pip install deep-translator"
             )
         
-        # Создаем копию сегментов для перевода
-        translated_segments = []
+        # Батчи имеют смысл только для Ollama: API провайдеры переводят по одной реплике
+        if not use_ollama:
+            batch_size = 1
+        elif batch_size is None:
+            batch_size = DEFAULT_OLLAMA_BATCH_SIZE
+        batch_size = max(1, batch_size)
+        
         total = len(segments)
+        units = [(i, segments[i:i + batch_size]) for i in range(0, total, batch_size)]
         
-        # Обрабатываем сегменты батчами или по одному
-        for i in range(0, total, batch_size):
-            # Проверяем флаг остановки в цикле
-            if self.should_stop_callback and self.should_stop_callback():
-                self._log("⏹️ Перевод прерван пользователем")
-                raise InterruptedError("Processing stopped by user")
-            
-            batch = segments[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (total + batch_size - 1) // batch_size
-            
-            for seg_idx, segment in enumerate(batch):
+        # Ollama обрабатывает не больше OLLAMA_NUM_PARALLEL запросов одновременно,
+        # для API провайдеров ограничиваем общий пул (а каждого провайдера - его семафором)
+        if use_ollama:
+            workers = self.provider_concurrency.get("Ollama", 1)
+        else:
+            workers = self.max_workers
+        workers = max(1, min(workers, len(units)))
+        
+        def run_unit(unit):
+            start_index, batch = unit
+            return self._translate_unit(
+                start_index, batch, total, source_lang, target_lang,
+                model, use_ollama, use_fallback
+            )
+        
+        unit_results = [None] * len(units)
+        
+        if workers == 1:
+            # Обрабатываем сегменты батчами или по одному
+            for unit_idx, unit in enumerate(units):
                 # Проверяем флаг остановки в цикле
-                if self.should_stop_callback and self.should_stop_callback():
+                if self._should_stop():
                     self._log("⏹️ Перевод прерван пользователем")
                     raise InterruptedError("Processing stopped by user")
                 
-                current_idx = i + seg_idx + 1
-                self._log(f"🔄 Перевод сегмента {current_idx}/{total}...")
-                
-                text = segment.get("text", "").strip()
+                unit_results[unit_idx] = run_unit(unit)
                 
-                if not text:
-                    # Если текста нет, просто копируем сегмент
-                    translated_segments.append(segment.copy())
-                    continue
-                
-                try:
-                    # Переводим текст
-                    if use_ollama:
-                        translated_text = self._translate_with_ollama(
-                            text, source_lang, target_lang, model
-                        )
-                    else:
-                        translated_text = self._translate_with_fallback(
-                            text, source_lang, target_lang
-                        )
-                    
-                    # Создаем новый сегмент с переведенным текстом
-                    new_segment = segment.copy()
-                    new_segment["text"] = translated_text
-                    translated_segments.append(new_segment)
-                    
-                except InterruptedError:
-                    self._log("⏹️ Перевод прерван пользователем")
-                    raise
-                except RuntimeError as e:
-                    error_msg = str(e)
-                    # Проверяем, связана ли ошибка с отсутствием deep-translator
-                    if "deep-translator" in error_msg.lower() or "установите: pip install" in error_msg.lower():
-                        # Проверяем, установлен ли deep-translator
-                        if not self._check_deep_translator_installed():
-                            # Пытаемся установить
-                            if self._install_deep_translator():
-                                # Повторяем попытку перевода
-                                try:
-                                    self._log(f"🔄 Повторная попытка перевода сегмента {current_idx}...")
-                                    if use_ollama:
-                                        translated_text = self._translate_with_ollama(
-                                            text, source_lang, target_lang, model
-                                        )
-                                    else:
-                                        translated_text = self._translate_with_fallback(
-                                            text, source_lang, target_lang
-                                        )
-                                    new_segment = segment.copy()
-                                    new_segment["text"] = translated_text
-                                    translated_segments.append(new_segment)
-                                    # Успешно переведено, переходим к следующему сегменту
-                                    continue
-                                except Exception as retry_error:
-                                    self._log(f"❌ Повторная попытка не удалась: {retry_error}")
-                                    # Оставляем оригинальный текст
-                                    translated_segments.append(segment.copy())
-                            else:
-                                # Установка не удалась
-                                self._log(f"❌ Не удалось установить deep-translator. Оставляем оригинальный текст.")
-                                translated_segments.append(segment.copy())
-                        else:
-                            # Библиотека уже установлена, но все равно ошибка
-                            self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {error_msg}")
-                            translated_segments.append(segment.copy())
-                    else:
-                        # Другая ошибка
-                        self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {error_msg}")
-                        # Если Ollama не сработал, пробуем резервный метод
-                        if use_ollama and use_fallback:
-                            try:
-                                self._log(f"🔄 Пробуем резервный метод для сегмента {current_idx}...")
-                                translated_text = self._translate_with_fallback(
-                                    text, source_lang, target_lang
-                                )
-                                new_segment = segment.copy()
-                                new_segment["text"] = translated_text
-                                translated_segments.append(new_segment)
-                            except Exception as fallback_error:
-                                self._log(f"❌ Резервный метод тоже не сработал: {fallback_error}")
-                                # Оставляем оригинальный текст
-                                translated_segments.append(segment.copy())
-                        else:
-                            # Оставляем оригинальный текст
-                            translated_segments.append(segment.copy())
-                except Exception as e:
-                    self._log(f"⚠️ Ошибка перевода сегмента {current_idx}: {str(e)}")
-                    # Если Ollama не сработал, пробуем резервный метод
-                    if use_ollama and use_fallback:
-                        try:
-                            self._log(f"🔄 Пробуем резервный метод для сегмента {current_idx}...")
-                            translated_text = self._translate_with_fallback(
-                                text, source_lang, target_lang
-                            )
-                            new_segment = segment.copy()
-                            new_segment["text"] = translated_text
-                            translated_segments.append(new_segment)
-                        except Exception as fallback_error:
-                            self._log(f"❌ Резервный метод тоже не сработал: {fallback_error}")
-                            # Оставляем оригинальный текст
-                            translated_segments.append(segment.copy())
-                    else:
-                        # Оставляем оригинальный текст
-                        translated_segments.append(segment.copy())
-            
-            # Небольшая задержка между батчами, чтобы не перегружать API
-            if i + batch_size < total:
-                time.sleep(0.1)
+                # Небольшая задержка между батчами, чтобы не перегружать API
+                if unit_idx + 1 < len(units):
+                    time.sleep(0.1)
+        else:
+            self._log(f"⚡ Параллельный перевод: {workers} потоков")
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate")
+            futures = {executor.submit(run_unit, unit): idx for idx, unit in enumerate(units)}
+            pending = set(futures)
+            try:
+                while pending:
+                    # Ждем с таймаутом, чтобы быстро реагировать на остановку
+                    done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        unit_results[futures[future]] = future.result()
+                    if pending and self._should_stop():
+                        self._log("⏹️ Перевод прерван пользователем")
+                        raise InterruptedError("Processing stopped by user")
+            finally:
+                # Невыполненные задачи отменяем, запросы "в полете" не ждем
+                executor.shutdown(wait=False, cancel_futures=True)
+        
+        # Собираем результат в исходном порядке
+        translated_segments = []
+        batch_fallbacks = 0
+        for segments_part, fallbacks, untranslated in unit_results:
+            translated_segments.extend(segments_part)
+            batch_fallbacks += fallbacks
+            self.untranslated_count += untranslated
+        
+        if self.untranslated_count:
+            self._log(f"⚠️ Без перевода осталось {self.untranslated_count}/{total} сегментов (оригинальный текст)")
+        
+        if use_ollama and batch_size > 1:
+            self._log(f"📊 Батчевый перевод: {total - batch_fallbacks}/{total} реплик за один запрос на батч")
+        
+        if self.translation_memory:
+            self.translation_memory.log_stats()
         
         self._log(f"✅ Перевод завершен: {len(translated_segments)} сегментов")
         return translated_segments
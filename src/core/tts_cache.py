@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed кэш готовых TTS сегментов.
+Повторный запуск дубляжа синтезирует заново только измененные реплики.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Временный файл записи старше этого считается брошенным (процесс упал во время store)
+_STALE_TMP_SECONDS = 3600
+
+
+class TTSOutputCache:
+    """
+    Кэш WAV файлов, адресуемый хэшем входных данных синтеза.
+
+    Ключ = sha256(нормализованный текст, содержимое референса спикера,
+    язык, модель, параметры синтеза). Размер ограничен, при переполнении
+    удаляются давно не использованные записи (LRU по времени доступа).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size_bytes: int = 2 * 1024 ** 3,
+        progress_callback: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            cache_dir: Папка кэша
+            max_size_bytes: Максимальный суммарный размер кэша
+            progress_callback: Функция для логирования
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.progress_callback = progress_callback or (lambda msg: None)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._file_hashes = {}  # {путь: (mtime, size, sha256)}
+        self._entries = OrderedDict()  # {ключ: размер}, от давно использованных к свежим
+        self._total_size = 0
+        self._load_index()
+
+    def _log(self, message: str):
+        """Внутренний метод для логирования"""
+        self.progress_callback(message)
+        logger.info(message)
+
+    def _load_index(self):
+        """Восстанавливает LRU порядок по времени последнего доступа к файлам"""
+        files = []
+        for path in self.cache_dir.glob("*.wav"):
+            try:
+                stat = path.stat()
+                files.append((stat.st_mtime, path.stem, stat.st_size))
+            except OSError:
+                continue
+
+        now = time.time()
+        for path in self.cache_dir.glob("*.tmp"):
+            try:
+                # Недописанная запись (ошибка или падение во время store). Свежие не трогаем:
+                # их может прямо сейчас писать другой процесс с тем же кэшем
+                if now - path.stat().st_mtime > _STALE_TMP_SECONDS:
+                    path.unlink()
+            except OSError:
+                continue
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_size += size
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Нормализация текста: лишние пробелы не должны менять ключ"""
+        return re.sub(r"\s+", " ", text or "").strip()
+
+    def _file_sha256(self, path: str) -> str:
+        """Хэш содержимого файла (с мемоизацией по mtime/размеру)"""
+        stat = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        self._file_hashes[path] = (stat.st_mtime, stat.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def make_key(
+        self,
+        text: str,
+        speaker_wav: str,
+        language: str,
+        model_name: str,
+        params: Optional[Dict] = None
+    ) -> str:
+        """
+        Вычисляет ключ кэша для сегмента.
+
+        Args:
+            text: Текст сегмента
+            speaker_wav: Путь к референсному аудио спикера
+            language: Язык синтеза
+            model_name: Название модели TTS
+            params: Параметры синтеза (должны быть JSON-сериализуемы)
+
+        Returns:
+            Хэш-ключ (hex)
+        """
+        payload = {
+            "text": self.normalize_text(text),
+            "speaker": self._file_sha256(speaker_wav),
+            "language": language,
+            "model": model_name,
+            "params": params or {},
+        }
+        return hashlib.sha256(
+            json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.wav"
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """
+        Копирует закэшированный WAV в output_path.
+
+        Returns:
+            True при попадании в кэш
+        """
+        cached_path = self._path(key)
+
+        with self._lock:
+            if key not in self._entries or not cached_path.exists():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        try:
+            shutil.copyfile(cached_path, output_path)
+            # Время доступа хранит LRU порядок между запусками
+            os.utime(cached_path, None)
+            return True
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать кэш TTS {cached_path}: {e}")
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+            return False
+
+    def store(self, key: str, source_path: str):
+        """Сохраняет сгенерированный WAV в кэш и при необходимости вытесняет старые записи"""
+        if not os.path.exists(source_path):
+            return
+
+        cached_path = self._path(key)
+        tmp_path = cached_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        except OSError as e:
+            logger.warning(f"Не удалось записать кэш TTS {cached_path}: {e}")
+            # Недописанный файл (например, кончилось место) не учтен в размере кэша - удаляем сразу
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return
+
+        size = cached_path.stat().st_size
+        with self._lock:
+            self._total_size -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._total_size += size
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока размер не уложится в лимит"""
+        while self._total_size > self.max_size_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_size -= size
+            self.evictions += 1
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._total_size,
+            }
+
+    def log_stats(self):
+        """Пишет статистику кэша в лог"""
+        stats = self.stats()
+        self._log(
+            f"📦 Кэш TTS: попаданий {stats['hits']}, промахов {stats['misses']} "
+            f"({stats['hit_rate'] * 100:.0f}%), вытеснено {stats['evictions']}, "
+            f"{stats['entries']} файлов / {stats['size_bytes'] / 1024 ** 2:.0f} МБ"
+        )
@@ -3,11 +3,17 @@
 """
 Вспомогательный скрипт для генерации TTS через venv_tts.
 Запускается в отдельном процессе с Python 3.11+ из venv_tts.
+
+Режимы работы:
+- Разовый (по умолчанию): читает один JSON-запрос из stdin, пишет результат в stdout.
+- Сервер (--server): загружает модель один раз и обрабатывает запросы
+  построчно (newline-delimited JSON) из stdin, отвечая по одной строке в stdout.
 """
 import sys
 import json
 import os
 import time
+import hashlib
 
 # Устанавливаем переменную окружения для лицензии
 os.environ["COQUI_TOS_AGREED"] = "1"
@@ -16,7 +22,183 @@ os.environ["COQUI_TOS_AGREED"] = "1"
 _cached_tts = None
 _cached_model_name = None
 
-def generate_tts(text: str, speaker_wav: str, output_path: str, language: str = "ru", model_name: str = "tts_models/multilingual/multi-dataset/xtts_v2", segment_info: dict = None):
+# Латенты спикеров в памяти процесса: {ключ: (gpt_cond_latent, speaker_embedding)}
+_cached_latents = {}
+
+# Хэши содержимого референсов: {realpath: (mtime_ns, size, sha256)}
+_reference_hashes = {}
+
+def _load_model(model_name: str) -> float:
+    """
+    Загружает модель в глобальный кэш (если она еще не загружена).
+    
+    Returns:
+        Время загрузки в секундах (0.0, если модель уже была в памяти)
+    """
+    global _cached_tts, _cached_model_name
+    
+    if _cached_tts is not None and _cached_model_name == model_name:
+        return 0.0
+    
+    from TTS.api import TTS
+    
+    load_start = time.time()
+    print("📦 Загрузка модели XTTS...", file=sys.stderr, flush=True)
+    _cached_tts = TTS(model_name=model_name, progress_bar=False)
+    _cached_model_name = model_name
+    load_time = time.time() - load_start
+    print(f"✅ Модель загружена за {load_time:.1f}с", file=sys.stderr, flush=True)
+    return load_time
+
+
+def _reference_sha256(speaker_wav: str) -> str:
+    """Хэш содержимого референса (с мемоизацией по mtime/размеру, файл не перечитывается на каждом сегменте)"""
+    stat = os.stat(speaker_wav)
+    real_path = os.path.realpath(speaker_wav)
+    cached = _reference_hashes.get(real_path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(speaker_wav, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    _reference_hashes[real_path] = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def _speaker_latents_key(speaker_wav: str, model_name: str, cond_params: dict) -> str:
+    """Ключ кэша латентов: хэш содержимого референса + модель + параметры кондиционирования"""
+    digest = hashlib.sha256()
+    digest.update(_reference_sha256(speaker_wav).encode("utf-8"))
+    digest.update(model_name.encode("utf-8"))
+    digest.update(json.dumps(cond_params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _get_xtts_model(tts):
+    """Возвращает внутреннюю модель XTTS (или None, если модель не XTTS)"""
+    model = getattr(getattr(tts, "synthesizer", None), "tts_model", None)
+    if model is not None and hasattr(model, "get_conditioning_latents") and hasattr(model, "inference"):
+        return model
+    return None
+
+
+def get_speaker_latents(tts, speaker_wav: str, model_name: str, latents_dir: str = None):
+    """
+    Возвращает (gpt_cond_latent, speaker_embedding) для референса спикера.
+    
+    Латенты вычисляются один раз на содержимое референса: сначала ищутся
+    в памяти процесса, затем в .npz на диске (latents_dir), и только потом
+    считаются энкодером XTTS.
+    
+    Returns:
+        Кортеж тензоров или None, если модель не XTTS
+    """
+    model = _get_xtts_model(tts)
+    if model is None:
+        return None
+    
+    config = model.config
+    cond_params = {
+        "gpt_cond_len": config.gpt_cond_len,
+        "gpt_cond_chunk_len": config.gpt_cond_chunk_len,
+        "max_ref_len": config.max_ref_len,
+        "sound_norm_refs": config.sound_norm_refs,
+    }
+    key = _speaker_latents_key(speaker_wav, model_name, cond_params)
+    
+    if key in _cached_latents:
+        return _cached_latents[key]
+    
+    import torch
+    import numpy as np
+    
+    cache_path = os.path.join(latents_dir, f"{key}.npz") if latents_dir else None
+    
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                latents = (
+                    torch.from_numpy(data["gpt_cond_latent"]).to(model.device),
+                    torch.from_numpy(data["speaker_embedding"]).to(model.device),
+                )
+            _cached_latents[key] = latents
+            print(f"♻️ Латенты спикера загружены из кэша: {os.path.basename(speaker_wav)}", file=sys.stderr, flush=True)
+            return latents
+        except Exception as e:
+            print(f"⚠️ Поврежденный кэш латентов {cache_path}: {e}", file=sys.stderr, flush=True)
+    
+    start = time.time()
+    gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(
+        audio_path=[speaker_wav],
+        gpt_cond_len=cond_params["gpt_cond_len"],
+        gpt_cond_chunk_len=cond_params["gpt_cond_chunk_len"],
+        max_ref_length=cond_params["max_ref_len"],
+        sound_norm_refs=cond_params["sound_norm_refs"],
+    )
+    latents = (gpt_cond_latent, speaker_embedding)
+    _cached_latents[key] = latents
+    print(f"🧬 Латенты спикера вычислены за {time.time() - start:.1f}с: {os.path.basename(speaker_wav)}", file=sys.stderr, flush=True)
+    
+    if cache_path:
+        try:
+            os.makedirs(latents_dir, exist_ok=True)
+            # Пишем во временный файл и атомарно переименовываем (параллельные воркеры)
+            tmp_path = f"{cache_path[:-4]}.{os.getpid()}.tmp.npz"
+            np.savez(
+                tmp_path,
+                gpt_cond_latent=gpt_cond_latent.detach().cpu().numpy(),
+                speaker_embedding=speaker_embedding.detach().cpu().numpy(),
+            )
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить кэш латентов: {e}", file=sys.stderr, flush=True)
+    
+    return latents
+
+
+def synthesize_to_file(tts, text: str, speaker_wav: str, language: str, output_path: str, model_name: str, latents_dir: str = None):
+    """
+    Синтезирует речь в файл.
+    
+    Для XTTS инференс идет напрямую из закэшированных латентов спикера
+    (без повторного прогона энкодера по референсу на каждом сегменте).
+    Для остальных моделей - обычный tts_to_file.
+    """
+    latents = get_speaker_latents(tts, speaker_wav, model_name, latents_dir)
+    
+    if latents is None:
+        tts.tts_to_file(
+            text=text,
+            speaker_wav=speaker_wav,
+            language=language,
+            file_path=output_path,
+            split_sentences=False
+        )
+        return
+    
+    model = _get_xtts_model(tts)
+    config = model.config
+    gpt_cond_latent, speaker_embedding = latents
+    
+    out = model.inference(
+        text,
+        language,
+        gpt_cond_latent,
+        speaker_embedding,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        enable_text_splitting=False  # Мы сами разбиваем на предложения
+    )
+    tts.synthesizer.save_wav(wav=out["wav"], path=output_path)
+
+
+def generate_tts(text: str, speaker_wav: str, output_path: str, language: str = "ru", model_name: str = "tts_models/multilingual/multi-dataset/xtts_v2", segment_info: dict = None, latents_dir: str = None):
     """
     Генерирует аудио с помощью TTS.
     
@@ -27,34 +209,16 @@ def generate_tts(text: str, speaker_wav: str, output_path: str, language: str =
         language: Язык генерации
         model_name: Название модели TTS
         segment_info: Информация о сегменте для логирования {"index": int, "total": int}
+        latents_dir: Папка дискового кэша латентов спикеров (None - только в памяти)
         
     Returns:
         dict с результатом: {"success": bool, "error": str или None, "load_time": float, "gen_time": float}
     """
-    global _cached_tts, _cached_model_name
-    
     load_start = time.time()
     
     try:
-        from TTS.api import TTS
-        
         # Кэшируем модель, если она еще не загружена или изменилась
-        if _cached_tts is None or _cached_model_name != model_name:
-            if segment_info:
-                print(f"📦 [{segment_info['index']}/{segment_info['total']}] Загрузка модели XTTS...", file=sys.stderr, flush=True)
-            else:
-                print("📦 Загрузка модели XTTS...", file=sys.stderr, flush=True)
-            
-            _cached_tts = TTS(model_name=model_name, progress_bar=False)
-            _cached_model_name = model_name
-            
-            load_time = time.time() - load_start
-            if segment_info:
-                print(f"✅ [{segment_info['index']}/{segment_info['total']}] Модель загружена за {load_time:.1f}с", file=sys.stderr, flush=True)
-            else:
-                print(f"✅ Модель загружена за {load_time:.1f}с", file=sys.stderr, flush=True)
-        else:
-            load_time = 0.0  # Модель уже загружена
+        load_time = _load_model(model_name)
         
         # Генерируем аудио
         gen_start = time.time()
@@ -84,12 +248,14 @@ def generate_tts(text: str, speaker_wav: str, output_path: str, language: str =
         }
         normalized_language = lang_map.get(language.upper(), language.lower())
         
-        _cached_tts.tts_to_file(
+        synthesize_to_file(
+            _cached_tts,
             text=text,
             speaker_wav=speaker_wav,
             language=normalized_language,
-            file_path=output_path,
-            split_sentences=False
+            output_path=output_path,
+            model_name=model_name,
+            latents_dir=latents_dir
         )
         
         gen_time = time.time() - gen_start
@@ -112,18 +278,110 @@ def generate_tts(text: str, speaker_wav: str, output_path: str, language: str =
         }
 
 
-if __name__ == "__main__":
-    # Читаем аргументы из stdin (JSON)
-    input_data = json.loads(sys.stdin.read())
-    
-    result = generate_tts(
+def _run_single(input_data: dict) -> dict:
+    """Выполняет один запрос на генерацию"""
+    return generate_tts(
         text=input_data["text"],
         speaker_wav=input_data["speaker_wav"],
         output_path=input_data["output_path"],
         language=input_data.get("language", "ru"),
         model_name=input_data.get("model_name", "tts_models/multilingual/multi-dataset/xtts_v2"),
-        segment_info=input_data.get("segment_info")
+        segment_info=input_data.get("segment_info"),
+        latents_dir=input_data.get("latents_dir")
     )
+
+
+def _set_thread_budget(num_threads: int):
+    """Ограничивает число потоков torch (важно при нескольких воркерах на одной машине)"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+        torch.set_num_interop_threads(1)
+    except Exception as e:
+        print(f"⚠️ Не удалось ограничить потоки torch: {e}", file=sys.stderr, flush=True)
+
+
+def serve(model_name: str = None, num_threads: int = None):
+    """
+    Резидентный режим: модель загружается один раз, затем воркер
+    обрабатывает запросы построчно из stdin до команды shutdown или EOF.
+    
+    Протокол (одна JSON-строка на запрос/ответ):
+        {"id": 1, "cmd": "generate", "text": ..., "speaker_wav": ..., "output_path": ...}
+        {"id": 2, "cmd": "ping"}
+        {"id": 3, "cmd": "shutdown"}
+    Ответ повторяет "id" запроса. При старте воркер пишет {"event": "ready", ...}.
+    """
+    # stdout зарезервирован под протокол: всё, что печатают TTS/torch, уходит в stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    
+    def send(message: dict):
+        protocol_out.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol_out.flush()
+    
+    if num_threads:
+        _set_thread_budget(num_threads)
     
-    # Выводим результат в stdout (JSON)
-    print(json.dumps(result))
+    ready = {"event": "ready", "pid": os.getpid(), "model_loaded": False, "error": None}
+    if model_name:
+        try:
+            ready["load_time"] = _load_model(model_name)
+            ready["model_loaded"] = True
+        except Exception as e:
+            ready["error"] = str(e)
+    send(ready)
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            send({"id": None, "success": False, "error": f"Некорректный JSON: {e}"})
+            continue
+        
+        request_id = request.get("id")
+        cmd = request.get("cmd", "generate")
+        
+        if cmd == "ping":
+            send({"id": request_id, "success": True, "model_loaded": _cached_tts is not None, "model_name": _cached_model_name})
+        elif cmd == "shutdown":
+            send({"id": request_id, "success": True})
+            break
+        elif cmd == "generate":
+            try:
+                result = _run_single(request)
+            except KeyError as e:
+                result = {"success": False, "error": f"Не хватает поля запроса: {e}", "load_time": 0.0, "gen_time": 0.0}
+            result["id"] = request_id
+            send(result)
+        else:
+            send({"id": request_id, "success": False, "error": f"Неизвестная команда: {cmd}"})
+
+
+if __name__ == "__main__":
+    if "--server" in sys.argv:
+        # Модель для предзагрузки: --model <name>
+        preload_model = None
+        if "--model" in sys.argv:
+            model_arg_index = sys.argv.index("--model") + 1
+            if model_arg_index < len(sys.argv):
+                preload_model = sys.argv[model_arg_index]
+        # Бюджет потоков torch: --threads <n>
+        threads = None
+        if "--threads" in sys.argv:
+            threads_arg_index = sys.argv.index("--threads") + 1
+            if threads_arg_index < len(sys.argv):
+                threads = int(sys.argv[threads_arg_index])
+        serve(preload_model, threads)
+    else:
+        # Читаем аргументы из stdin (JSON)
+        input_data = json.loads(sys.stdin.read())
+        
+        result = _run_single(input_data)
+        
+        # Выводим результат в stdout (JSON)
+        print(json.dumps(result))
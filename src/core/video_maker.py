@@ -4,6 +4,7 @@ Video Maker Module
 Сборка финального дублированного видео из сегментов с TTS аудио.
 """
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
@@ -12,6 +13,9 @@ from typing import List, Dict, Optional, Callable
 from pydub import AudioSegment
 import logging
 
+from core.audio_mixer import AudioTimelineMixer, get_wav_duration, load_audio, DEFAULT_SAMPLE_RATE
+from core.time_stretch import get_stretch_executor, fit_batch
+
 # Пытаемся импортировать moviepy
 MOVIEPY_AVAILABLE = False
 MOVIEPY_CHECKED = False
@@ -67,6 +71,52 @@ if not _check_moviepy_installed():
 
 logger = logging.getLogger(__name__)
 
+# Режимы сборки аудио: один граф фильтров FFmpeg, микшер в памяти с WSOLA
+# или микшер в памяти с FFmpeg atempo по сегментам
+RENDER_MODE_FILTERGRAPH = "filtergraph"
+RENDER_MODE_WSOLA = "wsola"
+RENDER_MODE_MIXER = "mixer"
+
+# Сегментов в одной пачке для WSOLA (ограничивает память на декодированное аудио)
+_STRETCH_BATCH_SIZE = 64
+
+# Сегментов на один запуск FFmpeg: каждый amovie держит открытый файл,
+# а лимит дескрипторов на macOS по умолчанию всего 256
+FILTERGRAPH_CHUNK_SIZE = int(os.getenv("FILTERGRAPH_CHUNK_SIZE", "200"))
+
+
+def build_atempo_chain(speed_factor: float) -> List[str]:
+    """
+    Цепочка atempo фильтров для ускорения в speed_factor раз
+    (один atempo работает в диапазоне 0.5-2.0).
+    """
+    atempo_filters = []
+    remaining_factor = speed_factor
+    
+    while remaining_factor > 1.0:
+        if remaining_factor <= 2.0:
+            # Один фильтр достаточен
+            atempo_filters.append(f"atempo={remaining_factor:.3f}")
+            break
+        else:
+            # Нужна цепочка: применяем максимальный фактор 2.0
+            atempo_filters.append("atempo=2.0")
+            remaining_factor = remaining_factor / 2.0
+    
+    return atempo_filters
+
+
+def escape_filter_value(value: str) -> str:
+    """
+    Экранирует значение опции фильтра для filtergraph FFmpeg (например, путь в amovie).
+    Два уровня: значение опции (\\ ' :) и описание графа (\\ ' [ ] , ;).
+    """
+    for char in ("\\", "'", ":"):
+        value = value.replace(char, "\\" + char)
+    for char in ("\\", "'", "[", "]", ",", ";"):
+        value = value.replace(char, "\\" + char)
+    return value
+
 
 class VideoMaker:
     """
@@ -82,7 +132,8 @@ class VideoMaker:
         self,
         temp_dir: str = "temp",
         progress_callback: Optional[Callable[[str], None]] = None,
-        should_stop_callback: Optional[Callable[[], bool]] = None
+        should_stop_callback: Optional[Callable[[], bool]] = None,
+        render_mode: Optional[str] = None
     ):
         """
         Инициализация VideoMaker.
@@ -90,11 +141,15 @@ class VideoMaker:
         Args:
             temp_dir: Директория для временных файлов
             progress_callback: Функция для логирования прогресса
+            render_mode: "filtergraph" (один граф FFmpeg на всю временную линию),
+                "wsola" (сжатие в памяти, core.time_stretch) или "mixer" (FFmpeg atempo
+                на каждый сегмент); по умолчанию VIDEO_RENDER_MODE или "filtergraph"
         """
         self.temp_dir = Path(temp_dir)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         self.progress_callback = progress_callback or (lambda msg: None)
         self.should_stop_callback = should_stop_callback
+        self.render_mode = (render_mode or os.getenv("VIDEO_RENDER_MODE", RENDER_MODE_FILTERGRAPH)).lower()
         
         # Директория для обработанных аудио
         self.processed_audio_dir = self.temp_dir / "processed_audio"
@@ -139,6 +194,11 @@ class VideoMaker:
         Returns:
             Длительность в секундах
         """
+        # WAV: длительность из заголовка, без декодирования
+        duration_sec = get_wav_duration(audio_path)
+        if duration_sec is not None:
+            return duration_sec
+        
         try:
             audio = AudioSegment.from_file(audio_path)
             duration_sec = len(audio) / 1000.0
@@ -218,24 +278,7 @@ class VideoMaker:
             return audio_path
         
         # Создаем цепочку atempo фильтров
-        # atempo работает в диапазоне 0.5-2.0
-        atempo_filters = []
-        remaining_factor = speed_factor
-        
-        while remaining_factor > 1.0:
-            if remaining_factor <= 2.0:
-                # Один фильтр достаточен
-                atempo_filters.append(f"atempo={remaining_factor:.3f}")
-                break
-            else:
-                # Нужна цепочка: применяем максимальный фактор 2.0
-                atempo_filters.append("atempo=2.0")
-                remaining_factor = remaining_factor / 2.0
-        
-        # Если остался фактор < 1.0, это ошибка (не должно быть)
-        if remaining_factor < 1.0:
-            self._log(f"⚠️ Ошибка вычисления фактора: {remaining_factor}")
-            return audio_path
+        atempo_filters = build_atempo_chain(speed_factor)
         
         # Объединяем фильтры
         filter_chain = ",".join(atempo_filters)
@@ -287,23 +330,38 @@ class VideoMaker:
     def _assemble_audio_timeline(
         self,
         segments: List[Dict],
-        total_duration_sec: float
-    ) -> AudioSegment:
+        total_duration_sec: float,
+        output_path: str
+    ) -> str:
         """
         Собирает временную линию аудио из всех сегментов.
         
+        В режиме filtergraph вся линия собирается графом фильтров FFmpeg
+        (см. _render_timeline_ffmpeg), при ошибке FFmpeg - как в режиме wsola
+        (см. _assemble_with_time_stretch). В режиме mixer сегменты подгоняются
+        FFmpeg atempo по одному и суммируются в одном предвыделенном буфере
+        (AudioTimelineMixer), результат записывается в WAV один раз.
+        
         Args:
             segments: Список сегментов с audio_file и timestamps
             total_duration_sec: Общая длительность видео в секундах
+            output_path: Путь для сохранения собранного WAV
             
         Returns:
-            AudioSegment с собранным аудио
+            Путь к собранному аудио
         """
         self._log(f"🎵 Сборка аудио временной линии ({len(segments)} сегментов, общая длительность: {total_duration_sec:.1f}s)...")
         
-        # Создаем "холст" - тихое аудио нужной длительности
-        total_duration_ms = int(total_duration_sec * 1000)
-        canvas = AudioSegment.silent(duration=total_duration_ms)
+        if self.render_mode == RENDER_MODE_FILTERGRAPH:
+            if self._render_timeline_ffmpeg(segments, total_duration_sec, output_path):
+                return output_path
+            self._log("⚠️ Сборка графом фильтров FFmpeg не удалась, собираем в памяти (WSOLA)")
+        
+        if self.render_mode in (RENDER_MODE_FILTERGRAPH, RENDER_MODE_WSOLA):
+            return self._assemble_with_time_stretch(segments, total_duration_sec, output_path)
+        
+        # Создаем "холст" - тихий буфер нужной длительности
+        mixer = AudioTimelineMixer(total_duration_sec)
         
         processed_count = 0
         error_count = 0
@@ -334,17 +392,9 @@ class VideoMaker:
             )
             
             try:
-                # Загружаем обработанное аудио
-                segment_audio = AudioSegment.from_file(processed_audio_path)
-                
-                # Обрезаем до целевой длительности (на случай, если все еще длиннее)
-                if len(segment_audio) > target_duration * 1000:
-                    segment_audio = segment_audio[:int(target_duration * 1000)]
-                    self._log(f"   Сегмент {i}: обрезано до {target_duration:.2f}s")
-                
                 # Накладываем на холст в нужной позиции
-                start_ms = int(start * 1000)
-                canvas = canvas.overlay(segment_audio, position=start_ms)
+                # (обрезаем до целевой длительности, на случай если все еще длиннее)
+                mixer.add_file(processed_audio_path, start, max_duration_sec=target_duration)
                 
                 processed_count += 1
                 
@@ -358,32 +408,261 @@ class VideoMaker:
         
         self._log(f"✅ Временная линия собрана: {processed_count}/{len(segments)} сегментов обработано, {error_count} ошибок")
         
-        return canvas
+        return mixer.write(output_path)
     
-    def make_video(
+    def _assemble_with_time_stretch(
         self,
-        video_path: str,
         segments: List[Dict],
+        total_duration_sec: float,
         output_path: str
     ) -> str:
         """
-        Создает финальное дублированное видео.
+        Собирает временную линию в памяти: сегменты сжимаются WSOLA
+        (core.time_stretch) пачками (в текущем процессе или в общем пуле при
+        TIME_STRETCH_WORKERS > 1) и суммируются в AudioTimelineMixer.
+        Без запуска FFmpeg и промежуточных файлов на сегмент.
+        """
+        mixer = AudioTimelineMixer(total_duration_sec)
+        processed_count = 0
+        error_count = 0
         
-        Args:
-            video_path: Путь к оригинальному видео
-            segments: Список сегментов с audio_file, start, end
-            output_path: Путь для сохранения результата
+        executor = get_stretch_executor()
+        for batch_start in range(0, len(segments), _STRETCH_BATCH_SIZE):
+            if self.should_stop_callback and self.should_stop_callback():
+                self._log("⏹️ Сборка видео прервана пользователем")
+                raise InterruptedError("Processing stopped by user")
+            
+            jobs = []
+            starts = []
+            for i in range(batch_start, min(batch_start + _STRETCH_BATCH_SIZE, len(segments))):
+                seg = segments[i]
+                audio_file = seg.get("audio_file")
+                start = float(seg.get("start", 0))
+                end = float(seg.get("end", start + 1.0))
+                
+                if not audio_file or not os.path.exists(audio_file):
+                    self._log(f"⚠️ Сегмент {i}: аудио файл отсутствует, пропускаем")
+                    error_count += 1
+                    continue
+                
+                try:
+                    jobs.append((load_audio(audio_file, mixer.sample_rate), end - start))
+                    starts.append(start)
+                except Exception as e:
+                    self._log(f"❌ Ошибка обработки сегмента {i}: {e}")
+                    error_count += 1
+            
+            for start, samples in zip(starts, fit_batch(jobs, mixer.sample_rate, executor)):
+                mixer.add(samples, start)
+                processed_count += 1
+        
+        self._log(f"✅ Временная линия собрана: {processed_count}/{len(segments)} сегментов обработано, {error_count} ошибок")
+        
+        return mixer.write(output_path)
+    
+    def _timeline_inputs(self, segments: List[Dict]) -> List[Dict]:
+        """
+        Подготавливает сегменты для графа фильтров: путь, позиция, слот и atempo.
+        Длительность берется из заголовка WAV, без запуска процессов.
+        """
+        inputs = []
+        for i, seg in enumerate(segments):
+            audio_file = seg.get("audio_file")
+            start = float(seg.get("start", 0))
+            end = float(seg.get("end", start + 1.0))
+            target_duration = end - start
+            
+            if not audio_file or not os.path.exists(audio_file):
+                self._log(f"⚠️ Сегмент {i}: аудио файл отсутствует, пропускаем")
+                continue
+            if target_duration <= 0:
+                continue
+            
+            current_duration = get_wav_duration(audio_file)
+            if current_duration is None:
+                current_duration = self._get_audio_duration(audio_file)
             
+            atempo_filters = []
+            if current_duration > target_duration:
+                atempo_filters = build_atempo_chain(current_duration / target_duration)
+            
+            inputs.append({
+                "path": os.path.abspath(audio_file),
+                "start": max(0.0, start),
+                "duration": target_duration,
+                "atempo": atempo_filters,
+            })
+        
+        inputs.sort(key=lambda item: item["start"])
+        return inputs
+    
+    def _write_filter_script(self, inputs: List[Dict], offset_sec: float, length_sec: float, script_path: Path):
+        """
+        Пишет граф фильтров: amovie → aformat → atempo → atrim → adelay для каждого
+        сегмента, затем amix всех (без нормализации громкости, как AudioTimelineMixer).
+        Файлы открываются через amovie внутри скрипта - командная строка не растет с числом сегментов.
+        """
+        lines = []
+        labels = []
+        for k, item in enumerate(inputs):
+            chain = [
+                f"amovie={escape_filter_value(Path(item['path']).as_posix())}",
+                f"aformat=sample_fmts=fltp:sample_rates={DEFAULT_SAMPLE_RATE}:channel_layouts=mono",
+            ]
+            chain += item["atempo"]
+            chain.append(f"atrim=end={item['duration']:.3f}")
+            delay_ms = int(round((item["start"] - offset_sec) * 1000))
+            if delay_ms > 0:
+                chain.append(f"adelay={delay_ms}")
+            labels.append(f"[s{k}]")
+            lines.append(",".join(chain) + labels[-1] + ";")
+        
+        mix = f"amix=inputs={len(inputs)}:duration=longest:dropout_transition=0:normalize=0"
+        if len(inputs) == 1:
+            mix = "anull"
+        lines.append(f"{''.join(labels)}{mix},apad,atrim=end={length_sec:.3f}[out]")
+        script_path.write_text("\n".join(lines), encoding="utf-8")
+    
+    def _run_ffmpeg(self, cmd: List[str]) -> bool:
+        """Запускает FFmpeg и логирует хвост stderr при ошибке"""
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
+        except subprocess.TimeoutExpired:
+            self._log("❌ Таймаут FFmpeg при сборке аудио")
+            return False
+        except OSError as e:
+            self._log(f"❌ Ошибка запуска FFmpeg: {e}")
+            return False
+        
+        if result.returncode != 0:
+            stderr_tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+            self._log(f"⚠️ FFmpeg завершился с кодом {result.returncode}: {stderr_tail}")
+            return False
+        return True
+    
+    def _render_timeline_ffmpeg(
+        self,
+        segments: List[Dict],
+        total_duration_sec: float,
+        output_path: str
+    ) -> bool:
+        """
+        Собирает временную линию одним графом фильтров FFmpeg вместо
+        запуска ffprobe/ffmpeg на каждый сегмент.
+        
+        Длинные линии режутся на части по FILTERGRAPH_CHUNK_SIZE сегментов
+        (последовательные по времени); каждая часть рендерится одним запуском,
+        затем части смешиваются со своими смещениями. Для 1500 сегментов это
+        9 запусков FFmpeg вместо нескольких тысяч.
+        
         Returns:
-            Путь к созданному видео файлу
+            True если аудио собрано, False если нужно собирать по сегментам
         """
-        if not os.path.exists(video_path):
-            raise FileNotFoundError(f"Видео файл не найден: {video_path}")
+        ffmpeg_path = self._get_ffmpeg_path()
+        if not ffmpeg_path:
+            return False
         
-        if not segments:
-            raise ValueError("Нет сегментов для обработки")
+        inputs = self._timeline_inputs(segments)
+        if not inputs:
+            return False
         
-        # Проверяем и устанавливаем MoviePy при необходимости
+        chunk_size = max(1, FILTERGRAPH_CHUNK_SIZE)
+        chunks = [inputs[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+        self._log(f"   🎚️ Граф фильтров FFmpeg: {len(inputs)} сегментов, запусков FFmpeg: {len(chunks) + (len(chunks) > 1)}")
+        
+        work_dir = Path(tempfile.mkdtemp(prefix="timeline_", dir=str(self.temp_dir)))
+        wav_args = ["-c:a", "pcm_s16le", "-ar", str(DEFAULT_SAMPLE_RATE), "-ac", "1"]
+        try:
+            if len(chunks) == 1:
+                script_path = work_dir / "timeline.txt"
+                self._write_filter_script(inputs, 0.0, total_duration_sec, script_path)
+                return self._run_ffmpeg([
+                    ffmpeg_path, "-y", "-filter_complex_script", str(script_path),
+                    "-map", "[out]", *wav_args, output_path
+                ])
+            
+            parts = []
+            for number, chunk in enumerate(chunks):
+                if self.should_stop_callback and self.should_stop_callback():
+                    self._log("⏹️ Сборка видео прервана пользователем")
+                    raise InterruptedError("Processing stopped by user")
+                
+                offset = chunk[0]["start"]
+                length = max(item["start"] + item["duration"] for item in chunk) - offset
+                script_path = work_dir / f"part_{number:03d}.txt"
+                part_path = work_dir / f"part_{number:03d}.wav"
+                self._write_filter_script(chunk, offset, length, script_path)
+                if not self._run_ffmpeg([
+                    ffmpeg_path, "-y", "-filter_complex_script", str(script_path),
+                    "-map", "[out]", *wav_args, str(part_path)
+                ]):
+                    return False
+                parts.append({"path": str(part_path), "start": offset, "duration": length, "atempo": []})
+                self._log(f"   ✅ Часть {number + 1}/{len(chunks)} собрана")
+            
+            script_path = work_dir / "timeline.txt"
+            self._write_filter_script(parts, 0.0, total_duration_sec, script_path)
+            return self._run_ffmpeg([
+                ffmpeg_path, "-y", "-filter_complex_script", str(script_path),
+                "-map", "[out]", *wav_args, output_path
+            ])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _get_ffprobe_path(self) -> Optional[str]:
+        """Ищет путь к ffprobe (обычно лежит рядом с FFmpeg)"""
+        import shutil
+        ffprobe_path = shutil.which("ffprobe")
+        if ffprobe_path:
+            return ffprobe_path
+        
+        ffmpeg_path = self._get_ffmpeg_path()
+        if ffmpeg_path:
+            directory, name = os.path.split(ffmpeg_path)
+            candidate = os.path.join(directory, name.replace("ffmpeg", "ffprobe"))
+            if os.path.exists(candidate):
+                return candidate
+        
+        return None
+    
+    def _probe_duration(self, media_path: str) -> Optional[float]:
+        """
+        Длительность медиафайла по данным контейнера (ffprobe, без декодирования).
+        
+        Returns:
+            Длительность в секундах или None, если ffprobe недоступен/ошибка
+        """
+        ffprobe_path = self._get_ffprobe_path()
+        if not ffprobe_path:
+            return None
+        
+        try:
+            result = subprocess.run(
+                [
+                    ffprobe_path,
+                    "-v", "error",
+                    "-show_entries", "format=duration",
+                    "-of", "default=noprint_wrappers=1:nokey=1",
+                    media_path
+                ],
+                capture_output=True,
+                text=True,
+                timeout=30
+            )
+            if result.returncode == 0:
+                return float(result.stdout.strip())
+        except (subprocess.TimeoutExpired, ValueError, OSError) as e:
+            self._log(f"⚠️ Ошибка ffprobe: {e}")
+        
+        return None
+    
+    def _import_moviepy(self):
+        """
+        Импортирует MoviePy (устанавливает при необходимости).
+        
+        Returns:
+            (VideoFileClip, AudioFileClip)
+        """
         if not MOVIEPY_AVAILABLE:
             self._log("📦 MoviePy не найден, пытаемся установить...")
             if _install_moviepy():
@@ -394,84 +673,233 @@ class VideoMaker:
                     "Или используйте альтернативный метод сборки видео."
                 )
         
-        self._log(f"\n🎬 СОЗДАНИЕ ДУБЛИРОВАННОГО ВИДЕО")
-        self._log("─" * 50)
-        self._log(f"📹 Исходное видео: {os.path.basename(video_path)}")
-        self._log(f"📊 Сегментов: {len(segments)}")
-        
         try:
-            # ШАГ 1: Загружаем оригинальное видео для получения длительности
-            self._log(f"\n📹 Шаг 1/4: Загрузка оригинального видео...")
+            # Пытаемся импортировать VideoFileClip и AudioFileClip
             try:
-                # Пытаемся импортировать VideoFileClip и AudioFileClip
+                from moviepy import VideoFileClip, AudioFileClip
+            except ImportError:
+                from moviepy.editor import VideoFileClip, AudioFileClip
+        except ImportError as e:
+            # Если импорт не удался, пытаемся установить и повторить
+            self._log("📦 MoviePy не найден при использовании, пытаемся установить...")
+            if _install_moviepy():
+                # Повторяем импорт после установки
                 try:
                     from moviepy import VideoFileClip, AudioFileClip
                 except ImportError:
                     from moviepy.editor import VideoFileClip, AudioFileClip
+                self._log("✅ MoviePy установлен, продолжаем...")
+            else:
+                raise ImportError(
+                    f"MoviePy не установлен после попытки установки. "
+                    f"Установите вручную: pip install moviepy"
+                )
+        
+        return VideoFileClip, AudioFileClip
+    
+    def _mux_with_ffmpeg(
+        self,
+        video_path: str,
+        audio_path: str,
+        output_path: str,
+        total_duration: float
+    ) -> bool:
+        """
+        Заменяет аудио дорожку без перекодирования видео.
+        
+        Видеопоток копируется как есть (-c:v copy), кодируется только новое аудио (AAC).
+        
+        Returns:
+            True если успешно, False если контейнер/кодек не поддерживает stream copy
+        """
+        ffmpeg_path = self._get_ffmpeg_path()
+        if not ffmpeg_path:
+            self._log("⚠️ FFmpeg не найден, используем MoviePy")
+            return False
+        
+        cmd = [
+            ffmpeg_path,
+            "-y",
+            "-i", video_path,
+            "-i", audio_path,
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-b:a", "192k",
+            # Обрезаем аудио по длительности видео (видео при этом не сокращается)
+            "-t", f"{total_duration:.3f}",
+        ]
+        if output_path.lower().endswith((".mp4", ".m4v", ".mov")):
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(output_path)
+        
+        self._log(f"   🎚️ FFmpeg: копирование видеопотока без перекодирования...")
+        
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
+        except subprocess.TimeoutExpired:
+            self._log("❌ Таймаут FFmpeg при сборке видео")
+            return False
+        except OSError as e:
+            self._log(f"❌ Ошибка запуска FFmpeg: {e}")
+            return False
+        
+        if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            stderr_tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+            self._log(f"⚠️ Stream copy не удался (код {result.returncode}): {stderr_tail}")
+            return False
+        
+        return True
+    
+    def _make_video_moviepy(
+        self,
+        video_path: str,
+        audio_path: str,
+        output_path: str,
+        total_duration: float
+    ):
+        """Запасной путь: замена аудио через MoviePy с полным перекодированием видео"""
+        VideoFileClip, AudioFileClip = self._import_moviepy()
+        
+        video_clip = VideoFileClip(video_path)
+        audio_clip = AudioFileClip(audio_path)
+        
+        # Обрезаем аудио до длительности видео (если нужно)
+        if audio_clip.duration > total_duration:
+            audio_clip = audio_clip.subclip(0, total_duration)
+            self._log(f"   Аудио обрезано до {total_duration:.1f}s")
+        elif audio_clip.duration < total_duration:
+            # Если аудио короче, просто используем как есть
+            self._log(f"   Аудио короче видео на {total_duration - audio_clip.duration:.1f}s")
+        
+        # Заменяем аудио (MoviePy 2.x использует with_audio вместо set_audio)
+        final_video = video_clip.with_audio(audio_clip)
+        
+        # Экспортируем с настройками качества
+        # MoviePy 2.x: write_videofile параметры
+        final_video.write_videofile(
+            str(output_path),
+            codec='libx264',
+            audio_codec='aac',
+            temp_audiofile=str(self.temp_dir / "temp_audio.m4a"),
+            remove_temp=True,
+            logger=None  # Отключаем прогресс-бар (logger='bar' по умолчанию)
+        )
+        
+        # Закрываем клипы для освобождения ресурсов
+        audio_clip.close()
+        video_clip.close()
+        final_video.close()
+    
+    def probe_video_duration(self, video_path: str) -> float:
+        """Длительность видео в секундах (из заголовка контейнера, иначе через MoviePy)"""
+        total_duration = self._probe_duration(video_path)
+        if total_duration is None:
+            VideoFileClip, _ = self._import_moviepy()
+            video_clip = VideoFileClip(video_path)
+            total_duration = video_clip.duration
+            video_clip.close()
+        return total_duration
+    
+    def assemble_audio(self, segments: List[Dict], total_duration: float, output_path: str) -> str:
+        """
+        Собирает дублированную аудиодорожку (без видео).
+        
+        Args:
+            segments: Список сегментов с audio_file, start, end
+            total_duration: Длительность видео в секундах
+            output_path: Путь для сохранения WAV
+            
+        Returns:
+            Путь к собранному аудио
+        """
+        if not segments:
+            raise ValueError("Нет сегментов для обработки")
+        
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        self._assemble_audio_timeline(segments, total_duration, str(output_path))
+        self._log(f"✅ Аудио сохранено: {output_path}")
+        return str(output_path)
+    
+    def mux(self, video_path: str, audio_path: str, output_path: str, total_duration: float) -> str:
+        """
+        Заменяет аудиодорожку видео на собранную.
+        
+        Видеопоток копируется без перекодирования (FFmpeg stream copy);
+        MoviePy используется только если контейнер не поддерживает stream copy.
+        
+        Returns:
+            Путь к созданному видео файлу
+        """
+        output_path_obj = Path(output_path)
+        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
+        
+        if self._mux_with_ffmpeg(video_path, str(audio_path), str(output_path), total_duration):
+            self._log(f"✅ Видеопоток скопирован без перекодирования")
+        else:
+            self._log(f"💾 Stream copy невозможен, экспорт финального видео (MoviePy, перекодирование)...")
+            try:
+                self._make_video_moviepy(video_path, str(audio_path), str(output_path), total_duration)
             except ImportError as e:
-                # Если импорт не удался, пытаемся установить и повторить
-                self._log("📦 MoviePy не найден при использовании, пытаемся установить...")
-                if _install_moviepy():
-                    # Повторяем импорт после установки
-                    try:
-                        from moviepy import VideoFileClip, AudioFileClip
-                    except ImportError:
-                        from moviepy.editor import VideoFileClip, AudioFileClip
-                    self._log("✅ MoviePy установлен, продолжаем...")
-                else:
+                self._log("📦 Обнаружена ошибка MoviePy, пытаемся установить...")
+                if not _install_moviepy():
+                    self._log(f"❌ Не удалось установить MoviePy: {e}")
                     raise ImportError(
                         f"MoviePy не установлен после попытки установки. "
                         f"Установите вручную: pip install moviepy"
                     )
+                self._make_video_moviepy(video_path, str(audio_path), str(output_path), total_duration)
+        
+        return str(output_path)
+    
+    def make_video(
+        self,
+        video_path: str,
+        segments: List[Dict],
+        output_path: str
+    ) -> str:
+        """
+        Создает финальное дублированное видео.
+        
+        Шаги: длительность из заголовка контейнера; сборка аудиодорожки (по умолчанию
+        одним графом фильтров FFmpeg, при ошибке - в памяти с WSOLA, см. VIDEO_RENDER_MODE);
+        замена аудиодорожки. Видеопоток копируется без перекодирования (FFmpeg stream copy);
+        MoviePy используется только если контейнер не поддерживает stream copy.
+        
+        Args:
+            video_path: Путь к оригинальному видео
+            segments: Список сегментов с audio_file, start, end
+            output_path: Путь для сохранения результата
             
-            video_clip = VideoFileClip(video_path)
-            total_duration = video_clip.duration
+        Returns:
+            Путь к созданному видео файлу
+        """
+        if not os.path.exists(video_path):
+            raise FileNotFoundError(f"Видео файл не найден: {video_path}")
+        
+        if not segments:
+            raise ValueError("Нет сегментов для обработки")
+        
+        self._log(f"\n🎬 СОЗДАНИЕ ДУБЛИРОВАННОГО ВИДЕО")
+        self._log("─" * 50)
+        self._log(f"📹 Исходное видео: {os.path.basename(video_path)}")
+        self._log(f"📊 Сегментов: {len(segments)}")
+        
+        try:
+            # ШАГ 1: Получаем длительность оригинального видео (из заголовка контейнера)
+            self._log(f"\n📹 Шаг 1/3: Анализ оригинального видео...")
+            total_duration = self.probe_video_duration(video_path)
             self._log(f"✅ Длительность видео: {total_duration:.1f} секунд")
             
-            # ШАГ 2: Собираем аудио временную линию
-            self._log(f"\n🎵 Шаг 2/4: Сборка аудио временной линии...")
-            assembled_audio = self._assemble_audio_timeline(segments, total_duration)
-            
-            # Сохраняем собранное аудио во временный файл
+            # ШАГ 2: Собираем аудио временную линию (граф фильтров FFmpeg или WSOLA)
+            self._log(f"\n🎵 Шаг 2/3: Сборка аудио временной линии (режим {self.render_mode})...")
             temp_audio_path = self.temp_dir / "assembled_audio.wav"
-            assembled_audio.export(str(temp_audio_path), format="wav")
-            self._log(f"✅ Аудио сохранено: {temp_audio_path}")
+            self.assemble_audio(segments, total_duration, str(temp_audio_path))
             
-            # ШАГ 3: Заменяем аудио дорожку в видео
-            self._log(f"\n🔗 Шаг 3/4: Замена аудио дорожки...")
-            audio_clip = AudioFileClip(str(temp_audio_path))
-            
-            # Обрезаем аудио до длительности видео (если нужно)
-            if audio_clip.duration > total_duration:
-                audio_clip = audio_clip.subclip(0, total_duration)
-                self._log(f"   Аудио обрезано до {total_duration:.1f}s")
-            elif audio_clip.duration < total_duration:
-                # Если аудио короче, просто используем как есть
-                self._log(f"   Аудио короче видео на {total_duration - audio_clip.duration:.1f}s")
-            
-            # Заменяем аудио (MoviePy 2.x использует with_audio вместо set_audio)
-            final_video = video_clip.with_audio(audio_clip)
-            
-            # ШАГ 4: Экспортируем финальное видео
-            self._log(f"\n💾 Шаг 4/4: Экспорт финального видео...")
-            output_path_obj = Path(output_path)
-            output_path_obj.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Экспортируем с настройками качества
-            # MoviePy 2.x: write_videofile параметры
-            final_video.write_videofile(
-                str(output_path),
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile=str(self.temp_dir / "temp_audio.m4a"),
-                remove_temp=True,
-                logger=None  # Отключаем прогресс-бар (logger='bar' по умолчанию)
-            )
-            
-            # Закрываем клипы для освобождения ресурсов
-            audio_clip.close()
-            video_clip.close()
-            final_video.close()
+            # ШАГ 3: Заменяем аудио дорожку в видео (перекодирование MoviePy, если stream copy невозможен)
+            self._log(f"\n🔗 Шаг 3/3: Замена аудио дорожки...")
+            self.mux(video_path, str(temp_audio_path), str(output_path), total_duration)
             
             # Удаляем временное аудио
             if temp_audio_path.exists():
@@ -9,10 +9,17 @@ import subprocess
 import json
 import sys
 import time
+import queue
+import threading
 from pathlib import Path
 from typing import List, Dict, Optional, Callable
 import torch
-from pydub import AudioSegment
+
+from core.config import APP_PATHS, get_available_memory_bytes
+from core import tts_worker
+from core.tts_cache import TTSOutputCache
+from core.audio_mixer import AudioTimelineMixer
+from core.audio_ingest import find_ffmpeg, extract_clip
 
 # Пытаемся импортировать TTS (поддерживаем и старый TTS, и новый coqui-tts)
 TTS_AVAILABLE = False
@@ -39,6 +46,187 @@ except Exception as e:
     TTS = None
     TTS_ERROR = f"UnexpectedError: {str(e)}"
 
+# Параметры синтеза, влияющие на результат (входят в ключ кэша TTS)
+TTS_SYNTHESIS_PARAMS = {"split_sentences": False, "speaker_conditioning": "cached_latents"}
+
+
+class TTSWorkerProcess:
+    """
+    Резидентный процесс tts_worker.py (режим --server).
+    
+    Модель XTTS загружается в воркере один раз, после чего запросы
+    передаются построчным JSON через stdin/stdout. stderr воркера
+    пересылается в лог.
+    """
+    
+    def __init__(
+        self,
+        python_path: str,
+        worker_script: str,
+        model_name: str,
+        log: Callable[[str], None],
+        startup_timeout: float = 600,
+        env: Optional[Dict[str, str]] = None,
+        extra_args: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            python_path: Интерпретатор Python, в котором запускается воркер
+            worker_script: Путь к tts_worker.py
+            model_name: Модель для предзагрузки при старте
+            log: Функция логирования
+            startup_timeout: Максимальное время ожидания загрузки модели (сек)
+            env: Переменные окружения процесса (по умолчанию - текущие)
+            extra_args: Дополнительные аргументы командной строки воркера
+        """
+        self.python_path = str(python_path)
+        self.worker_script = str(worker_script)
+        self.model_name = model_name
+        self.startup_timeout = startup_timeout
+        self.env = env
+        self.extra_args = extra_args or []
+        self._log = log
+        self._process = None
+        self._responses = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+    
+    def is_alive(self) -> bool:
+        """Проверяет, что процесс воркера запущен и не завершился"""
+        return self._process is not None and self._process.poll() is None
+    
+    def start(self):
+        """
+        Запускает процесс и ждет сообщения о готовности (модель загружена).
+        
+        Raises:
+            RuntimeError: если воркер не запустился или не смог загрузить модель
+        """
+        self.stop()
+        
+        cmd = [self.python_path, self.worker_script, "--server", "--model", self.model_name] + self.extra_args
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            env=self.env
+        )
+        self._responses = queue.Queue()
+        
+        threading.Thread(target=self._read_stdout, args=(self._process, self._responses), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self._process,), daemon=True).start()
+        
+        try:
+            ready = self._wait_for(lambda msg: msg.get("event") == "ready", self.startup_timeout)
+        except Exception:
+            self.stop()
+            raise
+        
+        if not ready.get("model_loaded"):
+            self.stop()
+            raise RuntimeError(f"TTS воркер не загрузил модель: {ready.get('error', 'Unknown error')}")
+    
+    def _read_stdout(self, process, responses: "queue.Queue"):
+        """Читает ответы воркера (по одной JSON-строке)"""
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                responses.put(json.loads(line))
+            except json.JSONDecodeError:
+                self._log(line)
+        # EOF: процесс завершился
+        responses.put(None)
+    
+    def _read_stderr(self, process):
+        """Пересылает сообщения воркера в лог"""
+        for line in process.stderr:
+            if line.strip():
+                self._log(line.rstrip())
+    
+    def _wait_for(self, predicate: Callable[[Dict], bool], timeout: float) -> Dict:
+        """Ждет сообщение воркера, удовлетворяющее условию"""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"TTS воркер не ответил за {timeout:.0f}с")
+            try:
+                message = self._responses.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if message is None:
+                code = self._process.poll() if self._process else None
+                raise RuntimeError(f"TTS воркер завершился (код {code})")
+            if predicate(message):
+                return message
+            # Ответ на предыдущий (просроченный) запрос - пропускаем
+    
+    def request(self, payload: Dict, timeout: float = 300) -> Dict:
+        """
+        Отправляет запрос воркеру и ждет ответ.
+        
+        Raises:
+            RuntimeError: воркер завершился или канал закрыт
+            TimeoutError: ответ не получен за timeout секунд
+        """
+        with self._lock:
+            if not self.is_alive():
+                raise RuntimeError("TTS воркер не запущен")
+            
+            self._next_id += 1
+            request_id = self._next_id
+            message = dict(payload, id=request_id)
+            
+            try:
+                self._process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise RuntimeError(f"Канал TTS воркера закрыт: {e}")
+            
+            return self._wait_for(lambda msg: msg.get("id") == request_id, timeout)
+    
+    def ping(self, timeout: float = 10) -> bool:
+        """Проверка здоровья: воркер жив и отвечает"""
+        try:
+            response = self.request({"cmd": "ping"}, timeout=timeout)
+            return bool(response.get("success"))
+        except Exception:
+            return False
+    
+    def stop(self, timeout: float = 10):
+        """Корректно завершает воркер (shutdown), при необходимости - принудительно"""
+        process = self._process
+        if process is None:
+            return
+        
+        if process.poll() is None:
+            try:
+                process.stdin.write(json.dumps({"cmd": "shutdown"}) + "\n")
+                process.stdin.flush()
+                process.wait(timeout=timeout)
+            except Exception:
+                pass
+        
+        if process.poll() is None:
+            process.kill()
+            try:
+                process.wait(timeout=5)
+            except Exception:
+                pass
+        
+        self._process = None
+
 
 class VoiceCloner:
     """
@@ -49,7 +237,10 @@ class VoiceCloner:
         self,
         model_name: str = "tts_models/multilingual/multi-dataset/xtts_v2",
         progress_callback: Optional[Callable[[str], None]] = None,
-        should_stop_callback: Optional[Callable[[], bool]] = None
+        should_stop_callback: Optional[Callable[[], bool]] = None,
+        tts_workers: Optional[str] = None,
+        use_tts_cache: Optional[bool] = None,
+        work_dir: Optional[str] = None
     ):
         """
         Инициализация VoiceCloner.
@@ -57,6 +248,13 @@ class VoiceCloner:
         Args:
             model_name: Название модели XTTS (по умолчанию xtts_v2)
             progress_callback: Функция для логирования прогресса
+            tts_workers: Размер пула TTS процессов: число или "auto"
+                (по умолчанию - переменная окружения TTS_WORKERS, иначе "auto")
+            use_tts_cache: Переиспользовать ранее сгенерированные сегменты
+                (по умолчанию - переменная окружения TTS_CACHE, включено)
+            work_dir: Папка задачи для референсов спикеров и озвученных сегментов
+                (voices/ и tts_parts/). Параллельные задачи должны передавать
+                разные папки; по умолчанию - общие voices/ и temp/tts_parts/
         """
         # Подавляем промпт лицензии
         os.environ["COQUI_TOS_AGREED"] = "1"
@@ -65,21 +263,44 @@ class VoiceCloner:
         self.progress_callback = progress_callback
         self.should_stop_callback = should_stop_callback
         self.model = None
+        self.tts_workers = str(tts_workers or os.getenv("TTS_WORKERS", "auto")).strip().lower()
         
         # Определяем устройство
         self.device = self._detect_device()
         
         # Создаем необходимые директории
-        self.voices_dir = Path("voices")
-        self.voices_dir.mkdir(exist_ok=True)
+        if work_dir:
+            self.voices_dir = Path(work_dir) / "voices"
+            self.temp_tts_dir = Path(work_dir) / "tts_parts"
+        else:
+            self.voices_dir = Path("voices")
+            self.temp_tts_dir = Path("temp/tts_parts")
+        self.voices_dir.mkdir(parents=True, exist_ok=True)
         
-        self.temp_tts_dir = Path("temp/tts_parts")
         self.temp_tts_dir.mkdir(parents=True, exist_ok=True)
         
+        # Дисковый кэш латентов спикеров XTTS (gpt_cond_latent + speaker_embedding)
+        self.latents_dir = APP_PATHS["models"] / "xtts_latents"
+        self.latents_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Кэш готовых сегментов: при повторном запуске синтезируются только измененные реплики
+        if use_tts_cache is None:
+            use_tts_cache = os.getenv("TTS_CACHE", "1").lower() not in ("0", "false", "no", "off")
+        self.tts_cache = None
+        if use_tts_cache:
+            self.tts_cache = TTSOutputCache(
+                APP_PATHS["temp"] / "tts_cache",
+                max_size_bytes=int(float(os.getenv("TTS_CACHE_MAX_GB", "2")) * 1024 ** 3),
+                progress_callback=self._log
+            )
+        
         # Проверяем наличие venv_tts для использования через subprocess
         self.venv_tts_path = self._find_venv_tts()
         self.use_venv_tts = self.venv_tts_path is not None and not TTS_AVAILABLE
         
+        # Резидентный TTS воркер (venv_tts): запускается при первом сегменте
+        self._tts_worker: Optional[TTSWorkerProcess] = None
+        
         if self.use_venv_tts:
             self._log(f"🎤 VoiceCloner инициализирован (устройство: {self.device}, используется venv_tts)")
         else:
@@ -171,9 +392,59 @@ class VoiceCloner:
             self._log(f"❌ Ошибка загрузки модели XTTS: {e}")
             raise
     
+    def _ensure_tts_worker(self) -> TTSWorkerProcess:
+        """
+        Возвращает работающий TTS воркер, (пере)запуская его при необходимости.
+        
+        Raises:
+            RuntimeError: если воркер не удалось запустить
+        """
+        if self._tts_worker is not None and self._tts_worker.is_alive():
+            return self._tts_worker
+        
+        # Путь к скрипту-воркеру (используем абсолютный путь для надежности)
+        worker_script = Path(__file__).parent.absolute() / "tts_worker.py"
+        
+        if not worker_script.exists():
+            raise RuntimeError(f"Скрипт tts_worker.py не найден: {worker_script}")
+        
+        if self._tts_worker is not None:
+            self._log(f"⚠️ TTS воркер (PID {self._tts_worker.pid}) завершился, перезапуск...")
+        else:
+            self._log("🚀 Запуск резидентного TTS воркера (модель загружается один раз)...")
+        
+        worker = TTSWorkerProcess(
+            python_path=str(self.venv_tts_path),
+            worker_script=str(worker_script),
+            model_name=self.model_name,
+            log=self._log
+        )
+        start_time = time.time()
+        worker.start()
+        
+        if not worker.ping():
+            worker.stop()
+            raise RuntimeError("TTS воркер не отвечает на проверку здоровья")
+        
+        self._tts_worker = worker
+        self._log(f"✅ TTS воркер готов (PID {worker.pid}) за {time.time() - start_time:.1f}с")
+        return worker
+    
+    def shutdown_tts_worker(self):
+        """Останавливает резидентный TTS воркер (если запущен)"""
+        if self._tts_worker is None:
+            return
+        
+        pid = self._tts_worker.pid
+        self._tts_worker.stop()
+        self._tts_worker = None
+        self._log(f"🛑 TTS воркер остановлен (PID {pid})")
+    
     def _generate_tts_via_venv(self, text: str, speaker_wav: str, output_path: str, language: str, segment_index: int = None, total_segments: int = None) -> bool:
         """
-        Генерирует TTS через venv_tts используя subprocess.
+        Генерирует TTS через резидентный воркер в venv_tts.
+        
+        Если воркер упал или завис, он перезапускается и запрос повторяется один раз.
         
         Args:
             text: Текст для генерации
@@ -189,81 +460,62 @@ class VoiceCloner:
         if not self.venv_tts_path:
             return False
         
-        # Путь к скрипту-воркеру (используем абсолютный путь для надежности)
-        worker_script = Path(__file__).parent.absolute() / "tts_worker.py"
-        
-        if not worker_script.exists():
-            self._log(f"❌ Скрипт tts_worker.py не найден: {worker_script}")
-            return False
-        
         start_time = time.time()
         
-        try:
-            # Подготавливаем данные для передачи
-            input_data = {
-                "text": text,
-                "speaker_wav": speaker_wav,
-                "output_path": output_path,
-                "language": language,
-                "model_name": self.model_name
+        # Подготавливаем данные для передачи
+        input_data = {
+            "cmd": "generate",
+            "text": text,
+            "speaker_wav": speaker_wav,
+            "output_path": output_path,
+            "language": language,
+            "model_name": self.model_name,
+            "latents_dir": str(self.latents_dir)
+        }
+        
+        # Добавляем информацию о сегменте для логирования в worker
+        if segment_index is not None and total_segments is not None:
+            input_data["segment_info"] = {
+                "index": segment_index + 1,
+                "total": total_segments
             }
-            
-            # Добавляем информацию о сегменте для логирования в worker
-            if segment_index is not None and total_segments is not None:
-                input_data["segment_info"] = {
-                    "index": segment_index + 1,
-                    "total": total_segments
-                }
-            
-            # Запускаем скрипт через venv_tts Python
-            result = subprocess.run(
-                [str(self.venv_tts_path), str(worker_script)],
-                input=json.dumps(input_data),
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 минут максимум на сегмент
-            )
-            
-            # Логируем stderr (там выводятся сообщения из worker)
-            if result.stderr:
-                for line in result.stderr.strip().split('\n'):
-                    if line.strip():
-                        self._log(line)
-            
-            if result.returncode != 0:
-                self._log(f"❌ Ошибка subprocess (код {result.returncode}): {result.stderr}")
-                return False
-            
-            # Парсим результат
-            output = json.loads(result.stdout)
-            
-            if not output.get("success"):
-                self._log(f"❌ Ошибка генерации TTS: {output.get('error', 'Unknown error')}")
+        
+        output = None
+        for attempt in range(2):
+            try:
+                worker = self._ensure_tts_worker()
+                output = worker.request(input_data, timeout=300)  # 5 минут максимум на сегмент
+                break
+            except TimeoutError:
+                self._log(f"❌ Таймаут генерации TTS (превышено 5 минут), перезапуск воркера")
+                self.shutdown_tts_worker()
+            except RuntimeError as e:
+                self._log(f"❌ Ошибка TTS воркера: {e}")
+                self.shutdown_tts_worker()
+            except Exception as e:
+                self._log(f"❌ Ошибка TTS воркера: {e}")
                 return False
-            
-            # Логируем время выполнения
-            total_time = time.time() - start_time
-            load_time = output.get("load_time", 0)
-            gen_time = output.get("gen_time", 0)
-            
-            if segment_index is not None and total_segments is not None:
-                progress = ((segment_index + 1) / total_segments) * 100
-                if load_time > 0:
-                    self._log(f"   ⏱️ Время: загрузка {load_time:.1f}с + генерация {gen_time:.1f}с = {total_time:.1f}с | Прогресс: {progress:.1f}%")
-                else:
-                    self._log(f"   ⏱️ Время: генерация {gen_time:.1f}с (модель уже загружена) | Прогресс: {progress:.1f}%")
-            
-            return True
-            
-        except subprocess.TimeoutExpired:
-            self._log(f"❌ Таймаут генерации TTS (превышено 5 минут)")
-            return False
-        except json.JSONDecodeError as e:
-            self._log(f"❌ Ошибка парсинга результата: {e}")
+        
+        if output is None:
             return False
-        except Exception as e:
-            self._log(f"❌ Ошибка subprocess: {e}")
+        
+        if not output.get("success"):
+            self._log(f"❌ Ошибка генерации TTS: {output.get('error', 'Unknown error')}")
             return False
+        
+        # Логируем время выполнения
+        total_time = time.time() - start_time
+        load_time = output.get("load_time", 0)
+        gen_time = output.get("gen_time", 0)
+        
+        if segment_index is not None and total_segments is not None:
+            progress = ((segment_index + 1) / total_segments) * 100
+            if load_time > 0:
+                self._log(f"   ⏱️ Время: загрузка {load_time:.1f}с + генерация {gen_time:.1f}с = {total_time:.1f}с | Прогресс: {progress:.1f}%")
+            else:
+                self._log(f"   ⏱️ Время: генерация {gen_time:.1f}с (модель уже загружена) | Прогресс: {progress:.1f}%")
+        
+        return True
     
     def extract_speaker_samples(
         self,
@@ -290,12 +542,13 @@ class VoiceCloner:
             self._log("⚠️ Нет сегментов для обработки")
             return {}
         
-        # Загружаем исходное аудио
-        try:
-            audio = AudioSegment.from_file(audio_path)
-            self._log(f"✅ Исходное аудио загружено: {len(audio) / 1000:.1f} сек")
-        except Exception as e:
-            self._log(f"❌ Ошибка загрузки аудио: {e}")
+        # Референсы вырезаются из источника в исходной частоте (не из 16 кГц кэша для ASR):
+        # XTTS считает кондиционирование на 22.05/24 кГц
+        if not os.path.exists(audio_path):
+            self._log(f"❌ Ошибка загрузки аудио: файл не найден {audio_path}")
+            return {}
+        if not find_ffmpeg():
+            self._log("❌ Ошибка загрузки аудио: FFmpeg не найден")
             return {}
         
         # Группируем сегменты по спикерам
@@ -339,15 +592,13 @@ class VoiceCloner:
                 continue
             
             # Извлекаем аудио сегмент
-            start_ms = int(best_seg.get("start", 0) * 1000)
-            end_ms = int(best_seg.get("end", 0) * 1000)
+            start = float(best_seg.get("start", 0))
+            end = float(best_seg.get("end", 0))
             
             try:
-                sample_audio = audio[start_ms:end_ms]
-                
                 # Сохраняем референсный файл
                 sample_path = self.voices_dir / f"{speaker}_sample.wav"
-                sample_audio.export(str(sample_path), format="wav")
+                extract_clip(audio_path, str(sample_path), start, end - start)
                 
                 speaker_samples[speaker] = str(sample_path)
                 
@@ -362,6 +613,260 @@ class VoiceCloner:
         self._log(f"🎯 Извлечено референсов: {len(speaker_samples)}/{len(speaker_segments)}")
         return speaker_samples
     
+    def _resolve_pool_size(self, jobs_count: int) -> tuple:
+        """
+        Определяет размер пула TTS процессов и бюджет потоков на процесс.
+        
+        В режиме "auto" число процессов ограничено ядрами CPU
+        (TTS_THREADS_PER_WORKER потоков на процесс) и доступной RAM
+        (TTS_WORKER_RAM_GB на копию модели).
+        
+        Returns:
+            (число процессов, потоков torch на процесс)
+        """
+        cpu_count = os.cpu_count() or 1
+        
+        if self.tts_workers == "auto":
+            # На GPU несколько копий модели только мешают друг другу
+            if self.device == "cuda":
+                return 1, cpu_count
+            
+            threads_per_worker = max(1, int(os.getenv("TTS_THREADS_PER_WORKER", "4")))
+            by_cpu = max(1, cpu_count // threads_per_worker)
+            
+            worker_ram = float(os.getenv("TTS_WORKER_RAM_GB", "3")) * 1024 ** 3
+            available = get_available_memory_bytes()
+            if available is None:
+                by_ram = 1
+            else:
+                # Оставляем запас ~2 ГБ для остальной системы
+                by_ram = max(1, int((available - 2 * 1024 ** 3) // worker_ram))
+            
+            workers = min(by_cpu, by_ram)
+        else:
+            try:
+                workers = max(1, int(self.tts_workers))
+            except ValueError:
+                self._log(f"⚠️ Некорректное значение TTS_WORKERS={self.tts_workers}, используется 1")
+                workers = 1
+        
+        workers = max(1, min(workers, jobs_count))
+        return workers, max(1, cpu_count // workers)
+    
+    def _pool_python(self) -> Optional[str]:
+        """Интерпретатор для процессов пула (None - пул недоступен)"""
+        if self.use_venv_tts:
+            return str(self.venv_tts_path)
+        # В собранном exe sys.executable - это само приложение, а не Python
+        if TTS_AVAILABLE and not getattr(sys, 'frozen', False):
+            return sys.executable
+        return None
+    
+    def _synthesize_sequential(self, jobs: List[Dict], target_lang: str, total_segments: int) -> Dict[int, bool]:
+        """
+        Генерирует сегменты по одному в текущем процессе (или в одном venv_tts воркере).
+        
+        Returns:
+            Словарь {индекс сегмента: успех}
+        """
+        results = {}
+        start_time = time.time()
+        
+        # Загружаем модель (ленивая загрузка)
+        self._load_model()
+        
+        for done, job in enumerate(jobs):
+            # Проверяем флаг остановки в цикле
+            if self.should_stop_callback and self.should_stop_callback():
+                self._log("⏹️ Генерация дубляжа прервана пользователем")
+                raise InterruptedError("Processing stopped by user")
+            
+            i = job["index"]
+            text = job["text"]
+            
+            try:
+                # Вычисляем прогресс
+                progress = ((i + 1) / total_segments) * 100
+                elapsed = time.time() - start_time
+                avg_time_per_segment = elapsed / done if done > 0 else 0
+                remaining_segments = len(jobs) - done
+                estimated_remaining = avg_time_per_segment * remaining_segments
+                
+                self._log(f"🎤 [{i+1}/{total_segments}] ({progress:.1f}%) {job['speaker']} | {len(text)} символов | ⏱️ ~{estimated_remaining/60:.1f} мин осталось")
+                
+                # Генерация TTS
+                if self.use_venv_tts:
+                    # Используем venv_tts через резидентный воркер
+                    success = self._generate_tts_via_venv(
+                        text=text,
+                        speaker_wav=job["speaker_wav"],
+                        output_path=job["output_path"],
+                        language=target_lang,
+                        segment_index=i,
+                        total_segments=total_segments
+                    )
+                    if not success:
+                        raise Exception("Ошибка генерации через venv_tts")
+                else:
+                    # Используем прямой вызов TTS API
+                    seg_start = time.time()
+                    # Латенты спикера считаются один раз и берутся из кэша
+                    tts_worker.synthesize_to_file(
+                        self.model,
+                        text=text,
+                        speaker_wav=job["speaker_wav"],
+                        language=target_lang,
+                        output_path=job["output_path"],
+                        model_name=self.model_name,
+                        latents_dir=str(self.latents_dir)
+                    )
+                    seg_time = time.time() - seg_start
+                    self._log(f"   ⏱️ Время генерации: {seg_time:.1f}с")
+                
+                results[i] = True
+                
+            except InterruptedError:
+                self._log("⏹️ Генерация дубляжа прервана пользователем")
+                raise
+            except Exception as e:
+                self._log(f"❌ [{i+1}/{total_segments}] Ошибка генерации для сегмента {i} ({job['speaker']}): {e}")
+                results[i] = False
+        
+        return results
+    
+    def _synthesize_with_pool(
+        self,
+        jobs: List[Dict],
+        target_lang: str,
+        total_segments: int,
+        workers_count: int,
+        threads_per_worker: int
+    ) -> Dict[int, bool]:
+        """
+        Генерирует сегменты пулом резидентных TTS процессов.
+        
+        У каждого процесса своя копия модели и свой бюджет потоков torch.
+        Сегменты раздаются из общей очереди от самого длинного текста к короткому,
+        поэтому в конце не остается одного "хвостового" длинного сегмента.
+        
+        Returns:
+            Словарь {индекс сегмента: успех}
+        """
+        worker_script = Path(__file__).parent.absolute() / "tts_worker.py"
+        python_path = self._pool_python()
+        
+        env = os.environ.copy()
+        env["COQUI_TOS_AGREED"] = "1"
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            env[var] = str(threads_per_worker)
+        
+        def make_worker() -> TTSWorkerProcess:
+            return TTSWorkerProcess(
+                python_path=python_path,
+                worker_script=str(worker_script),
+                model_name=self.model_name,
+                log=self._log,
+                env=env,
+                extra_args=["--threads", str(threads_per_worker)]
+            )
+        
+        # Длинные тексты - первыми (жадная балансировка нагрузки)
+        work_queue = queue.Queue()
+        for job in sorted(jobs, key=lambda j: len(j["text"]), reverse=True):
+            work_queue.put(job)
+        
+        results = {}
+        state = {"done": 0, "stopped": False}
+        state_lock = threading.Lock()
+        start_time = time.time()
+        
+        def should_stop() -> bool:
+            if state["stopped"]:
+                return True
+            if self.should_stop_callback and self.should_stop_callback():
+                state["stopped"] = True
+            return state["stopped"]
+        
+        def run_worker(slot: int):
+            worker = make_worker()
+            try:
+                try:
+                    worker.start()
+                except Exception as e:
+                    self._log(f"❌ TTS процесс #{slot + 1} не запустился: {e}")
+                    return
+                
+                self._log(f"✅ TTS процесс #{slot + 1} готов (PID {worker.pid}, потоков: {threads_per_worker})")
+                
+                while not should_stop():
+                    try:
+                        job = work_queue.get_nowait()
+                    except queue.Empty:
+                        return
+                    
+                    i = job["index"]
+                    payload = {
+                        "cmd": "generate",
+                        "text": job["text"],
+                        "speaker_wav": job["speaker_wav"],
+                        "output_path": job["output_path"],
+                        "language": target_lang,
+                        "model_name": self.model_name,
+                        "latents_dir": str(self.latents_dir)
+                    }
+                    
+                    output = None
+                    for attempt in range(2):
+                        try:
+                            if not worker.is_alive():
+                                self._log(f"⚠️ TTS процесс #{slot + 1} упал, перезапуск...")
+                                worker.start()
+                            output = worker.request(payload, timeout=300)
+                            break
+                        except Exception as e:
+                            self._log(f"❌ TTS процесс #{slot + 1}: {e}")
+                            worker.stop()
+                    
+                    success = bool(output and output.get("success"))
+                    if output and not success:
+                        self._log(f"❌ [{i+1}/{total_segments}] Ошибка генерации для сегмента {i} ({job['speaker']}): {output.get('error', 'Unknown error')}")
+                    
+                    with state_lock:
+                        results[i] = success
+                        state["done"] += 1
+                        done = state["done"]
+                    
+                    elapsed = time.time() - start_time
+                    estimated_remaining = elapsed / done * (len(jobs) - done)
+                    self._log(
+                        f"🎤 [{done}/{len(jobs)}] сегмент {i} готов ({job['speaker']}, {len(job['text'])} символов, "
+                        f"процесс #{slot + 1}) | ⏱️ ~{estimated_remaining/60:.1f} мин осталось"
+                    )
+            finally:
+                worker.stop()
+        
+        self._log(f"🚀 Пул TTS: {workers_count} процессов × {threads_per_worker} потоков")
+        threads = [
+            threading.Thread(target=run_worker, args=(slot,), daemon=True)
+            for slot in range(workers_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if should_stop():
+            self._log("⏹️ Генерация дубляжа прервана пользователем")
+            raise InterruptedError("Processing stopped by user")
+        
+        # Сегменты, которые не достались ни одному процессу (все процессы упали)
+        for job in jobs:
+            if job["index"] not in results:
+                self._log(f"❌ [{job['index']+1}/{total_segments}] Сегмент {job['index']} не сгенерирован: нет работающих TTS процессов")
+                results[job["index"]] = False
+        
+        return results
+    
     def generate_dubbing(
         self,
         segments: List[Dict],
@@ -405,9 +910,6 @@ class VoiceCloner:
         }
         target_lang = lang_map.get(target_lang.upper(), target_lang.lower())
         
-        # Загружаем модель (ленивая загрузка)
-        self._load_model()
-        
         if not speaker_samples:
             self._log("⚠️ Нет референсных аудио для спикеров")
             return segments
@@ -418,23 +920,15 @@ class VoiceCloner:
         # Fallback: если для спикера нет референса, используем первый доступный
         fallback_sample = list(speaker_samples.values())[0] if speaker_samples else None
         
-        updated_segments = []
-        success_count = 0
+        # Подготовка: отбираем сегменты, которые нужно озвучить
+        jobs = []
         error_count = 0
-        start_time = time.time()
-        
         for i, seg in enumerate(segments):
-            # Проверяем флаг остановки в цикле
-            if self.should_stop_callback and self.should_stop_callback():
-                self._log("⏹️ Генерация дубляжа прервана пользователем")
-                raise InterruptedError("Processing stopped by user")
-            
             speaker = seg.get("speaker", "SPEAKER_UNKNOWN")
             text = seg.get("text", "").strip()
             
             if not text:
                 self._log(f"⚠️ [{i+1}/{total_segments}] Сегмент {i}: пустой текст, пропускаем")
-                updated_segments.append(seg)
                 continue
             
             # Определяем референсный файл для спикера
@@ -442,65 +936,86 @@ class VoiceCloner:
             
             if not speaker_wav or not os.path.exists(speaker_wav):
                 self._log(f"⚠️ [{i+1}/{total_segments}] Сегмент {i}: нет референса для {speaker}, пропускаем")
-                updated_segments.append(seg)
                 error_count += 1
                 continue
             
-            # Генерируем аудио
-            output_path = self.temp_tts_dir / f"segment_{i:04d}.wav"
+            jobs.append({
+                "index": i,
+                "speaker": speaker,
+                "text": text,
+                "speaker_wav": speaker_wav,
+                "output_path": str(self.temp_tts_dir / f"segment_{i:04d}.wav")
+            })
+        
+        start_time = time.time()
+        results = {}
+        
+        # Кэш: сегменты с теми же текстом, голосом, языком и моделью не синтезируем заново
+        cache_keys = {}
+        if self.tts_cache is not None and jobs:
+            pending_jobs = []
+            for job in jobs:
+                try:
+                    key = self.tts_cache.make_key(
+                        job["text"], job["speaker_wav"], target_lang, self.model_name, TTS_SYNTHESIS_PARAMS
+                    )
+                except OSError as e:
+                    self._log(f"⚠️ Кэш TTS недоступен для сегмента {job['index']}: {e}")
+                    pending_jobs.append(job)
+                    continue
+                
+                cache_keys[job["index"]] = key
+                if self.tts_cache.fetch(key, job["output_path"]):
+                    results[job["index"]] = True
+                else:
+                    pending_jobs.append(job)
+            
+            if len(pending_jobs) < len(jobs):
+                self._log(f"♻️ Из кэша TTS взято {len(jobs) - len(pending_jobs)}/{len(jobs)} сегментов, синтез: {len(pending_jobs)}")
+            jobs = pending_jobs
+        
+        if jobs:
+            workers_count, threads_per_worker = self._resolve_pool_size(len(jobs))
+            if workers_count > 1 and self._pool_python() is None:
+                self._log("ℹ️ Пул TTS процессов недоступен в этой сборке, генерация в одном процессе")
+                workers_count = 1
             
             try:
-                # Вычисляем прогресс
-                progress = ((i + 1) / total_segments) * 100
-                elapsed = time.time() - start_time
-                avg_time_per_segment = elapsed / (i + 1) if i > 0 else 0
-                remaining_segments = total_segments - (i + 1)
-                estimated_remaining = avg_time_per_segment * remaining_segments
-                
-                self._log(f"🎤 [{i+1}/{total_segments}] ({progress:.1f}%) {speaker} | {len(text)} символов | ⏱️ ~{estimated_remaining/60:.1f} мин осталось")
-                
-                # Генерация TTS
-                if self.use_venv_tts:
-                    # Используем venv_tts через subprocess
-                    success = self._generate_tts_via_venv(
-                        text=text,
-                        speaker_wav=speaker_wav,
-                        output_path=str(output_path),
-                        language=target_lang,
-                        segment_index=i,
-                        total_segments=total_segments
+                if workers_count > 1:
+                    synthesized = self._synthesize_with_pool(
+                        jobs, target_lang, total_segments, workers_count, threads_per_worker
                     )
-                    if not success:
-                        raise Exception("Ошибка генерации через venv_tts")
                 else:
-                    # Используем прямой вызов TTS API
-                    seg_start = time.time()
-                    self.model.tts_to_file(
-                        text=text,
-                        speaker_wav=speaker_wav,
-                        language=target_lang,
-                        file_path=str(output_path),
-                        split_sentences=False  # Важно! Мы сами разбиваем на предложения
-                    )
-                    seg_time = time.time() - seg_start
-                    self._log(f"   ⏱️ Время генерации: {seg_time:.1f}с")
-                
+                    synthesized = self._synthesize_sequential(jobs, target_lang, total_segments)
+            finally:
+                # Модель в воркере больше не нужна до следующего запуска - освобождаем память
+                self.shutdown_tts_worker()
+            
+            results.update(synthesized)
+            
+            if self.tts_cache is not None:
+                for job in jobs:
+                    if synthesized.get(job["index"]) and job["index"] in cache_keys:
+                        self.tts_cache.store(cache_keys[job["index"]], job["output_path"])
+        
+        if self.tts_cache is not None:
+            self.tts_cache.log_stats()
+        
+        # Сборка результата в исходном порядке сегментов
+        updated_segments = []
+        success_count = 0
+        for i, seg in enumerate(segments):
+            if results.get(i):
                 # Обновляем сегмент
                 seg_copy = seg.copy()
-                seg_copy["audio_file"] = str(output_path)
+                seg_copy["audio_file"] = str(self.temp_tts_dir / f"segment_{i:04d}.wav")
                 updated_segments.append(seg_copy)
-                
                 success_count += 1
-                
-            except InterruptedError:
-                self._log("⏹️ Генерация дубляжа прервана пользователем")
-                raise
-            except Exception as e:
-                self._log(f"❌ [{i+1}/{total_segments}] Ошибка генерации для сегмента {i} ({speaker}): {e}")
+            else:
                 # Добавляем сегмент без аудио, чтобы не потерять данные
                 updated_segments.append(seg)
-                error_count += 1
-                continue
+        
+        error_count += sum(1 for ok in results.values() if not ok)
         
         total_time = time.time() - start_time
         self._log(
@@ -518,76 +1033,8 @@ class VoiceCloner:
         """
         Объединяет все аудио сегменты в один финальный файл.
         
-        Args:
-            segments: Список сегментов с ключом "audio_file"
-            output_path: Путь для сохранения финального аудио
-            original_audio_path: Опционально - путь к исходному аудио (для синхронизации)
-            
-        Returns:
-            Путь к созданному файлу
-        """
-        self._log(f"🎬 Объединение {len(segments)} аудио сегментов...")
-        
-        if not segments:
-            raise ValueError("Нет сегментов для объединения")
-        
-        # Собираем все аудио файлы в правильном порядке
-        audio_segments = []
-        missing_files = []
-        
-        for i, seg in enumerate(segments):
-            audio_file = seg.get("audio_file")
-            if not audio_file or not os.path.exists(audio_file):
-                missing_files.append(i)
-                # Создаем тишину для пропущенных сегментов
-                start = float(seg.get("start", 0))
-                end = float(seg.get("end", start + 1.0))
-                duration_ms = int((end - start) * 1000)
-                silence = AudioSegment.silent(duration=duration_ms)
-                audio_segments.append(silence)
-                self._log(f"⚠️ Сегмент {i}: файл отсутствует, добавлена тишина ({duration_ms}ms)")
-            else:
-                try:
-                    audio = AudioSegment.from_file(audio_file)
-                    audio_segments.append(audio)
-                except Exception as e:
-                    self._log(f"⚠️ Ошибка загрузки сегмента {i}: {e}")
-                    # Добавляем тишину вместо ошибки
-                    start = float(seg.get("start", 0))
-                    end = float(seg.get("end", start + 1.0))
-                    duration_ms = int((end - start) * 1000)
-                    silence = AudioSegment.silent(duration=duration_ms)
-                    audio_segments.append(silence)
-        
-        if missing_files:
-            self._log(f"⚠️ Пропущено файлов: {len(missing_files)}")
-        
-        # Объединяем все сегменты
-        if not audio_segments:
-            raise ValueError("Нет аудио для объединения")
-        
-        self._log(f"🔗 Склейка {len(audio_segments)} сегментов...")
-        final_audio = sum(audio_segments)
-        
-        # Экспортируем финальный файл
-        output_path_obj = Path(output_path)
-        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
-        
-        final_audio.export(str(output_path), format="wav")
-        
-        duration_sec = len(final_audio) / 1000.0
-        self._log(f"✅ Финальное аудио создано: {output_path}")
-        self._log(f"   Длительность: {duration_sec:.1f} секунд")
-        
-        return str(output_path)
-    
-    def merge_audio_segments(
-        self,
-        segments: List[Dict],
-        output_path: str
-    ) -> str:
-        """
-        Объединяет все аудио сегменты в один финальный файл.
+        Сегменты склеиваются в одном буфере (AudioTimelineMixer) без
+        пересоздания аудио на каждом шаге.
         
         Args:
             segments: Список сегментов с ключом "audio_file"
@@ -602,52 +1049,39 @@ class VoiceCloner:
             raise ValueError("Нет сегментов для объединения")
         
         # Собираем все аудио файлы в правильном порядке
-        audio_segments = []
+        mixer = AudioTimelineMixer()
         missing_files = []
         
         for i, seg in enumerate(segments):
             audio_file = seg.get("audio_file")
+            start = float(seg.get("start", 0))
+            end = float(seg.get("end", start + 1.0))
+            
             if not audio_file or not os.path.exists(audio_file):
                 missing_files.append(i)
                 # Создаем тишину для пропущенных сегментов
-                start = float(seg.get("start", 0))
-                end = float(seg.get("end", start + 1.0))
-                duration_ms = int((end - start) * 1000)
-                silence = AudioSegment.silent(duration=duration_ms)
-                audio_segments.append(silence)
-                self._log(f"⚠️ Сегмент {i}: файл отсутствует, добавлена тишина ({duration_ms}ms)")
+                mixer.append_silence(end - start)
+                self._log(f"⚠️ Сегмент {i}: файл отсутствует, добавлена тишина ({int((end - start) * 1000)}ms)")
             else:
                 try:
-                    audio = AudioSegment.from_file(audio_file)
-                    audio_segments.append(audio)
+                    mixer.add_file(audio_file, mixer.duration_sec)
                 except Exception as e:
                     self._log(f"⚠️ Ошибка загрузки сегмента {i}: {e}")
                     # Добавляем тишину вместо ошибки
-                    start = float(seg.get("start", 0))
-                    end = float(seg.get("end", start + 1.0))
-                    duration_ms = int((end - start) * 1000)
-                    silence = AudioSegment.silent(duration=duration_ms)
-                    audio_segments.append(silence)
+                    mixer.append_silence(end - start)
         
         if missing_files:
             self._log(f"⚠️ Пропущено файлов: {len(missing_files)}")
         
-        # Объединяем все сегменты
-        if not audio_segments:
+        if mixer.length == 0:
             raise ValueError("Нет аудио для объединения")
         
-        self._log(f"🔗 Склейка {len(audio_segments)} сегментов...")
-        final_audio = sum(audio_segments)
-        
         # Экспортируем финальный файл
-        output_path_obj = Path(output_path)
-        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
-        
-        final_audio.export(str(output_path), format="wav")
+        self._log(f"🔗 Склейка {len(segments)} сегментов...")
+        mixer.write(output_path)
         
-        duration_sec = len(final_audio) / 1000.0
         self._log(f"✅ Финальное аудио создано: {output_path}")
-        self._log(f"   Длительность: {duration_sec:.1f} секунд")
+        self._log(f"   Длительность: {mixer.duration_sec:.1f} секунд")
         
         return str(output_path)
     
@@ -4,6 +4,7 @@ from core.transcriber import Transcriber
 # from core.diarization import Diarizer, merge_transcription_with_diarization # DELETED
 from core.translator import Translator
 from core.corrector import SpeakerCorrector
+from core.ollama_manager import OllamaManager
 from core.voice_cloner import VoiceCloner
 from core.video_maker import VideoMaker
 from core.config import APP_PATHS, open_folder 
@@ -473,6 +474,12 @@ def build_interface():
             ui.notify('Ошибка: Источник видео не определен!', color='negative')
             return
         
+        # Модель Ollama грузится в фоне, пока идут скачивание и транскрипция
+        provider = translate_provider_select.value if translate_provider_select else "api"
+        if provider == "ollama" or (correct_speakers_checkbox and correct_speakers_checkbox.value):
+            ollama_model = ollama_model_select.value if ollama_model_select and ollama_model_select.value else "qwen2.5:7b"
+            OllamaManager(progress_callback=smart_log).warm_in_background(ollama_model)
+        
         if video_source.value == 'YouTube':
             # Обработка YouTube
             url = link_input.value
@@ -896,7 +903,7 @@ def build_interface():
                 model=model,
                 use_fallback=use_fallback,
                 force_fallback=force_fallback,
-                batch_size=1
+                prefer_ollama=(provider == "ollama")
             )
             
             # Обновляем данные с переведенными сегментами
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Прогрев моделей и keep_alive для Ollama на локальном фейковом HTTP сервере.
+
+Запуск из корня репозитория:
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from core.ollama_manager import OllamaManager  # noqa: E402
+from core.translator import Translator  # noqa: E402
+from core.corrector import SpeakerCorrector  # noqa: E402
+
+MODEL = "qwen2.5:7b"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Отвечает как Ollama на /api/tags, /api/ps, /api/generate и /api/chat; запоминает тела запросов"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": MODEL}]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{
+                "name": MODEL,
+                "size": 5000,
+                "size_vram": 4000,
+                "expires_at": "2030-01-01T00:00:00Z",
+            }]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, payload))
+
+        if self.path == "/api/chat":
+            self._send_json({"message": {"role": "assistant", "content": "hola"}, "done": True})
+        elif self.path == "/api/generate" and payload.get("stream"):
+            # Потоковый ответ коррекции спикеров (NDJSON)
+            items = json.loads(payload["prompt"])
+            text = json.dumps({"segments": [{"id": item["id"], "speaker": "SPEAKER_00"} for item in items]})
+            lines = [
+                json.dumps({"response": text, "done": False}),
+                json.dumps({"response": "", "done": True, "done_reason": "stop"}),
+            ]
+            body = ("\n".join(lines) + "\n").encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/api/generate":
+            self._send_json({"response": "", "done": True})
+        else:
+            self.send_error(404)
+
+
+class OllamaKeepAliveTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        cls.server.requests = []
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests.clear()
+        self._keep_alive = os.environ.get("OLLAMA_KEEP_ALIVE")
+        os.environ["OLLAMA_KEEP_ALIVE"] = "45m"
+
+    def tearDown(self):
+        if self._keep_alive is None:
+            os.environ.pop("OLLAMA_KEEP_ALIVE", None)
+        else:
+            os.environ["OLLAMA_KEEP_ALIVE"] = self._keep_alive
+
+    def _payloads(self, path):
+        return [payload for request_path, payload in self.server.requests if request_path == path]
+
+    def test_warm_sends_keep_alive_from_env(self):
+        self.assertTrue(OllamaManager(ollama_url=self.url).warm(MODEL))
+        payloads = self._payloads("/api/generate")
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["model"], MODEL)
+        self.assertEqual(payloads[0]["prompt"], "")
+        self.assertEqual(payloads[0]["keep_alive"], "45m")
+
+    def test_warm_numeric_keep_alive(self):
+        os.environ["OLLAMA_KEEP_ALIVE"] = "-1"
+        self.assertTrue(OllamaManager(ollama_url=self.url).warm(MODEL))
+        self.assertEqual(self._payloads("/api/generate")[0]["keep_alive"], -1)
+
+    def test_running_models_parses_ps(self):
+        models = OllamaManager(ollama_url=self.url).running_models()
+        self.assertEqual(models, [{
+            "name": MODEL,
+            "size": 5000,
+            "size_vram": 4000,
+            "expires_at": "2030-01-01T00:00:00Z",
+        }])
+
+    def test_translator_payload_has_keep_alive(self):
+        translator = Translator(ollama_url=self.url, use_translation_memory=False)
+        self.assertEqual(translator._translate_with_ollama("hello", "en", "es", MODEL), "hola")
+        payloads = self._payloads("/api/chat")
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["keep_alive"], "45m")
+
+    def test_corrector_payload_has_keep_alive(self):
+        corrector = SpeakerCorrector(ollama_url=self.url, model=MODEL)
+        items = [{"id": 0, "speaker": "SPEAKER_01", "text": "hello"}]
+        received, truncated = corrector._stream_correction(items, "system", ["SPEAKER_00", "SPEAKER_01"])
+        self.assertEqual(received, {0: "SPEAKER_00"})
+        self.assertFalse(truncated)
+        payloads = self._payloads("/api/generate")
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["keep_alive"], "45m")
+
+
+if __name__ == "__main__":
+    unittest.main()